@@ -2,8 +2,13 @@ import dash
 from dash import Output, Input, State, html, dcc, no_update
 import plotly.graph_objects as go
 import plotly.express as px
-import aws_data_loader as dl
 import utils.constantes as constantes
+from utils.class_stats import stats_frame
+# Stockage des rasters choisi par la variable d'environnement STORAGE_BACKEND (s3 par défaut)
+if constantes.STORAGE_BACKEND == "local":
+    import data_loader as dl
+else:
+    import aws_data_loader as dl
 import numpy as np
 import pandas as pd
 import dash_bootstrap_components as dbc
@@ -58,6 +63,7 @@ def register_main_callback(app):
         ],
         prevent_initial_call=False
     )
+    @dl.foreground_request
     def update_dashboard(mode, forest, view_type, selected_year1_slider, selected_year2_dropdown,
                          selected_classes,
                          year2_opts_state,
@@ -127,6 +133,7 @@ def register_main_callback(app):
         image_path1 = dl.get_file_path(forest, selected_year1) # Chemin vers TIF dans data/
         raster_fig = create_empty_figure(f"Données non trouvées pour {selected_year1}") # Fig par défaut
         stats_df1 = pd.DataFrame()
+        class_ndvi_stats1 = None # Stats compactes par classe (NDVI moyen...), vue NDVI uniquement
         map_title = f"Erreur Chargement {selected_year1}"
 
         if image_path1:
@@ -138,11 +145,9 @@ def register_main_callback(app):
                     raster_fig = px.imshow(ndvi_matrix, color_continuous_scale='RdYlGn', aspect='equal')
                     raster_fig.update_layout(coloraxis_colorbar_title_text='NDVI', margin=dict(l=0, r=0, t=30, b=0))
                     map_title = f"Vue NDVI - {forest} ({selected_year1})"
-                    # Calculer stats pour NDVI
-                    ndvi_class_map = dl.classify_ndvi(ndvi_matrix)
-                    if ndvi_class_map is not None:
-                        stats_df1 = dl.calcul_class_stats(ndvi_class_map)
-                        if not stats_df1.empty: stats_df1['Year'] = selected_year1
+                    # Stats NDVI : base de stats précalculées si à jour, sinon effectifs de la carte de classes compacte en cache
+                    stats_df1 = dl.get_year_stats(forest, selected_year1)
+                    class_ndvi_stats1 = dl.calcul_class_ndvi_stats(image_path1)
                 else: map_title = f"Erreur Calcul NDVI - {selected_year1}"
 
             elif view_type == 'rgb':
@@ -194,7 +199,11 @@ def register_main_callback(app):
             if not stats_df1.empty: # Seulement si stats NDVI ont été calculées
                  fig_bar = go.Figure(go.Bar(x=stats_df1['Classe Label'], y=stats_df1['Surface (ha)'], marker_color=[constantes.NDVI_CLASSES.get(idx, {"color": "#cccccc"})['color'] for idx in stats_df1['Classe Index']], text=stats_df1['% Couverture'].apply(lambda x: f'{x:.1f}%'), textposition='outside'))
                  fig_bar.update_layout(yaxis_title="Surface (ha)", margin=dict(t=20, b=10, l=10, r=10), height=300)
-                 stats_table_component = create_stats_table(stats_df1[['Classe Label', 'Surface (ha)', '% Couverture']], f"Statistiques {selected_year1}")
+                 table_df1 = stats_df1[['Classe Index', 'Classe Label', 'Surface (ha)', '% Couverture']]
+                 if class_ndvi_stats1 is not None: # NDVI moyen par classe, converti ici depuis les tableaux compacts
+                     ndvi_df1 = stats_frame(class_ndvi_stats1, with_ndvi=True)
+                     if not ndvi_df1.empty: table_df1 = table_df1.merge(ndvi_df1[['Classe Index', 'NDVI Moyen']], on='Classe Index', how='left')
+                 stats_table_component = create_stats_table(table_df1.drop(columns='Classe Index'), f"Statistiques {selected_year1}")
                  combined_stats_chart_content = html.Div([dcc.Graph(figure=fig_bar), html.Hr(), stats_table_component])
             elif view_type == 'rgb': # Si vue RGB, pas de stats/graph NDVI
                  combined_stats_chart_content = html.P("Statistiques NDVI non disponibles en vue RGB.", className="text-center fst-italic")
@@ -232,12 +241,7 @@ def register_main_callback(app):
                  # Pour simplifier, on calcule toujours les stats NDVI pour la comparaison, même si la vue est RGB
                  # On accepte ce probleme en attendant de trouver une solution
                  print(f"TIF Source trouvé: {image_path2}. Calcul des stats NDVI pour comparaison...")
-                 ndvi_matrix2, _ = dl.calcul_ndvi(image_path2)
-                 if ndvi_matrix2 is not None:
-                     ndvi_class_map2 = dl.classify_ndvi(ndvi_matrix2)
-                     if ndvi_class_map2 is not None:
-                         stats_df2 = dl.calcul_class_stats(ndvi_class_map2)
-                         if not stats_df2.empty: stats_df2['Year'] = selected_year2
+                 stats_df2 = dl.get_year_stats(forest, selected_year2)
             else: print(f"Fichier TIF source non trouvé pour {selected_year2} dans data/")
 
             # Gérer erreur chargement/calcul stats année 2
@@ -280,7 +284,10 @@ def register_main_callback(app):
                      tertiary_content = dbc.ListGroup(items, flush=True)
                  else: tertiary_content = html.P("Calcul des différences impossible.")
 
-        # --- 6. Retour des Outputs ---
+        # --- 6. Préchargement en arrière-plan (années voisines, comparaison, forêt suivante) ---
+        dl.prefetch_after_request(forest, selected_year1, view_type, mode)
+
+        # --- 7. Retour des Outputs ---
         year2_outputs_final = (year2_selector_style_calc, current_year2_opts, current_year2_value)
 
         # Retourner toutes les valeurs dans le bon ordre 17 items
@@ -7,6 +7,9 @@ from rasterio import features
 import geopandas as gpd
 from shapely.geometry import shape
 import utils.constantes as constantes
+from utils.bands import band_layout
+from utils.validity import read_masked_ndvi
+from utils.ndvi_kernel import classify
 import argparse
 import time
 from tqdm import tqdm
@@ -45,18 +48,11 @@ def calcul_ndvi(image_path):
     """Calcule la matrice NDVI à partir d'un fichier TIF."""
     try:
         with rasterio.open(image_path) as src:
-            if src.count < 4:
+            # Bande NDVI lue directement si elle existe, sinon calcul à partir
+            # des bandes Rouge et NIR repérées par leurs descriptions ; NaN hors du polygone
+            if not band_layout(src)["ndvi"] and src.count < 4:
                 raise ValueError(f"Le fichier {image_path} a moins de 4 bandes")
-            
-            # Lire les bandes Rouge (index 3) et NIR (index 4)
-            red_band = src.read(3).astype(np.float32)
-            nir_band = src.read(4).astype(np.float32)
-
-            # Masquage pour éviter la division par zéro
-            np.seterr(divide='ignore', invalid='ignore')
-            denominator = nir_band + red_band
-            ndvi = np.where(denominator == 0, 0, (nir_band - red_band) / denominator)
-            ndvi = np.clip(ndvi, constantes.NDVI_MIN, constantes.NDVI_MAX)
+            ndvi = read_masked_ndvi(src)
 
             return ndvi, src
     except rasterio.RasterioIOError as e:
@@ -70,23 +66,10 @@ def calcul_ndvi(image_path):
         return None, None
 
 def classify_ndvi(ndvi_matrix):
-    """Classifie la matrice NDVI selon les seuils définis dans constantes."""
+    """Classifie la matrice NDVI selon les seuils définis dans constantes (une passe, utils/ndvi_kernel.py)."""
     if ndvi_matrix is None:
         return None
-        
-    ndvi_class_map = np.zeros_like(ndvi_matrix, dtype=np.uint8)
-
-    for class_index, details in constantes.NDVI_CLASSES.items():
-        lower_bound, upper_bound = details["range"]
-        # Appliquer un masque pour assigner l'index de la classe
-        if class_index == min(constantes.NDVI_CLASSES.keys()):
-            mask = (ndvi_matrix >= lower_bound) & (ndvi_matrix <= upper_bound)
-        else:
-            mask = (ndvi_matrix > lower_bound) & (ndvi_matrix <= upper_bound)
-
-        ndvi_class_map[mask] = class_index
-
-    return ndvi_class_map
+    return classify(ndvi_matrix)
 
 def create_geojson_from_classified_ndvi(ndvi_class_map, src, output_path):
     """
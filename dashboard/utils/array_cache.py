@@ -0,0 +1,107 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def _nbytes(value):
+    """ Octets occupés par les tableaux numpy contenus dans une valeur (tableau, tuple, liste ou dict). """
+    if isinstance(value, np.memmap):
+        # Pages du cache système partagées entre workers, pas de la mémoire privée du processus
+        return 0
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(item) for item in value)
+    if isinstance(value, dict):
+        return sum(_nbytes(item) for item in value.values())
+    return 0
+
+
+def _freeze(value):
+    """ Passe les tableaux en lecture seule : une valeur partagée par le cache ne doit pas être modifiée. """
+    if isinstance(value, np.ndarray):
+        value.setflags(write=False)
+    elif isinstance(value, (tuple, list)):
+        for item in value:
+            _freeze(item)
+    return value
+
+
+class ArrayCache:
+    """
+    Cache LRU en mémoire de tableaux décodés (bandes, NDVI, cartes de classes...), borné par un budget en octets.
+    Les clés sont libres ; le loader utilise (clé S3, ETag, type, niveau de résolution).
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """ Retourne la valeur en cache (marquée comme récemment utilisée) ou None. """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def contains(self, key):
+        """ Indique si une clé est en cache, sans modifier l'ordre LRU ni les compteurs. """
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key, value):
+        """ Ajoute une valeur (ses tableaux passent en lecture seule) et évince les plus anciennes au-delà du budget. """
+        size = _nbytes(value)
+        _freeze(value)
+        if size > self.max_bytes:
+            return value
+        with self._lock:
+            if key in self._entries:
+                self.bytes_used -= self._sizes[key]
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._sizes[key] = size
+            self.bytes_used += size
+            while self.bytes_used > self.max_bytes:
+                old_key, _ = self._entries.popitem(last=False)
+                self.bytes_used -= self._sizes.pop(old_key)
+                self.evictions += 1
+        return value
+
+    def get_or_compute(self, key, compute):
+        """ Retourne la valeur en cache, ou la calcule avec compute() et la met en cache (sauf si le calcul échoue). """
+        value = self.get(key)
+        if value is not None:
+            return value
+        value = compute()
+        if value is None or (isinstance(value, tuple) and value and value[0] is None):
+            return value
+        return self.put(key, value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self.bytes_used = 0
+
+    def stats(self):
+        """ Compteurs du cache (hits, misses, evictions) et occupation mémoire. """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes_used": self.bytes_used,
+                "max_bytes": self.max_bytes,
+            }
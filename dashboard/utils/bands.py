@@ -0,0 +1,128 @@
+import re
+import numpy as np
+import utils.constantes as constantes
+from utils.scaled_raster import read_bands, scaled_int16_band, shares_linear_scale, QUANTITY_TAG
+from utils.ndvi_kernel import ndvi_into, ndvi_classes_into, classify_into, scaled_ndvi_tables, lookup_into
+
+# Reconnaissance des bandes d'après leur description (ex: "Rouge (B4) - normalisé", "Proche Infrarouge (B8)", "NDVI")
+BAND_PATTERNS = {
+    "ndvi": re.compile(r"\bndvi\b", re.IGNORECASE),
+    "nir": re.compile(r"\b(nir|infrarouge|b8)\b", re.IGNORECASE),
+    "red": re.compile(r"\b(rouge|red|b4)\b", re.IGNORECASE),
+    "green": re.compile(r"\b(vert|green|b3)\b", re.IGNORECASE),
+    "blue": re.compile(r"\b(bleu|blue|b2)\b", re.IGNORECASE),
+}
+# Bandes des TIFs sans descriptions : indices historiquement lus par le dashboard
+LEGACY_BAND_INDEXES = {"red": 3, "nir": 4, "rgb": (1, 2, 3)}
+
+
+def band_index(src, name):
+    """
+    Indice (1..count) de la bande "ndvi", "nir", "red", "green" ou "blue" d'un raster ouvert,
+    d'après les descriptions des bandes (ou le tag QUANTITY pour le NDVI). None si elle n'est pas décrite.
+    """
+    pattern = BAND_PATTERNS[name]
+    for band_idx, description in enumerate(src.descriptions, start=1):
+        if description and pattern.search(description):
+            # "Proche Infrarouge (B8)" contient aussi "rouge" : une bande reconnue comme NIR n'est pas le rouge
+            if name != "nir" and BAND_PATTERNS["nir"].search(description):
+                continue
+            return band_idx
+    if name == "ndvi":
+        for band_idx in range(1, src.count + 1):
+            if src.tags(band_idx).get(QUANTITY_TAG) == "ndvi":
+                return band_idx
+    return None
+
+
+def band_layout(src):
+    """
+    Indices des bandes utiles d'un raster ouvert : {"ndvi": int ou None, "red", "nir", "rgb": (r, g, b)}.
+    Les bandes non décrites reprennent les indices historiques (LEGACY_BAND_INDEXES).
+    """
+    red, green, blue = (band_index(src, name) for name in ("red", "green", "blue"))
+    rgb = (red, green, blue) if None not in (red, green, blue) else LEGACY_BAND_INDEXES["rgb"]
+    return {
+        "ndvi": band_index(src, "ndvi"),
+        "red": red or LEGACY_BAND_INDEXES["red"],
+        "nir": band_index(src, "nir") or LEGACY_BAND_INDEXES["nir"],
+        "rgb": rgb,
+    }
+
+
+def _read_shape(src, kwargs):
+    """ (lignes, colonnes) lues par src.read avec ces kwargs (out_shape, window rasterio.windows.Window). """
+    if kwargs.get("out_shape") is not None:
+        return tuple(kwargs["out_shape"][-2:])
+    window = kwargs.get("window")
+    if window is not None:
+        return int(window.height), int(window.width)
+    return src.height, src.width
+
+
+def read_red_nir(src, layout, kwargs):
+    """ Bandes Rouge et NIR lues dans un seul tampon float32 (2, lignes, colonnes) préalloué. """
+    indexes = [layout["red"], layout["nir"]]
+    if max(indexes) > src.count:
+        raise ValueError(f"Bandes Rouge/NIR ({indexes[0]}, {indexes[1]}) absentes d'un raster à {src.count} bandes")
+    # En profil int16 mis à l'échelle, le rapport se calcule sur les valeurs brutes
+    # quand les deux bandes partagent la même échelle
+    bands = np.empty((2,) + _read_shape(src, kwargs), dtype=np.float32)
+    return read_bands(src, indexes, unscale=not shares_linear_scale(src, indexes), out=bands, **kwargs)
+
+
+def read_scaled_ndvi_band(src, layout, kwargs):
+    """
+    Bande NDVI brute (int16) et ses tables (scaled_ndvi_tables) si elle est au profil compact, (None, None) sinon.
+    NDVI et classes s'en déduisent par indexation (lookup_into), sans conversion flottante de la bande.
+    """
+    scaled = scaled_int16_band(src, layout["ndvi"])
+    if scaled is None:
+        return None, None
+    return src.read(layout["ndvi"], **kwargs), scaled_ndvi_tables(*scaled)
+
+
+def read_ndvi(src, layout=None, **kwargs):
+    """
+    Matrice NDVI (float32, bornée à [NDVI_MIN, NDVI_MAX]) d'un raster ouvert : lecture directe de la
+    bande NDVI quand elle existe, sinon calcul (NIR - Rouge) / (NIR + Rouge) avec 0 là où la somme est nulle.
+    kwargs est transmis à la lecture (window, out_shape...).
+    """
+    layout = layout or band_layout(src)
+    if layout["ndvi"]:
+        raw, tables = read_scaled_ndvi_band(src, layout, kwargs)
+        if raw is not None:
+            return lookup_into(raw, tables[0], np.empty(raw.shape, dtype=np.float32))
+        ndvi = read_bands(src, [layout["ndvi"]], **kwargs)[0]
+        return np.clip(ndvi, constantes.NDVI_MIN, constantes.NDVI_MAX, out=ndvi)
+
+    red_band, nir_band = read_red_nir(src, layout, kwargs)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return ndvi_into(red_band, nir_band, np.empty(red_band.shape, dtype=np.float32))
+
+
+def read_ndvi_classes(src, layout=None, valid_mask=None, **kwargs):
+    """
+    NDVI (comme read_ndvi, NaN hors de valid_mask) et carte des classes NDVI (uint8, 0 hors de valid_mask)
+    d'un raster ouvert, calculés en une passe par le noyau fusionné (utils/ndvi_kernel.py).
+    Bande NDVI au profil compact : classes lues sur les entiers stockés (read_scaled_ndvi_band).
+    """
+    layout = layout or band_layout(src)
+    if layout["ndvi"]:
+        raw, tables = read_scaled_ndvi_band(src, layout, kwargs)
+        if raw is not None:
+            ndvi = lookup_into(raw, tables[0], np.empty(raw.shape, dtype=np.float32))
+            classes = lookup_into(raw, tables[1], np.empty(raw.shape, dtype=np.uint8))
+            if valid_mask is not None:
+                ndvi[~valid_mask] = np.nan
+                classes[~valid_mask] = 0
+            return ndvi, classes
+        ndvi = read_ndvi(src, layout, **kwargs)
+        if valid_mask is not None:
+            ndvi[~valid_mask] = np.nan
+        return ndvi, classify_into(ndvi, np.empty(ndvi.shape, dtype=np.uint8))
+
+    red_band, nir_band = read_red_nir(src, layout, kwargs)
+    ndvi = np.empty(red_band.shape, dtype=np.float32)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return ndvi_classes_into(red_band, nir_band, ndvi, np.empty(ndvi.shape, dtype=np.uint8), valid_mask)
@@ -0,0 +1,125 @@
+import numpy as np
+
+# Représentations compactes des cartes de classes NDVI (uint8, classes 0 = hors forêt à 5)
+CODEC_RLE = "rle"            # runs (classe, longueur) ligne par ligne
+CODEC_BITPACK3 = "bitpack3"  # 3 bits par pixel (8 pixels dans 3 octets)
+CODEC_AUTO = "auto"          # le plus petit des deux pour chaque carte
+BITS_PER_CLASS = 3
+
+
+def _rle_runs(class_map):
+    """ Débuts, classes et longueurs des runs ; un run ne déborde jamais sur la ligne suivante. """
+    height, width = class_map.shape
+    flat = np.ascontiguousarray(class_map, dtype=np.uint8).ravel()
+    change = np.empty(flat.size, dtype=bool)
+    change[:1] = True
+    np.not_equal(flat[1:], flat[:-1], out=change[1:])
+    change[::width] = True
+    starts = np.flatnonzero(change)
+    lengths = np.diff(np.append(starts, flat.size))
+    return starts, flat[starts], lengths
+
+
+def _length_dtype(width):
+    return np.uint16 if width <= np.iinfo(np.uint16).max else np.uint32
+
+
+def rle_nbytes(class_map):
+    """ Taille (octets) de la carte encodée en RLE, sans l'encoder. """
+    height, width = class_map.shape
+    flat = np.ascontiguousarray(class_map, dtype=np.uint8).ravel()
+    runs = int(np.count_nonzero(flat[1:] != flat[:-1])) + 1 if flat.size else 0
+    # Débuts de ligne non comptés par les changements de classe
+    runs += int(np.count_nonzero(flat[width::width] == flat[width - 1:-1:width])) if height > 1 else 0
+    return 4 * (height + 1) + runs * (1 + np.dtype(_length_dtype(width)).itemsize)
+
+
+def bitpack_nbytes(class_map):
+    """ Taille (octets) de la carte encodée sur 3 bits par pixel. """
+    return -(-class_map.size * BITS_PER_CLASS // 8)
+
+
+def encode_class_map(class_map, codec=CODEC_AUTO):
+    """
+    Encode une carte de classes (lignes, colonnes) en un tampon uint8 et ses métadonnées (dict JSON) :
+    codec, hauteur, largeur et, pour le RLE, nombre de runs et type des longueurs.
+    Tampon RLE : [index du premier run de chaque ligne (int32, hauteur + 1)][longueurs][classes (uint8)].
+    """
+    height, width = class_map.shape
+    if codec == CODEC_AUTO:
+        codec = CODEC_RLE if rle_nbytes(class_map) <= bitpack_nbytes(class_map) else CODEC_BITPACK3
+    metadata = {"codec": codec, "height": int(height), "width": int(width)}
+
+    if codec == CODEC_RLE:
+        starts, values, lengths = _rle_runs(class_map)
+        length_dtype = _length_dtype(width)
+        row_runs = np.searchsorted(starts, np.arange(height + 1) * width).astype(np.int32)
+        buffer = np.concatenate([
+            row_runs.view(np.uint8),
+            lengths.astype(length_dtype).view(np.uint8),
+            values.astype(np.uint8),
+        ])
+        metadata.update({"runs": int(values.size), "length_dtype": np.dtype(length_dtype).name})
+        return buffer, metadata
+
+    if codec == CODEC_BITPACK3:
+        if class_map.size and int(class_map.max()) >= 2 ** BITS_PER_CLASS:
+            raise ValueError(f"Classe {int(class_map.max())} non codable sur {BITS_PER_CLASS} bits")
+        flat = np.ascontiguousarray(class_map, dtype=np.uint8).reshape(-1, 1)
+        bits = np.unpackbits(flat, axis=1)[:, 8 - BITS_PER_CLASS:]
+        # Pas de runs à parcourir : les effectifs par classe sont gardés dans les métadonnées
+        metadata["counts"] = np.bincount(flat.ravel(), minlength=2 ** BITS_PER_CLASS).tolist()
+        return np.packbits(bits.ravel()), metadata
+
+    raise ValueError(f"Codec de carte de classes inconnu: {codec}")
+
+
+def _rle_parts(buffer, metadata):
+    """ Vues (sans copie) sur les index de lignes, longueurs et classes d'un tampon RLE. """
+    height, runs = metadata["height"], metadata["runs"]
+    length_dtype = np.dtype(metadata["length_dtype"])
+    rows_end = 4 * (height + 1)
+    lengths_end = rows_end + runs * length_dtype.itemsize
+    row_runs = buffer[:rows_end].view(np.int32)
+    lengths = buffer[rows_end:lengths_end].view(length_dtype)
+    values = buffer[lengths_end:lengths_end + runs]
+    return row_runs, lengths, values
+
+
+def decode_class_map(buffer, metadata):
+    """ Carte de classes uint8 (lignes, colonnes) à partir de son encodage. """
+    height, width = metadata["height"], metadata["width"]
+    if metadata["codec"] == CODEC_RLE:
+        _, lengths, values = _rle_parts(buffer, metadata)
+        return np.repeat(values, lengths).reshape(height, width)
+    if metadata["codec"] == CODEC_BITPACK3:
+        size = height * width
+        bits = np.unpackbits(buffer, count=size * BITS_PER_CLASS).reshape(size, BITS_PER_CLASS)
+        weights = (1 << np.arange(BITS_PER_CLASS - 1, -1, -1)).astype(np.uint8)
+        return (bits @ weights).astype(np.uint8).reshape(height, width)
+    raise ValueError(f"Codec de carte de classes inconnu: {metadata['codec']}")
+
+
+def decode_rows(buffer, metadata, row_start, row_stop):
+    """ Lignes [row_start, row_stop[ d'une carte de classes ; en RLE seuls les runs de ces lignes sont décodés. """
+    if metadata["codec"] != CODEC_RLE:
+        return decode_class_map(buffer, metadata)[row_start:row_stop]
+    row_runs, lengths, values = _rle_parts(buffer, metadata)
+    first, last = row_runs[row_start], row_runs[row_stop]
+    rows = np.repeat(values[first:last], lengths[first:last])
+    return rows.reshape(row_stop - row_start, metadata["width"])
+
+
+def class_counts(buffer, metadata, minlength=0):
+    """
+    Nombre de pixels par classe (tableau indexé par la classe), sans décoder la carte :
+    en RLE à partir des runs (somme des longueurs par classe), en 3 bits d'après les métadonnées.
+    """
+    if metadata["codec"] == CODEC_RLE:
+        _, lengths, values = _rle_parts(buffer, metadata)
+        counts = np.bincount(values, weights=lengths, minlength=minlength)
+        return counts.astype(np.int64)
+    if "counts" in metadata:
+        counts = np.array(metadata["counts"], dtype=np.int64)
+        return np.pad(counts, (0, max(0, minlength - counts.size)))
+    return np.bincount(decode_class_map(buffer, metadata).ravel(), minlength=minlength).astype(np.int64)
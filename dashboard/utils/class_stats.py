@@ -0,0 +1,196 @@
+import numpy as np
+import pandas as pd
+import utils.constantes as constantes
+from utils.compute_backend import get_backend
+
+# Statistiques par classe sous forme compacte : tableau float64 (champs, classes), la colonne i étant la classe i.
+# Les sommes permettent de fusionner des statistiques partielles (blocs, années...) sans relire les pixels.
+STATS_FIELDS = ("count", "ndvi_sum", "ndvi_sumsq", "ndvi_min", "ndvi_max")
+COUNT, NDVI_SUM, NDVI_SUMSQ, NDVI_MIN, NDVI_MAX = range(len(STATS_FIELDS))
+# Pixels traités par morceau, arrondis à des lignes entières (tri par classe et poids float64 de bincount restent petits)
+STATS_CHUNK_PIXELS = 1 << 16
+# Colonnes NDVI ajoutées par stats_frame(with_ndvi=True)
+NDVI_COLUMNS = {"ndvi_mean": "NDVI Moyen", "ndvi_std": "NDVI Écart-type", "ndvi_min": "NDVI Min", "ndvi_max": "NDVI Max"}
+
+
+def n_classes():
+    """ Nombre de colonnes des statistiques compactes : classes 0 (hors classes) à max(NDVI_CLASSES). """
+    return max(constantes.NDVI_CLASSES) + 1
+
+
+def empty_stats(size=None):
+    """ Statistiques compactes vides (effectifs et sommes à 0, min/max à +inf / -inf). """
+    stats = np.zeros((len(STATS_FIELDS), size or n_classes()), dtype=np.float64)
+    stats[NDVI_MIN] = np.inf
+    stats[NDVI_MAX] = -np.inf
+    return stats
+
+
+def _accumulate_chunk(stats, classes, values):
+    """ Ajoute un morceau (classes, NDVI float64 ou None) aux statistiques compactes (backend de calcul actif). """
+    size = stats.shape[1]
+    if values is None:
+        stats[COUNT] += np.bincount(classes, minlength=size)
+        return
+    counts, sums, sumsq, mins, maxs = get_backend().class_sums(classes, values, size)
+    stats[COUNT] += counts
+    stats[NDVI_SUM] += sums
+    stats[NDVI_SUMSQ] += sumsq
+    np.fmin(stats[NDVI_MIN], mins, out=stats[NDVI_MIN])
+    np.fmax(stats[NDVI_MAX], maxs, out=stats[NDVI_MAX])
+
+
+def chunk_rows(width):
+    """ Lignes par morceau pour une image de cette largeur (morceaux de lignes entières, ~STATS_CHUNK_PIXELS pixels). """
+    return max(1, STATS_CHUNK_PIXELS // max(1, width))
+
+
+def _as_rows(array):
+    """ Vue 2D (lignes, colonnes) d'une carte : une carte 1D est une seule ligne. """
+    return array if array.ndim == 2 else array.reshape(1, -1)
+
+
+def chunk_partials(class_map, ndvi=None):
+    """
+    Statistiques partielles de chaque morceau de lignes d'un bloc (dans l'ordre), à fusionner dans l'ordre avec
+    merge_class_stats : si le bloc commence à une frontière de morceau (ligne multiple de chunk_rows), le résultat
+    est identique à accumulate_class_stats sur l'image entière. Permet de répartir les blocs entre threads.
+    """
+    classes, values = _as_rows(class_map), None if ndvi is None else _as_rows(ndvi)
+    step = chunk_rows(classes.shape[1])
+    partials = []
+    for row in range(0, classes.shape[0], step):
+        partial = empty_stats()
+        _accumulate_chunk(partial, classes[row:row + step].reshape(-1),
+                          None if values is None else values[row:row + step].reshape(-1).astype(np.float64))
+        partials.append(partial)
+    return partials
+
+
+class ClassStatsAccumulator:
+    """
+    Statistiques compactes alimentées par blocs de lignes successifs (ex: fenêtres d'un raster).
+    Les morceaux de chunk_rows lignes sont découpés comme sur l'image entière, quel que soit le découpage
+    en blocs : les sommes sont identiques à celles d'accumulate_class_stats.
+    """
+
+    def __init__(self, with_ndvi=True, stats=None):
+        self.stats = empty_stats() if stats is None else stats
+        self.with_ndvi = with_ndvi
+        self._classes = []
+        self._values = []
+        self._pending = 0
+
+    def add(self, class_map, ndvi=None):
+        """ Ajoute les lignes suivantes d'une carte de classes et, si with_ndvi, de son NDVI. """
+        classes = _as_rows(class_map)
+        values = _as_rows(ndvi) if self.with_ndvi else None
+        step = chunk_rows(classes.shape[1])
+        start = 0
+        if self._pending:
+            # Compléter le morceau en attente avec les premières lignes du bloc
+            start = min(step - self._pending, classes.shape[0])
+            self._store(classes[:start], None if values is None else values[:start])
+            if self._pending < step:
+                return self
+            self._flush()
+        while classes.shape[0] - start >= step:
+            stop = start + step
+            _accumulate_chunk(self.stats, classes[start:stop].reshape(-1),
+                              None if values is None else values[start:stop].reshape(-1).astype(np.float64))
+            start = stop
+        if start < classes.shape[0]:
+            self._store(classes[start:], None if values is None else values[start:])
+        return self
+
+    def _store(self, classes, values):
+        # Copies : le bloc de l'appelant peut être réutilisé (tampon de fenêtre)
+        self._classes.append(classes.copy())
+        if values is not None:
+            self._values.append(values.astype(np.float64))
+        self._pending += classes.shape[0]
+
+    def _flush(self):
+        if self._pending:
+            values = np.concatenate(self._values).reshape(-1) if self.with_ndvi else None
+            _accumulate_chunk(self.stats, np.concatenate(self._classes).reshape(-1), values)
+            self._classes, self._values, self._pending = [], [], 0
+
+    def finish(self):
+        """ Traite le dernier morceau incomplet et retourne les statistiques compactes. """
+        self._flush()
+        return self.stats
+
+
+def accumulate_class_stats(class_map, ndvi=None, stats=None):
+    """
+    Ajoute à stats (créées si None) les effectifs par classe d'une carte de classes et, avec ndvi, les sommes,
+    sommes des carrés, min et max du NDVI par classe. Une seule passe par morceaux : np.bincount (pondéré
+    par le NDVI) pour les effectifs et les sommes, tri par classe (linéaire pour des uint8) pour les extrema.
+    """
+    return ClassStatsAccumulator(with_ndvi=ndvi is not None, stats=stats).add(class_map, ndvi).finish()
+
+
+def merge_class_stats(stats, other):
+    """ Fusionne other dans stats (ex: statistiques de deux blocs d'une même image) et retourne stats. """
+    stats[[COUNT, NDVI_SUM, NDVI_SUMSQ]] += other[[COUNT, NDVI_SUM, NDVI_SUMSQ]]
+    np.fmin(stats[NDVI_MIN], other[NDVI_MIN], out=stats[NDVI_MIN])
+    np.fmax(stats[NDVI_MAX], other[NDVI_MAX], out=stats[NDVI_MAX])
+    return stats
+
+
+def stats_from_counts(dict_class_pixel_count):
+    """ Statistiques compactes (sans NDVI) à partir des effectifs {classe: nombre de pixels}. """
+    stats = empty_stats()
+    for class_index, count in dict_class_pixel_count.items():
+        if 0 <= class_index < stats.shape[1]:
+            stats[COUNT, class_index] = count
+    return stats
+
+
+def class_summary(stats):
+    """
+    Tableaux par classe (indexés par classe) : pixel_count, surface_ha, percent (part des pixels classés),
+    ndvi_mean, ndvi_std, ndvi_min, ndvi_max (NaN pour une classe vide ou sans NDVI).
+    """
+    counts = stats[COUNT].astype(np.int64)
+    classified = np.zeros(len(counts), dtype=bool)
+    classified[[index for index in constantes.NDVI_CLASSES if index < len(counts)]] = True
+    valid_pixels = counts[classified].sum()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = stats[NDVI_SUM] / stats[COUNT]
+        variance = np.maximum(stats[NDVI_SUMSQ] / stats[COUNT] - mean * mean, 0)
+        percent = counts / valid_pixels * 100 if valid_pixels else np.zeros(len(counts))
+    empty = counts == 0
+    return {
+        "pixel_count": counts,
+        "surface_ha": counts * constantes.PIXEL_SURFACE_M2 / 10000,
+        "percent": np.where(classified, percent, 0),
+        "ndvi_mean": np.where(empty, np.nan, mean),
+        "ndvi_std": np.where(empty, np.nan, np.sqrt(variance)),
+        "ndvi_min": np.where(empty | np.isinf(stats[NDVI_MIN]), np.nan, stats[NDVI_MIN]),
+        "ndvi_max": np.where(empty | np.isinf(stats[NDVI_MAX]), np.nan, stats[NDVI_MAX]),
+    }
+
+
+def stats_frame(stats, with_ndvi=False):
+    """
+    DataFrame du dashboard (Classe Index, Classe Label, Pixel Count, Surface (ha), % Couverture ; avec with_ndvi,
+    les colonnes NDVI_COLUMNS) à partir des statistiques compactes. Vide s'il n'y a aucun pixel classé.
+    """
+    summary = class_summary(stats)
+    indexes = list(constantes.NDVI_CLASSES)
+    if summary["pixel_count"][indexes].sum() == 0:
+        print("Avertissement : Aucun pixel valide trouvé dans ndvi_class_map pour le calcul des stats.")
+        return pd.DataFrame()
+    stats_df = pd.DataFrame({
+        "Classe Index": indexes,
+        "Classe Label": [details["label"] for details in constantes.NDVI_CLASSES.values()],
+        "Pixel Count": summary["pixel_count"][indexes],
+        "Surface (ha)": np.round(summary["surface_ha"][indexes], 2),
+        "% Couverture": np.round(summary["percent"][indexes], 2),
+    })
+    if with_ndvi:
+        for field, column in NDVI_COLUMNS.items():
+            stats_df[column] = np.round(summary[field][indexes], 4)
+    return stats_df
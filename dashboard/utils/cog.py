@@ -0,0 +1,246 @@
+import os
+import time
+import tempfile
+import numpy as np
+import rasterio
+import rasterio.shutil
+from rasterio.enums import Resampling
+from rasterio.windows import Window
+import utils.constantes as constantes
+from utils.ranged_reader import local_range_opener
+
+# Tailles de tuiles internes acceptées (pixels)
+COG_BLOCK_SIZES = (256, 512)
+# Codecs proposés au benchmark : LZW par bandes de lignes = format historique des TIFs du projet
+BENCHMARK_CODECS = ("LZW-STRIPS", "DEFLATE", "ZSTD")
+
+
+def _predictor(dtype):
+    """ Prédicteur TIFF adapté au type : 3 (flottant) pour float32/64, 2 (différence horizontale) sinon. """
+    return 3 if np.issubdtype(np.dtype(dtype), np.floating) else 2
+
+
+def cog_creation_options(dtype, compress=None, blocksize=None, level=None):
+    """
+    Options de création GeoTIFF d'un COG : tuiles internes, bandes séparées (une bande = un bloc de tuiles
+    contigu, lu sans décoder les autres), compression avec prédicteur.
+    """
+    compress = (compress or constantes.COG_COMPRESS).upper()
+    blocksize = int(blocksize or constantes.COG_BLOCK_SIZE)
+    if blocksize not in COG_BLOCK_SIZES:
+        raise ValueError(f"Taille de tuile {blocksize} invalide (attendu : {COG_BLOCK_SIZES})")
+    options = {
+        "driver": "GTiff",
+        "tiled": True,
+        "blockxsize": blocksize,
+        "blockysize": blocksize,
+        "interleave": "band",
+        "compress": compress,
+        "bigtiff": "IF_SAFER",
+    }
+    if compress != "NONE":
+        options["predictor"] = _predictor(dtype)
+    if level is not None:
+        options["zlevel" if compress == "DEFLATE" else "zstd_level"] = int(level)
+    return options
+
+
+def overview_factors(height, width, blocksize=None):
+    """ Facteurs de réduction (2, 4, 8...) jusqu'à ce que l'aperçu tienne dans une tuile. """
+    blocksize = int(blocksize or constantes.COG_BLOCK_SIZE)
+    factors = []
+    factor = 2
+    while max(height, width) / (factor // 2) > blocksize:
+        factors.append(factor)
+        factor *= 2
+    return factors
+
+
+def _finalize_cog(tiled_path, output_path, dtype, compress, blocksize, level, resampling):
+    """
+    Construit les aperçus dans le fichier tuilé intermédiaire puis le recopie en COG
+    (en-têtes et aperçus en tête de fichier, COPY_SRC_OVERVIEWS). Remplacement atomique de output_path.
+    """
+    with rasterio.open(tiled_path, "r+") as dst:
+        factors = overview_factors(dst.height, dst.width, blocksize)
+        if factors:
+            dst.build_overviews(factors, Resampling[resampling or constantes.COG_OVERVIEW_RESAMPLING])
+            dst.update_tags(ns="rio_overview", resampling=resampling or constantes.COG_OVERVIEW_RESAMPLING)
+
+    options = cog_creation_options(dtype, compress, blocksize, level)
+    final_path = f"{output_path}.cog-tmp"
+    try:
+        with rasterio.Env(GDAL_TIFF_INTERNAL_MASK=True):
+            rasterio.shutil.copy(tiled_path, final_path, copy_src_overviews=True, **options)
+        os.replace(final_path, output_path)
+    finally:
+        if os.path.exists(final_path):
+            os.remove(final_path)
+
+
+def _tiled_tmp_path(output_path):
+    directory = os.path.dirname(os.path.abspath(output_path))
+    fd, path = tempfile.mkstemp(prefix=".cog-", suffix=".tif", dir=directory)
+    os.close(fd)
+    return path
+
+
+def write_cog(data, profile, output_path, band_descriptions=None, compress=None, blocksize=None,
+              level=None, resampling=None, scales=None, offsets=None, tags=None, band_tags=None, valid_mask=None):
+    """
+    Écrit un tableau (bandes, lignes, colonnes) en Cloud-Optimized GeoTIFF.
+    scales / offsets : facteurs d'échelle GDAL par bande (valeur = brut * scale + offset),
+    tags / band_tags : métadonnées du fichier / de chaque bande (liste de dicts),
+    valid_mask : masque booléen (lignes, colonnes) des pixels valides, écrit comme masque interne.
+    Retourne True si le fichier a été écrit, False en cas d'erreur.
+    """
+    blocksize = int(blocksize or constantes.COG_BLOCK_SIZE)
+    tiled_path = _tiled_tmp_path(output_path)
+    try:
+        tiled_profile = profile.copy()
+        for option in ("compress", "predictor", "interleave", "photometric", "blockxsize", "blockysize", "tiled"):
+            tiled_profile.pop(option, None)
+        tiled_profile.update({
+            "driver": "GTiff",
+            "count": data.shape[0],
+            "dtype": data.dtype.name,
+            "tiled": True,
+            "blockxsize": blocksize,
+            "blockysize": blocksize,
+            "interleave": "band",
+        })
+        with rasterio.Env(GDAL_TIFF_INTERNAL_MASK=True), rasterio.open(tiled_path, "w", **tiled_profile) as dst:
+            dst.write(data)
+            if valid_mask is not None:
+                dst.write_mask(valid_mask.astype(np.uint8) * 255)
+            for band_idx, description in enumerate(band_descriptions or [], start=1):
+                if description:
+                    dst.set_band_description(band_idx, description)
+            if scales is not None:
+                dst.scales = tuple(scales)
+            if offsets is not None:
+                dst.offsets = tuple(offsets)
+            if tags:
+                dst.update_tags(**tags)
+            for band_idx, metadata in enumerate(band_tags or [], start=1):
+                dst.update_tags(band_idx, **metadata)
+        _finalize_cog(tiled_path, output_path, data.dtype.name, compress, blocksize, level, resampling)
+        return True
+    except Exception as e:
+        print(f"Erreur lors de l'écriture du COG {output_path}: {e}")
+        return False
+    finally:
+        if os.path.exists(tiled_path):
+            os.remove(tiled_path)
+
+
+def convert_to_cog(input_path, output_path=None, compress=None, blocksize=None, level=None, resampling=None):
+    """
+    Convertit un GeoTIFF existant en COG (en place si output_path est omis) sans charger
+    le raster en mémoire : descriptions de bandes, nodata et métadonnées sont conservées.
+    Retourne True si la conversion a réussi, False sinon.
+    """
+    output_path = output_path or input_path
+    blocksize = int(blocksize or constantes.COG_BLOCK_SIZE)
+    tiled_path = _tiled_tmp_path(output_path)
+    try:
+        with rasterio.open(input_path) as src:
+            dtype = src.dtypes[0]
+        with rasterio.Env(GDAL_TIFF_INTERNAL_MASK=True):
+            rasterio.shutil.copy(input_path, tiled_path, driver="GTiff", tiled=True, blockxsize=blocksize,
+                                 blockysize=blocksize, interleave="band")
+        _finalize_cog(tiled_path, output_path, dtype, compress, blocksize, level, resampling)
+        return True
+    except Exception as e:
+        print(f"Erreur lors de la conversion COG de {input_path}: {e}")
+        return False
+    finally:
+        if os.path.exists(tiled_path):
+            os.remove(tiled_path)
+
+
+def is_cog(src, blocksize=None):
+    """
+    Vérifie qu'un raster ouvert est tuilé, en bandes séparées et doté d'aperçus internes
+    (les petits rasters, qui tiennent dans une tuile, n'en ont pas besoin).
+    """
+    if not src.profile.get("tiled"):
+        return False
+    if src.count > 1 and src.interleaving is not None and src.interleaving.name != "band":
+        return False
+    needs_overviews = bool(overview_factors(src.height, src.width, blocksize or src.block_shapes[0][1]))
+    return not needs_overviews or bool(src.overviews(1))
+
+
+def _time_best(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _read_display(path, max_size, opener=None):
+    with rasterio.open(path, opener=opener) as src:
+        scale = min(1.0, max_size / max(src.height, src.width))
+        out_shape = (3, max(1, int(src.height * scale)), max(1, int(src.width * scale)))
+        src.read([1, 2, 3], out_shape=out_shape, resampling=Resampling.bilinear)
+
+
+def _read_full(path, opener=None):
+    with rasterio.open(path, opener=opener) as src:
+        src.read()
+
+
+def _read_window(path, size, opener=None):
+    with rasterio.open(path, opener=opener) as src:
+        window = Window(src.width // 2 - size // 2, src.height // 2 - size // 2, size, size)
+        src.read(window=window, boundless=True)
+
+
+def _bytes_fetched(read):
+    """ Octets récupérés par une lecture faite par plages (comme depuis S3) et nombre de requêtes. """
+    opener = local_range_opener()
+    read(opener)
+    return opener.bytes_fetched, opener.requests
+
+
+def benchmark_codecs(input_path, codecs=BENCHMARK_CODECS, blocksize=None, level=None, repeat=3,
+                     display_size=None, window_size=512):
+    """
+    Compare taille et vitesse de décodage d'un raster selon le codec : lecture pleine résolution,
+    lecture à la résolution d'affichage (bandes RGB, RGB_DISPLAY_MAX_SIZE) et lecture d'une fenêtre.
+    Pour ces deux dernières, les octets récupérés par plages (comme depuis S3) sont aussi mesurés.
+    Retourne une liste de dicts (un par codec), temps en secondes (meilleur de `repeat` essais).
+    """
+    display_size = display_size or constantes.RGB_DISPLAY_MAX_SIZE
+    results = []
+    with tempfile.TemporaryDirectory(prefix="cog-bench-") as workdir:
+        for codec in codecs:
+            path = os.path.join(workdir, f"{codec}.tif")
+            start = time.perf_counter()
+            if codec == "LZW-STRIPS":
+                rasterio.shutil.copy(input_path, path, driver="GTiff", compress="lzw", tiled=False)
+                ok = True
+            else:
+                ok = convert_to_cog(input_path, path, compress=codec, blocksize=blocksize, level=level)
+            write_time = time.perf_counter() - start
+            if not ok:
+                continue
+            display_bytes, display_requests = _bytes_fetched(lambda opener: _read_display(path, display_size, opener))
+            window_bytes, window_requests = _bytes_fetched(lambda opener: _read_window(path, window_size, opener))
+            results.append({
+                "codec": codec,
+                "size_bytes": os.path.getsize(path),
+                "write_s": write_time,
+                "read_full_s": _time_best(lambda: _read_full(path), repeat),
+                "read_display_s": _time_best(lambda: _read_display(path, display_size), repeat),
+                "read_window_s": _time_best(lambda: _read_window(path, window_size), repeat),
+                "display_bytes_fetched": display_bytes,
+                "display_requests": display_requests,
+                "window_bytes_fetched": window_bytes,
+                "window_requests": window_requests,
+            })
+    return results
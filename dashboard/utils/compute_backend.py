@@ -0,0 +1,380 @@
+import os
+import json
+import time
+import tempfile
+import threading
+
+import numpy as np
+import utils.constantes as constantes
+
+# Backends optionnels : le dashboard tourne avec numpy seul s'ils ne sont pas installés
+try:
+    import numexpr  # expressions évaluées par blocs, sans tableaux temporaires de la taille de l'image
+except ImportError:
+    numexpr = None
+try:
+    import numba  # boucles compilées (une passe par pixel, sans temporaires), GIL relâché
+except ImportError:
+    numba = None
+
+# Côté de l'image synthétique du micro-benchmark de sélection (COMPUTE_BACKEND=auto, résultat mémorisé)
+BENCHMARK_SIZE = 512
+# Écart toléré avec numpy (référence) sur le NDVI et les sommes ; classes et effectifs doivent être identiques
+RTOL = 1e-6
+ATOL = 1e-6
+
+
+class NumpyBackend:
+    """
+    Implémentation de référence des noyaux raster. Chaque backend fournit les mêmes primitives :
+    ndvi_into (NDVI borné écrit dans out), classify_into (classes d'un morceau de NDVI à partir de la table
+    de ndvi_kernel._class_table), class_sums (effectifs, sommes, sommes des carrés, min et max du NDVI
+    par classe) et difference (data2 - data1 en float64).
+    """
+    name = "numpy"
+
+    def available(self):
+        return True
+
+    def ndvi_into(self, red, nir, out):
+        """ red est réutilisé pour la somme (son contenu est perdu). """
+        np.subtract(nir, red, out=out)
+        np.add(nir, red, out=red)
+        zero = red == 0
+        np.divide(out, red, out=out, where=~zero)
+        out[zero] = 0
+        return np.clip(out, constantes.NDVI_MIN, constantes.NDVI_MAX, out=out)
+
+    def classify_into(self, ndvi, out, table):
+        """ ndvi et out 1D : premier seuil haut >= NDVI (np.searchsorted), puis test du seuil bas. """
+        uppers, classes, lowers, lower_inclusive, contiguous = table
+        slot = np.searchsorted(uppers, ndvi, side="left")
+        np.take(classes, slot, out=out)
+        if contiguous:
+            out[ndvi < lowers[0]] = 0
+            return out
+        slot_lowers = lowers[slot]
+        outside = ndvi < slot_lowers
+        outside |= (ndvi == slot_lowers) & ~lower_inclusive[slot]
+        out[outside] = 0
+        return out
+
+    def class_sums(self, classes, values, size):
+        """ classes (entiers 1D) et values (float64) : np.bincount (pondéré) et tri par classe pour les extrema. """
+        counts = np.bincount(classes, minlength=size)
+        sums = np.bincount(classes, weights=values, minlength=size)
+        sumsq = np.bincount(classes, weights=values * values, minlength=size)
+        mins, maxs = np.full(size, np.inf), np.full(size, -np.inf)
+        present = np.flatnonzero(counts)
+        starts = (np.cumsum(counts) - counts)[present]
+        grouped = values[np.argsort(classes, kind="stable")]
+        # fmin/fmax : un NaN (classe 0 hors forêt) n'écrase pas les extrema
+        mins[present] = np.fmin(mins[present], np.fmin.reduceat(grouped, starts))
+        maxs[present] = np.fmax(maxs[present], np.fmax.reduceat(grouped, starts))
+        return counts, sums, sumsq, mins, maxs
+
+    def difference(self, data1, data2):
+        return data2.astype(float) - data1.astype(float)
+
+
+def _flat_views(*arrays):
+    """ Vues 1D des tableaux s'ils sont tous contigus (écriture possible dans out), sinon None. """
+    if not all(array.flags.c_contiguous for array in arrays):
+        return None
+    return [array.reshape(-1) for array in arrays]
+
+
+class NumexprBackend(NumpyBackend):
+    """
+    numexpr : NDVI, classes (plages contiguës) et différence évalués par blocs en une expression.
+    Les constantes sont passées dans le type des données (sinon numexpr calculerait en float64).
+    class_sums n'a pas d'équivalent numexpr (regroupement par classe) : version numpy.
+    """
+    name = "numexpr"
+
+    def available(self):
+        return numexpr is not None
+
+    def ndvi_into(self, red, nir, out):
+        if not red.dtype == nir.dtype == out.dtype == np.float32:
+            return super().ndvi_into(red, nir, out)
+        constants = {"zero": np.float32(0), "low": np.float32(constantes.NDVI_MIN), "high": np.float32(constantes.NDVI_MAX)}
+        numexpr.evaluate("where(nir + red == zero, zero, (nir - red) / (nir + red))",
+                         local_dict={"red": red, "nir": nir, **constants}, out=out)
+        return numexpr.evaluate("where(v < low, low, where(v > high, high, v))", local_dict={"v": out, **constants}, out=out)
+
+    def classify_into(self, ndvi, out, table):
+        uppers, classes, lowers, _, contiguous = table
+        if not contiguous or ndvi.dtype != uppers.dtype:
+            return super().classify_into(ndvi, out, table)
+        # where(x < bas, 0, where(x <= haut_1, classe_1, where(x <= haut_2, classe_2, ... 0))) : NaN -> 0
+        local_dict = {"x": ndvi, "low": lowers[0]}
+        expression = "0"
+        for position in range(len(uppers) - 1, -1, -1):
+            local_dict[f"u{position}"] = uppers[position]
+            expression = f"where(x <= u{position}, {int(classes[position])}, {expression})"
+        np.copyto(out, numexpr.evaluate(f"where(x < low, 0, {expression})", local_dict=local_dict), casting="unsafe")
+        return out
+
+    def difference(self, data1, data2):
+        # Multiplier par un float64 : différence calculée en float64, comme .astype(float)
+        return numexpr.evaluate("b * one - a * one", local_dict={"a": data1, "b": data2, "one": np.float64(1)})
+
+
+if numba is not None:
+    @numba.njit(cache=True, nogil=True)
+    def _ndvi_numba(red, nir, out, low, high):
+        for i in range(out.shape[0]):
+            total = nir[i] + red[i]
+            value = (nir[i] - red[i]) / total if total != 0 else 0.0
+            if value < low:
+                value = low
+            elif value > high:
+                value = high
+            out[i] = value
+
+    @numba.njit(cache=True, nogil=True)
+    def _classify_numba(ndvi, out, uppers, classes, lowers, lower_inclusive):
+        n_uppers = uppers.shape[0]
+        for i in range(ndvi.shape[0]):
+            value = ndvi[i]
+            slot = n_uppers  # au-delà du dernier seuil ou NaN : classe 0
+            for position in range(n_uppers):
+                if value <= uppers[position]:
+                    slot = position
+                    break
+            if value < lowers[slot] or (value == lowers[slot] and not lower_inclusive[slot]):
+                out[i] = 0
+            else:
+                out[i] = classes[slot]
+
+    @numba.njit(cache=True, nogil=True)
+    def _class_sums_numba(classes, values, counts, sums, sumsq, mins, maxs):
+        # Même ordre d'addition que np.bincount : sommes identiques
+        for i in range(classes.shape[0]):
+            index = classes[i]
+            if index >= counts.shape[0]:
+                raise ValueError("classe hors des statistiques")
+            value = values[i]
+            counts[index] += 1
+            sums[index] += value
+            sumsq[index] += value * value
+            if value < mins[index]:
+                mins[index] = value
+            if value > maxs[index]:
+                maxs[index] = value
+
+    @numba.njit(cache=True, nogil=True)
+    def _difference_numba(data1, data2, out):
+        for i in range(out.shape[0]):
+            out[i] = np.float64(data2[i]) - np.float64(data1[i])
+
+
+class NumbaBackend(NumpyBackend):
+    """
+    numba : une boucle compilée par noyau, une seule passe sur les pixels et aucun temporaire.
+    Compilation au premier appel pour chaque type de données (mise en cache sur disque). Les tableaux
+    non contigus passent par la version numpy.
+    """
+    name = "numba"
+
+    def available(self):
+        return numba is not None
+
+    def ndvi_into(self, red, nir, out):
+        views = _flat_views(red, nir, out)
+        if views is None or out.dtype != np.float32:
+            return super().ndvi_into(red, nir, out)
+        _ndvi_numba(*views, np.float32(constantes.NDVI_MIN), np.float32(constantes.NDVI_MAX))
+        return out
+
+    def classify_into(self, ndvi, out, table):
+        views = _flat_views(ndvi, out)
+        if views is None:
+            return super().classify_into(ndvi, out, table)
+        uppers, classes, lowers, lower_inclusive, _ = table
+        _classify_numba(*views, uppers, classes, lowers, lower_inclusive)
+        return out
+
+    def class_sums(self, classes, values, size):
+        counts, sums, sumsq = np.zeros(size, dtype=np.int64), np.zeros(size), np.zeros(size)
+        mins, maxs = np.full(size, np.inf), np.full(size, -np.inf)
+        _class_sums_numba(np.ascontiguousarray(classes), np.ascontiguousarray(values), counts, sums, sumsq, mins, maxs)
+        return counts, sums, sumsq, mins, maxs
+
+    def difference(self, data1, data2):
+        views = _flat_views(data1, data2)
+        if views is None or data1.shape != data2.shape:
+            return super().difference(data1, data2)
+        out = np.empty(data1.shape, dtype=np.float64)
+        _difference_numba(*views, out.reshape(-1))
+        return out
+
+
+NUMPY = NumpyBackend()
+BACKENDS = {backend.name: backend for backend in (NUMPY, NumexprBackend(), NumbaBackend())}
+
+_active = None
+_active_lock = threading.Lock()
+
+
+def available_backends():
+    """ Noms des backends utilisables (paquets installés), numpy en premier. """
+    return [name for name, backend in BACKENDS.items() if backend.available()]
+
+
+def _sample(size, seed=0):
+    """
+    Données synthétiques du contrôle et du benchmark : bandes Rouge/NIR float32 (avec sommes nulles),
+    NDVI de référence (avec NaN et valeurs égales aux seuils), classes, bandes int16 pour la différence,
+    et deux tables de classification (plages contiguës ou non, voir ndvi_kernel._class_table).
+    """
+    rng = np.random.default_rng(seed)
+    red, nir = rng.random((2, size, size), dtype=np.float32)
+    red[0, :16] = nir[0, :16] = 0
+    ndvi = NUMPY.ndvi_into(red.copy(), nir, np.empty_like(red))
+    uppers = np.array([0.2, 0.3, 0.5, 0.7, 1.0], dtype=np.float32)
+    ndvi[1, :len(uppers)] = uppers
+    ndvi[2, :16] = np.nan
+    classes_list = np.array([1, 2, 3, 4, 5, 0], dtype=np.uint8)
+    contiguous = (uppers, classes_list, np.array([-1, 0.2, 0.3, 0.5, 0.7, np.inf], dtype=np.float32),
+                  np.array([True, False, False, False, False, False]), True)
+    gaps = (uppers, classes_list, np.array([-1, 0.25, 0.3, 0.5, 0.75, np.inf], dtype=np.float32),
+            np.array([True, False, True, False, False, False]), False)
+    class_map = NUMPY.classify_into(ndvi.reshape(-1), np.empty(ndvi.size, dtype=np.uint8), contiguous).reshape(ndvi.shape)
+    bands = rng.integers(-10000, 10000, (2, size, size), dtype=np.int16)
+    return {"red": red, "nir": nir, "ndvi": ndvi, "class_map": class_map, "bands": bands, "tables": (contiguous, gaps)}
+
+
+def _run_kernels(backend, sample):
+    """ Enchaîne les primitives du backend sur l'échantillon (NDVI, classes, stats par classe, différence). """
+    ndvi = backend.ndvi_into(sample["red"].copy(), sample["nir"], np.empty_like(sample["red"]))
+    flat_ndvi = sample["ndvi"].reshape(-1)
+    class_maps = [backend.classify_into(flat_ndvi, np.empty(flat_ndvi.size, dtype=np.uint8), table)
+                  for table in sample["tables"]]
+    sums = backend.class_sums(sample["class_map"].reshape(-1), flat_ndvi.astype(np.float64), len(sample["tables"][0][1]))
+    difference = backend.difference(sample["bands"][0], sample["bands"][1])
+    return ndvi, class_maps, sums, difference
+
+
+def matches_reference(backend, sample=None):
+    """ Vrai si les primitives du backend donnent les résultats de numpy (classes et effectifs identiques). """
+    sample = sample or _sample(64)
+    ndvi, class_maps, sums, difference = _run_kernels(backend, sample)
+    ref_ndvi, ref_class_maps, ref_sums, ref_difference = _run_kernels(NUMPY, sample)
+    return (np.allclose(ndvi, ref_ndvi, rtol=RTOL, atol=ATOL, equal_nan=True)
+            and all(np.array_equal(class_map, ref) for class_map, ref in zip(class_maps, ref_class_maps))
+            and np.array_equal(sums[0], ref_sums[0])
+            and all(np.allclose(value, ref, rtol=RTOL, atol=ATOL, equal_nan=True) for value, ref in zip(sums[1:], ref_sums[1:]))
+            and np.allclose(difference, ref_difference, rtol=RTOL, atol=ATOL))
+
+
+def _checked(backend):
+    """ Le backend s'il est installé et conforme à numpy, sinon None (avec un avertissement). """
+    try:
+        if matches_reference(backend):
+            return backend
+        print(f"Avertissement : backend de calcul {backend.name} écarté (résultats différents de numpy)")
+    except Exception as e:
+        print(f"Avertissement : backend de calcul {backend.name} écarté ({e})")
+    return None
+
+
+def benchmark_backends(size=BENCHMARK_SIZE, repeat=3):
+    """
+    Micro-benchmark des backends installés et conformes (le contrôle compile aussi les noyaux numba) :
+    liste de dicts {"backend", "seconds" (meilleur de repeat essais sur une image size x size)}, du plus rapide au plus lent.
+    """
+    sample = _sample(size)
+    results = []
+    for name in available_backends():
+        backend = BACKENDS[name] if name == NUMPY.name else _checked(BACKENDS[name])
+        if backend is None:
+            continue
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            _run_kernels(backend, sample)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results.append({"backend": name, "seconds": best})
+    return sorted(results, key=lambda result: result["seconds"])
+
+
+def _installed_versions():
+    """ Versions de numpy et des backends optionnels installés : un choix mémorisé n'est valable que pour elles. """
+    return {module.__name__: module.__version__ for module in (np, numexpr, numba) if module is not None}
+
+
+def _remembered_choice(path):
+    """ Backend retenu par un benchmark précédent (fichier path) pour les paquets installés, None sinon. """
+    try:
+        with open(path, encoding="utf-8") as f:
+            choice = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if choice.get("versions") != _installed_versions() or choice.get("backend") not in available_backends():
+        return None
+    return choice["backend"]
+
+
+def _remember_choice(path, name):
+    """ Publie atomiquement (fichier temporaire + os.replace) le backend retenu par le benchmark. """
+    directory = os.path.dirname(path) or "."
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"backend": name, "versions": _installed_versions()}, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Avertissement : choix du backend de calcul non mémorisé ({e})")
+
+
+def _auto_backend():
+    """
+    Le plus rapide des backends installés au micro-benchmark, mesuré une seule fois pour tous les processus
+    (workers gunicorn, redémarrages) : le résultat est mémorisé dans COMPUTE_BACKEND_CHOICE_FILE.
+    """
+    if available_backends() == [NUMPY.name]:
+        return NUMPY
+    path = constantes.COMPUTE_BACKEND_CHOICE_FILE
+    name = _remembered_choice(path)
+    if name is None:
+        name = benchmark_backends()[0]["backend"]
+        _remember_choice(path, name)
+        print(f"Backend de calcul retenu au micro-benchmark : {name}")
+    return (_checked(BACKENDS[name]) if name != NUMPY.name else None) or NUMPY
+
+
+def select_backend(name=None):
+    """
+    Backend désigné par name (COMPUTE_BACKEND par défaut) : "numpy", "numexpr", "numba", ou "auto"
+    (le plus rapide au micro-benchmark, mémorisé). Repli sur numpy si le paquet manque ou si les résultats diffèrent.
+    """
+    name = (name or constantes.COMPUTE_BACKEND).lower()
+    if name == "auto":
+        return _auto_backend()
+    backend = BACKENDS.get(name)
+    if backend is None or not backend.available():
+        print(f"Avertissement : backend de calcul {name} indisponible, utilisation de numpy")
+        return NUMPY
+    return _checked(backend) or NUMPY
+
+
+def get_backend():
+    """ Backend actif, choisi au premier appel (select_backend). """
+    global _active
+    if _active is None:
+        with _active_lock:
+            if _active is None:
+                _active = select_backend()
+    return _active
+
+
+def set_backend(name):
+    """ Force le backend actif (ex: tests, comparaisons) et le retourne ; None pour refaire le choix au prochain appel. """
+    global _active
+    with _active_lock:
+        _active = None if name is None else select_backend(name)
+    return _active
@@ -1,3 +1,6 @@
+import os
+import tempfile
+
 DATA_DIR = "data"  
 NDVI_MIN = -1
 NDVI_MAX = 1
@@ -12,4 +15,120 @@ NDVI_CLASSES = {
 INDEX_TO_LABEL = {index: details["label"] for index, details in NDVI_CLASSES.items()}
 # Mapping des couleurs pour le graphique imshow
 COLOR_MAP = {index: details["color"] for index, details in NDVI_CLASSES.items()}
-PIXEL_SURFACE_M2 = 10*10
\ No newline at end of file
+PIXEL_SURFACE_M2 = 10*10
+
+# --- Catalogue S3 (index forêt -> année -> objet) ---
+# Durée de validité du catalogue en secondes avant un nouveau listage S3 (0 = toujours relister)
+S3_CATALOG_TTL_SECONDS = int(os.getenv("S3_CATALOG_TTL_SECONDS", 600))
+# Manifeste JSON publié à côté des rasters (forêt, année, ETag, taille, bandes, CRS, transform...)
+MANIFEST_FILENAME = "manifest.json"
+# Mettre à 0 pour ignorer le manifeste et lister le préfixe S3
+S3_USE_MANIFEST = os.getenv("S3_USE_MANIFEST", "1") != "0"
+
+# --- Lecture des rasters S3 ---
+# Lecture par plages HTTP (seuls les octets demandés par GDAL) ; mettre à 0 pour télécharger le TIF entier
+S3_RANGE_READS = os.getenv("S3_RANGE_READS", "1") != "0"
+RANGE_READ_BLOCK_SIZE = int(os.getenv("RANGE_READ_BLOCK_SIZE", 256 * 1024))
+
+# --- Cache disque des TIFs S3 (clé bucket/key/ETag, éviction LRU) ---
+DISK_CACHE_DIR = os.getenv("DISK_CACHE_DIR", os.path.join(tempfile.gettempdir(), "forets_raster_cache"))
+# Budget disque en octets ; 0 désactive le cache (lecture par plages à chaque accès)
+DISK_CACHE_MAX_BYTES = int(os.getenv("DISK_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+
+# --- Cache mémoire des tableaux décodés (NDVI, RGB, cartes de classes) ---
+ARRAY_CACHE_MAX_BYTES = int(os.getenv("ARRAY_CACHE_MAX_BYTES", 128 * 1024 * 1024))
+
+# --- Magasin memmap des tableaux décodés (.npy partagés entre workers gunicorn) ---
+MEMMAP_STORE_ENABLED = os.getenv("MEMMAP_STORE_ENABLED", "1") != "0"
+MEMMAP_STORE_DIR = os.getenv("MEMMAP_STORE_DIR", os.path.join(tempfile.gettempdir(), "forets_memmap_store"))
+MEMMAP_STORE_MAX_BYTES = int(os.getenv("MEMMAP_STORE_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+
+# --- Chargement concurrent des statistiques annuelles ---
+# Téléchargements S3 simultanés (I/O) et calculs NDVI/classification simultanés (CPU)
+YEAR_PIPELINE_IO_WORKERS = int(os.getenv("YEAR_PIPELINE_IO_WORKERS", 4))
+YEAR_PIPELINE_CPU_WORKERS = int(os.getenv("YEAR_PIPELINE_CPU_WORKERS", 2))
+
+# --- Client S3 partagé (utils/s3_client.py) ---
+# Connexions HTTP gardées ouvertes par processus : au moins les téléchargements simultanés des
+# années plus les lectures par plages des callbacks concurrents
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", max(10, 4 * YEAR_PIPELINE_IO_WORKERS)))
+S3_MAX_ATTEMPTS = int(os.getenv("S3_MAX_ATTEMPTS", 5))
+S3_CONNECT_TIMEOUT = float(os.getenv("S3_CONNECT_TIMEOUT", 5))
+S3_READ_TIMEOUT = float(os.getenv("S3_READ_TIMEOUT", 60))
+
+# --- Regroupement des chargements concurrents identiques (single-flight) ---
+# Mettre à 0 pour ne regrouper les appels qu'au sein d'un même worker (pas de verrou fichier)
+SINGLE_FLIGHT_FILE_LOCKS = os.getenv("SINGLE_FLIGHT_FILE_LOCKS", "1") != "0"
+SINGLE_FLIGHT_LOCK_DIR = os.getenv("SINGLE_FLIGHT_LOCK_DIR", os.path.join(tempfile.gettempdir(), "forets_locks"))
+# Attente maximale (secondes) du verrou d'un autre worker avant de calculer sans lui
+SINGLE_FLIGHT_LOCK_TIMEOUT = float(os.getenv("SINGLE_FLIGHT_LOCK_TIMEOUT", 120))
+
+# --- Préchargement en arrière-plan (années voisines, année de comparaison, forêt suivante) ---
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "1") != "0"
+# Préchargements simultanés par worker et octets (TIFs S3) en attente ou en cours au maximum
+PREFETCH_MAX_CONCURRENT = int(os.getenv("PREFETCH_MAX_CONCURRENT", 2))
+PREFETCH_MAX_BYTES = int(os.getenv("PREFETCH_MAX_BYTES", 256 * 1024 * 1024))
+# Taille maximale (pixels) de l'image RGB affichée, aussi utilisée pour la précharger
+RGB_DISPLAY_MAX_SIZE = 1000
+
+# --- Stockage des rasters (utils/storage.py) ---
+# "s3" (bucket AWS, par défaut) ou "local" (fichiers de DATA_DIR, sans réseau)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "s3").lower()
+# Durée de validité du catalogue des fichiers locaux (secondes) avant un nouveau parcours du dossier
+LOCAL_CATALOG_TTL_SECONDS = int(os.getenv("LOCAL_CATALOG_TTL_SECONDS", 5))
+
+# --- Cloud-Optimized GeoTIFF (utils/cog.py) ---
+# Codec des TIFs écrits par l'ingestion et la conversion : "DEFLATE" ou "ZSTD" (avec prédicteur)
+COG_COMPRESS = os.getenv("COG_COMPRESS", "DEFLATE").upper()
+# Taille des tuiles internes (256 ou 512 pixels)
+COG_BLOCK_SIZE = int(os.getenv("COG_BLOCK_SIZE", 512))
+# Rééchantillonnage des aperçus internes (réductions 2, 4, 8...)
+COG_OVERVIEW_RESAMPLING = os.getenv("COG_OVERVIEW_RESAMPLING", "average")
+# Profil de stockage des rasters écrits par l'ingestion : "float32" (5 bandes flottantes) ou
+# "scaled_int16" (entiers 16 bits + scale/offset par bande, deux fois moins d'octets, utils/scaled_raster.py)
+RASTER_STORAGE_PROFILE = os.getenv("RASTER_STORAGE_PROFILE", "float32").lower()
+
+# --- Masque de validité (pixels hors du polygone de la forêt, utils/validity.py) ---
+# TIFs sans nodata ni masque interne : un pixel dont les bandes Rouge et NIR valent exactement 0 (ou dont
+# la bande NDVI, quand elle existe, vaut exactement 0) est considéré comme hors polygone (remplissage du découpage). Mettre à 0 pour tout garder.
+VALID_MASK_ZERO_FILL = os.getenv("VALID_MASK_ZERO_FILL", "1") != "0"
+
+# --- Cartes de classes compactes en cache (utils/class_codec.py) ---
+# "rle" (runs par ligne), "bitpack3" (3 bits par pixel) ou "auto" (le plus petit des deux pour chaque carte)
+CLASS_MAP_CODEC = os.getenv("CLASS_MAP_CODEC", "auto").lower()
+
+# --- Cube multi-années par forêt (utils/forest_cube.py, construit par data_preprocessing/07.build_forest_cube.py) ---
+# Séries annuelles et évolution d'un pixel lues dans le cube s'il est à jour ; mettre à 0 pour relire les TIFs
+FOREST_CUBE_ENABLED = os.getenv("FOREST_CUBE_ENABLED", "1") != "0"
+
+# --- Alignement des grilles entre années (utils/grid_alignment.py) ---
+# Nombre de couples (grille source -> grille canonique) dont l'index de projection reste en cache
+GRID_INDEX_CACHE_SIZE = int(os.getenv("GRID_INDEX_CACHE_SIZE", 64))
+
+# --- Base de statistiques précalculées (utils/stats_store.py, construite par data_preprocessing/08.build_stats_store.py) ---
+# Stats par forêt / année / classe servies sans lire de raster tant que l'ETag du TIF source correspond
+STATS_STORE_ENABLED = os.getenv("STATS_STORE_ENABLED", "1") != "0"
+# Délai (secondes) avant de revérifier la base publiée (nouvelle version sur S3, base créée en local)
+STATS_STORE_TTL_SECONDS = int(os.getenv("STATS_STORE_TTL_SECONDS", 600))
+
+# --- Mode fenêtré à mémoire bornée (utils/windowed.py, ex: dyno Heroku 512 Mo) ---
+# Budget (Mo) de mémoire de travail du processus : NDVI, classes, RGB et stats sont calculés par fenêtres
+# (src.block_windows) qui tiennent dans ce budget. Le dashboard le partage entre les YEAR_PIPELINE_CPU_WORKERS
+# années calculées en parallèle (chaque raster en reçoit une part égale). Seules les stats sont calculées sans
+# image entière : les tableaux affichés (NDVI et classes : 5 octets par pixel, RGB : 12 octets par pixel à la
+# résolution d'affichage) sont alloués en entier, en plus du budget. Un quart du budget va au cache de blocs GDAL
+# (GDAL_CACHEMAX, fixé pendant les lectures fenêtrées). 0 = bandes entières
+RASTER_MEMORY_BUDGET_MB = float(os.getenv("RASTER_MEMORY_BUDGET_MB", 0))
+# Threads de calcul par raster : les fenêtres (NDVI, classes, stats) sont réparties entre eux, chacun avec son
+# propre dataset rasterio. 1 = un seul thread (par défaut : aucun gain mesuré sur une machine multi-cœur pour
+# l'instant). Les threads s'ajoutent aux YEAR_PIPELINE_CPU_WORKERS années calculées en parallèle : plafonnés à
+# os.cpu_count() // YEAR_PIPELINE_CPU_WORKERS par raster
+RASTER_WORKERS = int(os.getenv("RASTER_WORKERS", 1))
+
+# --- Backend de calcul des noyaux raster (utils/compute_backend.py) ---
+# "numpy" (référence, par défaut), "numexpr" ou "numba" (paquets optionnels), ou "auto" : le plus rapide des
+# backends installés au micro-benchmark, mesuré une fois puis mémorisé dans COMPUTE_BACKEND_CHOICE_FILE.
+# Repli sur numpy si le paquet manque ou si les résultats diffèrent
+COMPUTE_BACKEND = os.getenv("COMPUTE_BACKEND", "numpy").lower()
+COMPUTE_BACKEND_CHOICE_FILE = os.getenv("COMPUTE_BACKEND_CHOICE_FILE",
+                                        os.path.join(tempfile.gettempdir(), "forets_compute_backend.json"))
@@ -0,0 +1,154 @@
+import os
+import re
+import shutil
+import hashlib
+import tempfile
+import threading
+
+# Taille des morceaux écrits sur disque lors du téléchargement d'un objet
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def _object_id(bucket, key):
+    return hashlib.sha256(f"{bucket}/{key}".encode("utf-8")).hexdigest()[:32]
+
+
+def _safe_etag(etag):
+    return re.sub(r"[^A-Za-z0-9_-]", "_", etag.strip('"'))
+
+
+class DiskCache:
+    """
+    Cache disque d'objets S3, indexé par (bucket, key, ETag), avec éviction LRU sous un budget en octets.
+    Le répertoire fait office d'index (partagé entre workers) : un fichier par version d'objet,
+    nommé <id objet>.<etag>, dont la date de modification sert d'horodatage LRU.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+
+    def _path(self, bucket, key, etag):
+        return os.path.join(self.directory, f"{_object_id(bucket, key)}.{_safe_etag(etag)}")
+
+    def get(self, bucket, key, etag):
+        """ Chemin de la copie locale à cet ETag (marquée comme récemment utilisée), ou None. """
+        path = self._path(bucket, key, etag)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def _versions(self, bucket, key):
+        """ Liste (mtime, etag, chemin) des copies locales d'un objet. """
+        prefix = _object_id(bucket, key) + "."
+        versions = []
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(prefix) and entry.is_file():
+                try:
+                    versions.append((entry.stat().st_mtime, entry.name[len(prefix):], entry.path))
+                except FileNotFoundError:
+                    continue
+        return versions
+
+    def find(self, bucket, key):
+        """ Retourne (etag, chemin) de la copie locale la plus récente d'un objet, quel que soit son ETag, ou (None, None). """
+        versions = self._versions(bucket, key)
+        if not versions:
+            return None, None
+        _, etag, path = max(versions)
+        return etag, path
+
+    def revalidated(self, path):
+        """ Enregistre un GET conditionnel ayant confirmé la copie locale (304 Not Modified). """
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            self.revalidations += 1
+            self.hits += 1
+        return path
+
+    def put_stream(self, bucket, key, etag, stream, size=None):
+        """
+        Écrit le contenu d'un flux (ex: Body d'un get_object) dans le cache de façon atomique.
+        Les anciennes versions de l'objet sont supprimées. Retourne le chemin, ou None si l'objet
+        dépasse le budget du cache.
+        """
+        if size is not None and size > self.max_bytes:
+            return None
+        path = self._path(bucket, key, etag)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                shutil.copyfileobj(stream, f, COPY_CHUNK_SIZE)
+            if os.path.getsize(tmp_path) > self.max_bytes:
+                os.remove(tmp_path)
+                return None
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        for _, _, old_path in self._versions(bucket, key):
+            if old_path != path:
+                try:
+                    os.remove(old_path)
+                except FileNotFoundError:
+                    pass
+        self._evict(keep=path)
+        return path
+
+    def _evict(self, keep=None):
+        """ Supprime les fichiers les moins récemment utilisés jusqu'à repasser sous max_bytes. """
+        files = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(".tmp-") or not entry.is_file():
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+                with self._lock:
+                    self.evictions += 1
+            except FileNotFoundError:
+                continue
+
+    def stats(self):
+        """ Compteurs du cache (hits, misses, revalidations, evictions) et occupation disque. """
+        used = sum(entry.stat().st_size for entry in os.scandir(self.directory)
+                   if entry.is_file() and not entry.name.startswith(".tmp-"))
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidations": self.revalidations,
+                "evictions": self.evictions,
+                "bytes_used": used,
+                "max_bytes": self.max_bytes,
+            }
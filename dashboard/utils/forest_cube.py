@@ -0,0 +1,274 @@
+import os
+import json
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from utils.scaled_raster import QUANTITY_SCALES, SCALED_NODATA
+
+# Cube multi-années d'une forêt : <racine>/cubes/<forêt>/{cube.json, ndvi.bin, class.bin, ndvi_series-<jeton>.bin}
+# (dossier local à côté des TIFs, ou préfixe S3 à côté des rasters)
+CUBE_DIRNAME = "cubes"
+CUBE_META_FILENAME = "cube.json"
+CUBE_VERSION = 1
+# Variables du cube : tableaux bruts (années, lignes, colonnes) en ordre C, une tranche par année
+CUBE_VARIABLES = {"ndvi": "int16", "class": "uint8"}
+# Copie du NDVI rangée par pixel (lignes, colonnes, années) : la série d'un pixel est contiguë et se lit
+# en une seule plage d'octets. Son nom porte un jeton des années et sources couvertes (meta["series"]) : un
+# lecteur qui garde l'ancien cube.json continue de lire l'ancienne copie pendant la publication de la nouvelle
+CUBE_SERIES_PREFIX = "ndvi_series-"
+# Lectures simultanées des plages annuelles d'un pixel quand la copie par pixel manque (cube ancien ou périmé)
+SERIES_FETCH_WORKERS = 8
+NDVI_SCALE = QUANTITY_SCALES["ndvi"]
+NDVI_NODATA = SCALED_NODATA
+
+
+def cube_filename(name):
+    """ Nom du fichier d'une variable du cube ("ndvi" -> "ndvi.bin"). """
+    return f"{name}.bin"
+
+
+def cube_key(prefix, forest_name, filename):
+    """ Clé S3 d'un fichier du cube d'une forêt (ex: 'raster/cubes/Mbao/ndvi.bin'). """
+    return f"{prefix}{CUBE_DIRNAME}/{forest_name}/{filename}"
+
+
+def encode_ndvi(ndvi_matrix):
+    """ NDVI flottant -> int16 mis à l'échelle (NDVI_SCALE), NaN -> NDVI_NODATA. """
+    invalid = np.isnan(ndvi_matrix)
+    encoded = np.rint(np.where(invalid, 0, ndvi_matrix) / NDVI_SCALE).astype(np.int16)
+    encoded[invalid] = NDVI_NODATA
+    return encoded
+
+
+def decode_ndvi(encoded):
+    """ Inverse de encode_ndvi : int16 -> float32 avec NaN pour NDVI_NODATA. """
+    ndvi = encoded.astype(np.float32) * np.float32(NDVI_SCALE)
+    ndvi[encoded == NDVI_NODATA] = np.nan
+    return ndvi
+
+
+class ForestCube:
+    """
+    Cube NDVI / classes d'une forêt : années × lignes × colonnes, NDVI en int16 mis à l'échelle et
+    classes en uint8. Chaque variable est un fichier brut dont les tranches annuelles sont contiguës :
+    une nouvelle année s'ajoute en fin de fichier et une année (ou une bande de lignes d'une année)
+    se lit en une seule plage d'octets. En local les fichiers sont projetés en mémoire (np.memmap) ;
+    sur S3, read_range(nom de fichier, début, fin) récupère les plages nécessaires ; la série d'un pixel
+    vient alors de la copie par pixel (series_filename) en une seule plage.
+    Les années sont rangées dans l'ordre d'arrivée (meta["years"]) ; les séries retournées sont triées.
+    """
+
+    def __init__(self, meta, read_range=None, arrays=None):
+        self.meta = meta
+        self.years = [int(year) for year in meta["years"]]
+        self.height, self.width = meta["height"], meta["width"]
+        self._read_range = read_range
+        self._arrays = arrays or {}
+
+    @property
+    def shape(self):
+        return (len(self.years), self.height, self.width)
+
+    def matches(self, sources):
+        """ Vrai si le cube contient exactement les années {année: ETag du TIF} du catalogue. """
+        return {str(year): etag for year, etag in sources.items()} == self.meta.get("sources")
+
+    def _slab_bytes(self, name):
+        return self.height * self.width * np.dtype(CUBE_VARIABLES[name]).itemsize
+
+    def read(self, name, year_indexes=None, row_start=0, row_stop=None):
+        """
+        Variable "ndvi" ou "class" pour les années d'indices year_indexes (toutes par défaut)
+        et les lignes [row_start, row_stop[ : tableau (années, lignes, colonnes) à valeurs brutes.
+        """
+        row_stop = self.height if row_stop is None else row_stop
+        indexes = range(len(self.years)) if year_indexes is None else year_indexes
+        if name in self._arrays:
+            return self._arrays[name][list(indexes), row_start:row_stop]
+        dtype = np.dtype(CUBE_VARIABLES[name])
+        row_bytes = self.width * dtype.itemsize
+        slabs = []
+        for index in indexes:
+            start = index * self._slab_bytes(name) + row_start * row_bytes
+            payload = self._read_range(cube_filename(name), start, start + (row_stop - row_start) * row_bytes)
+            slabs.append(np.frombuffer(payload, dtype=dtype).reshape(row_stop - row_start, self.width))
+        return np.stack(slabs) if slabs else np.empty((0, row_stop - row_start, self.width), dtype=dtype)
+
+    def pixel_series(self, row, col):
+        """ NDVI d'un pixel pour toutes les années : liste triée de (année, valeur), NaN hors forêt. """
+        itemsize = np.dtype(CUBE_VARIABLES["ndvi"]).itemsize
+        if "ndvi" in self._arrays:
+            raw = np.asarray(self._arrays["ndvi"][:, row, col])
+        elif series_filename(self.meta):
+            # Années du pixel contiguës dans la copie par pixel : une seule plage
+            start = (row * self.width + col) * len(self.years) * itemsize
+            payload = self._read_range(series_filename(self.meta), start, start + len(self.years) * itemsize)
+            raw = np.frombuffer(payload, dtype=CUBE_VARIABLES["ndvi"])
+        else:
+            # Une plage de 2 octets par année (même position dans chaque tranche), récupérées simultanément
+            offset = (row * self.width + col) * itemsize
+            starts = [index * self._slab_bytes("ndvi") + offset for index in range(len(self.years))]
+            with ThreadPoolExecutor(max_workers=max(1, min(SERIES_FETCH_WORKERS, len(starts))),
+                                    thread_name_prefix="cube-serie") as pool:
+                parts = pool.map(lambda start: self._read_range(cube_filename("ndvi"), start, start + itemsize), starts)
+                payload = b"".join(parts)
+            raw = np.frombuffer(payload, dtype=CUBE_VARIABLES["ndvi"])
+        values = decode_ndvi(raw)
+        return sorted((year, float(value)) for year, value in zip(self.years, values))
+
+    def class_counts(self):
+        """
+        Nombre de pixels par classe pour chaque année ({année: {classe: pixels}}) : effectifs enregistrés
+        à la construction, sinon un bincount par tranche annuelle (mémoire contiguë).
+        """
+        counts = self.meta.get("counts")
+        if counts is not None:
+            return {int(year): {int(c): n for c, n in year_counts.items()} for year, year_counts in counts.items()}
+        result = {}
+        for index, year in enumerate(self.years):
+            bincount = np.bincount(self.read("class", [index]).ravel())
+            result[year] = {c: int(n) for c, n in enumerate(bincount) if n}
+        return result
+
+
+def open_local_cube(directory):
+    """ Cube d'un dossier local, variables projetées en mémoire (lecture seule). None s'il n'existe pas. """
+    meta = read_cube_meta(directory)
+    if meta is None:
+        return None
+    shape = (len(meta["years"]), meta["height"], meta["width"])
+    arrays = {}
+    for name, dtype in CUBE_VARIABLES.items():
+        path = os.path.join(directory, cube_filename(name))
+        if not shape[0]:
+            arrays[name] = np.empty(shape, dtype=dtype)
+            continue
+        try:
+            arrays[name] = np.memmap(path, dtype=dtype, mode="r", shape=shape)
+        except (OSError, ValueError) as e:
+            print(f"Avertissement : cube illisible ({path}): {e}")
+            return None
+    return ForestCube(meta, arrays=arrays)
+
+
+def read_cube_meta(directory):
+    """ Métadonnées du cube d'un dossier local, ou None s'il est absent ou d'une autre version. """
+    path = os.path.join(directory, CUBE_META_FILENAME)
+    try:
+        with open(path, encoding="utf-8") as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Avertissement : métadonnées du cube illisibles ({path}): {e}")
+        return None
+    if meta.get("version") != CUBE_VERSION:
+        print(f"Avertissement : version de cube non supportée ({path}): {meta.get('version')}")
+        return None
+    return meta
+
+
+def _write_meta(directory, meta):
+    """ Publication atomique de cube.json, écrit après les données : un lecteur ne voit que des tranches complètes. """
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(directory, CUBE_META_FILENAME))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_cube_year(directory, forest_name, year, etag, ndvi_matrix, class_map, grid):
+    """
+    Ajoute (ou remplace) l'année d'une forêt dans son cube local, créé au besoin.
+    grid : {"crs", "transform" (6 coefficients), "width", "height"} du TIF source, identique pour
+    toutes les années du cube. etag identifie la version du TIF source (fraîcheur du cube).
+    Retourne les métadonnées mises à jour.
+    """
+    os.makedirs(directory, exist_ok=True)
+    meta = read_cube_meta(directory) or {
+        "version": CUBE_VERSION,
+        "forest": forest_name,
+        "crs": str(grid["crs"]) if grid["crs"] else None,
+        "transform": [float(v) for v in list(grid["transform"])[:6]],
+        "width": int(grid["width"]),
+        "height": int(grid["height"]),
+        "ndvi_scale": NDVI_SCALE,
+        "ndvi_nodata": NDVI_NODATA,
+        "years": [],
+        "sources": {},
+        "counts": {},
+    }
+    if (grid["height"], grid["width"]) != (meta["height"], meta["width"]) or \
+            not np.allclose(list(grid["transform"])[:6], meta["transform"]):
+        raise ValueError(f"Grille de {forest_name} {year} différente de celle du cube ({meta['height']}x{meta['width']})")
+
+    slabs = {"ndvi": encode_ndvi(ndvi_matrix), "class": np.ascontiguousarray(class_map, dtype=np.uint8)}
+    years = [int(y) for y in meta["years"]]
+    index = years.index(int(year)) if int(year) in years else len(years)
+    for name, slab in slabs.items():
+        path = os.path.join(directory, cube_filename(name))
+        slab_bytes = slab.nbytes
+        with open(path, "r+b" if os.path.exists(path) else "w+b") as f:
+            f.seek(index * slab_bytes)
+            f.write(slab.tobytes())
+            if index == len(years):
+                # Ajout : on écarte une éventuelle fin de fichier laissée par un ajout interrompu
+                f.truncate((index + 1) * slab_bytes)
+
+    if index == len(years):
+        meta["years"].append(int(year))
+    # La copie par pixel ne contient pas cette tranche : périmée jusqu'au prochain write_cube_series
+    meta.pop("series", None)
+    meta["sources"][str(year)] = etag
+    bincount = np.bincount(slabs["class"].ravel())
+    meta["counts"][str(year)] = {str(c): int(n) for c, n in enumerate(bincount) if n}
+    _write_meta(directory, meta)
+    return meta
+
+
+def series_filename(meta):
+    """ Nom de la copie par pixel du NDVI si elle couvre les années du cube (meta), sinon None. """
+    series = (meta or {}).get("series") or {}
+    return series.get("filename") if series.get("years") == meta["years"] else None
+
+
+def write_cube_series(directory, band_bytes=8 * 1024 * 1024):
+    """
+    (Ré)écrit la copie par pixel du NDVI (lignes × colonnes × années dans l'ordre de meta["years"]) à partir
+    de ndvi.bin, par bandes de lignes d'environ band_bytes, supprime les copies précédentes du dossier puis
+    publie cube.json. À appeler après les write_cube_year d'une mise à jour. Retourne les métadonnées, ou None sans cube.
+    """
+    meta = read_cube_meta(directory)
+    if meta is None:
+        return None
+    years, height, width = len(meta["years"]), meta["height"], meta["width"]
+    dtype = np.dtype(CUBE_VARIABLES["ndvi"])
+    ndvi = np.memmap(os.path.join(directory, cube_filename("ndvi")), dtype=dtype, mode="r",
+                     shape=(years, height, width)) if years else np.empty((0, height, width), dtype=dtype)
+    rows_per_band = max(1, band_bytes // max(1, width * years * dtype.itemsize))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for row_start in range(0, height, rows_per_band):
+                band = ndvi[:, row_start:row_start + rows_per_band]
+                f.write(np.ascontiguousarray(band.transpose(1, 2, 0)).tobytes())
+        token = hashlib.sha1(json.dumps([meta["years"], meta["sources"]], sort_keys=True).encode()).hexdigest()[:12]
+        filename = f"{CUBE_SERIES_PREFIX}{token}.bin"
+        os.replace(tmp_path, os.path.join(directory, filename))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    meta["series"] = {"filename": filename, "years": list(meta["years"])}
+    _write_meta(directory, meta)
+    for name in os.listdir(directory):
+        if name.startswith(CUBE_SERIES_PREFIX) and name != filename:
+            os.remove(os.path.join(directory, name))
+    return meta
@@ -0,0 +1,135 @@
+import math
+from functools import lru_cache
+
+import numpy as np
+from rasterio.crs import CRS
+from rasterio.transform import Affine, from_origin, array_bounds
+from rasterio.warp import transform as warp_transform, transform_bounds
+
+import utils.constantes as constantes
+
+# Les grilles sont des dicts {"crs", "transform", "width", "height"}, comme RasterEngine.get_raster_metadata.
+# Les rasters Sentinel Hub couvrent chaque année la même emprise, mais leurs dimensions (donc leur transform)
+# varient avec le plafond max_dimension de l'ingestion : les comparaisons pixel à pixel passent par une grille
+# canonique commune, sur laquelle chaque grille source est projetée par de simples index (plus proche voisin).
+
+
+def grid_of(src):
+    """ Grille d'un dataset rasterio ouvert. """
+    return {"crs": src.crs, "transform": src.transform, "width": src.width, "height": src.height}
+
+
+def grid_key(grid):
+    """ Clé hashable d'une grille (CRS normalisé, 6 coefficients du transform, dimensions). """
+    crs = CRS.from_user_input(grid["crs"]).to_string() if grid["crs"] else None
+    transform = tuple(round(float(v), 12) for v in list(grid["transform"])[:6])
+    return crs, transform, int(grid["width"]), int(grid["height"])
+
+
+def _grid_from_key(key):
+    crs, transform, width, height = key
+    return {"crs": crs, "transform": Affine(*transform), "width": width, "height": height}
+
+
+def same_grid(grid_a, grid_b):
+    return grid_key(grid_a) == grid_key(grid_b)
+
+
+def _grid_bounds(grid, crs):
+    """ Emprise (gauche, bas, droite, haut) d'une grille, exprimée dans crs. """
+    bounds = array_bounds(grid["height"], grid["width"], Affine(*list(grid["transform"])[:6]))
+    if crs and grid["crs"] and CRS.from_user_input(grid["crs"]) != CRS.from_user_input(crs):
+        return transform_bounds(grid["crs"], crs, *bounds)
+    return bounds
+
+
+def canonical_grid(grids):
+    """
+    Grille commune à plusieurs grilles (ex: toutes les années d'une forêt) : CRS de la première,
+    union des emprises et plus fine résolution, orientée nord (pas de rotation).
+    """
+    crs = grids[0]["crs"]
+    all_bounds = [_grid_bounds(grid, crs) for grid in grids]
+    left, bottom = min(b[0] for b in all_bounds), min(b[1] for b in all_bounds)
+    right, top = max(b[2] for b in all_bounds), max(b[3] for b in all_bounds)
+    # Résolution de chaque grille dans le CRS commun (emprise / dimensions)
+    res_x = min((b[2] - b[0]) / grid["width"] for b, grid in zip(all_bounds, grids))
+    res_y = min((b[3] - b[1]) / grid["height"] for b, grid in zip(all_bounds, grids))
+    # Tolérance : une emprise exactement multiple de la résolution ne gagne pas une colonne d'arrondi
+    width = max(1, math.ceil((right - left) / res_x - 1e-6))
+    height = max(1, math.ceil((top - bottom) / res_y - 1e-6))
+    return {"crs": crs, "transform": from_origin(left, top, res_x, res_y), "width": width, "height": height}
+
+
+class GridIndex:
+    """
+    Correspondance pixel de la grille cible -> pixel de la grille source (plus proche voisin, -1 hors source).
+    Grilles de même CRS sans rotation : deux vecteurs (lignes, colonnes), la projection est séparable ;
+    sinon un index 2-D aplati (ligne * largeur source + colonne).
+    """
+
+    def __init__(self, shape, rows=None, cols=None, flat=None):
+        self.shape = shape
+        self.rows, self.cols, self.flat = rows, cols, flat
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.rows, self.cols, self.flat) if a is not None)
+
+    def gather(self, array, fill):
+        """ Projette array (..., lignes source, colonnes source) sur la grille cible ; fill hors source. """
+        if self.flat is not None:
+            source = array.reshape(array.shape[:-2] + (-1,))
+            aligned = np.take(source, np.maximum(self.flat, 0), axis=-1)
+            aligned[..., self.flat < 0] = fill
+            return aligned
+        aligned = np.take(np.take(array, np.maximum(self.rows, 0), axis=-2), np.maximum(self.cols, 0), axis=-1)
+        aligned[..., self.rows < 0, :] = fill
+        aligned[..., :, self.cols < 0] = fill
+        return aligned
+
+
+def _axis_index(centers, origin, step, size):
+    """ Indices (int32) des pixels source contenant des centres de pixels cibles le long d'un axe, -1 hors source. """
+    index = np.floor((centers - origin) / step).astype(np.int64)
+    index[(index < 0) | (index >= size)] = -1
+    return index.astype(np.int32)
+
+
+@lru_cache(maxsize=constantes.GRID_INDEX_CACHE_SIZE)
+def _cached_index(source_key, target_key):
+    source, target = _grid_from_key(source_key), _grid_from_key(target_key)
+    src_t, dst_t = source["transform"], target["transform"]
+    shape = (target["height"], target["width"])
+    if source_key[0] == target_key[0] and src_t.b == src_t.d == dst_t.b == dst_t.d == 0:
+        x = dst_t.c + (np.arange(target["width"]) + 0.5) * dst_t.a
+        y = dst_t.f + (np.arange(target["height"]) + 0.5) * dst_t.e
+        return GridIndex(shape, rows=_axis_index(y, src_t.f, src_t.e, source["height"]),
+                         cols=_axis_index(x, src_t.c, src_t.a, source["width"]))
+
+    rows, cols = np.mgrid[:target["height"], :target["width"]]
+    xs, ys = dst_t * (cols.ravel() + 0.5, rows.ravel() + 0.5)
+    if source_key[0] != target_key[0]:
+        xs, ys = warp_transform(target["crs"], source["crs"], xs, ys)
+    src_cols, src_rows = ~src_t * (np.asarray(xs), np.asarray(ys))
+    src_rows, src_cols = np.floor(src_rows).astype(np.int64), np.floor(src_cols).astype(np.int64)
+    inside = (src_rows >= 0) & (src_rows < source["height"]) & (src_cols >= 0) & (src_cols < source["width"])
+    flat = np.where(inside, src_rows * source["width"] + src_cols, -1)
+    index_dtype = np.int32 if source["width"] * source["height"] < 2 ** 31 else np.int64
+    return GridIndex(shape, flat=flat.astype(index_dtype).reshape(shape))
+
+
+def grid_index(source_grid, target_grid):
+    """ Index de projection source -> cible, calculé une seule fois par couple de grilles (cache LRU). """
+    return _cached_index(grid_key(source_grid), grid_key(target_grid))
+
+
+def align(array, source_grid, target_grid, fill=np.nan):
+    """
+    Tableau (..., lignes, colonnes) de la grille source projeté sur la grille cible (plus proche voisin).
+    Retourne le tableau tel quel si les grilles sont identiques. fill : valeur hors de l'emprise source
+    (NaN pour le NDVI, 0 = hors forêt pour les classes).
+    """
+    if same_grid(source_grid, target_grid):
+        return array
+    return grid_index(source_grid, target_grid).gather(np.asarray(array), fill)
@@ -0,0 +1,110 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+
+import numpy as np
+
+
+def _object_id(key):
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+
+def _safe_name(value):
+    return "".join(c if c.isalnum() or c in "-_" else "_" for c in str(value))
+
+
+class MemmapStore:
+    """
+    Tableaux décodés (bandes, NDVI, cartes de classes) persistés en .npy non compressés sur disque local
+    et rouverts avec np.load(mmap_mode='r') : tous les workers gunicorn partagent les mêmes pages du
+    cache système, sans copie. Arborescence : <root>/<id clé>/<etag>/<nom>.npy (+ <nom>.json optionnel).
+    La publication est atomique (fichier temporaire + os.replace) et une nouvelle version (ETag)
+    remplace les précédentes.
+    """
+
+    def __init__(self, root, max_bytes=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def _version_dir(self, key, etag):
+        return os.path.join(self.root, _object_id(key), _safe_name(etag or "sans-etag"))
+
+    def load(self, key, etag, name):
+        """ Retourne (tableau memmap en lecture seule, métadonnées ou None), ou (None, None) si absent. """
+        version_dir = self._version_dir(key, etag)
+        path = os.path.join(version_dir, f"{_safe_name(name)}.npy")
+        try:
+            array = np.load(path, mmap_mode="r")
+        except (FileNotFoundError, ValueError):
+            return None, None
+        metadata = None
+        meta_path = os.path.join(version_dir, f"{_safe_name(name)}.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                metadata = json.load(f)
+        try:
+            os.utime(version_dir)  # horodatage LRU
+        except FileNotFoundError:
+            pass
+        return array, metadata
+
+    def _atomic_write(self, directory, filename, write):
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp_path, os.path.join(directory, filename))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def publish(self, key, etag, name, array, metadata=None):
+        """
+        Écrit un tableau (et ses métadonnées JSON) de façon atomique, supprime les versions obsolètes
+        de la clé, puis retourne la version memmap (tableau, métadonnées).
+        """
+        version_dir = self._version_dir(key, etag)
+        os.makedirs(version_dir, exist_ok=True)
+        safe = _safe_name(name)
+        # Les métadonnées sont publiées avant le tableau : un .npy visible a toujours son .json
+        if metadata is not None:
+            payload = json.dumps(metadata).encode("utf-8")
+            self._atomic_write(version_dir, f"{safe}.json", lambda f: f.write(payload))
+        self._atomic_write(version_dir, f"{safe}.npy", lambda f: np.save(f, np.ascontiguousarray(array)))
+
+        key_dir = os.path.dirname(version_dir)
+        for entry in os.scandir(key_dir):
+            if entry.is_dir() and entry.path != version_dir:
+                # Sous Linux, les workers qui ont encore l'ancienne version mappée la gardent jusqu'à fermeture
+                shutil.rmtree(entry.path, ignore_errors=True)
+        if self.max_bytes:
+            self._evict(keep=version_dir)
+        return self.load(key, etag, name)
+
+    def _evict(self, keep=None):
+        """ Supprime les versions les moins récemment utilisées jusqu'à repasser sous max_bytes. """
+        versions = []
+        total = 0
+        for key_entry in os.scandir(self.root):
+            if not key_entry.is_dir():
+                continue
+            for version_entry in os.scandir(key_entry.path):
+                if not version_entry.is_dir():
+                    continue
+                try:
+                    size = sum(f.stat().st_size for f in os.scandir(version_entry.path) if f.is_file())
+                    versions.append((version_entry.stat().st_mtime, size, version_entry.path))
+                except FileNotFoundError:
+                    continue
+                total += size
+        for _, size, path in sorted(versions):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
@@ -0,0 +1,138 @@
+from functools import lru_cache
+
+import numpy as np
+import utils.constantes as constantes
+from utils.compute_backend import get_backend
+
+# Pixels traités par morceau : les tableaux intermédiaires (index, masques) restent petits et chauds en cache CPU
+KERNEL_CHUNK_PIXELS = 1 << 18
+# Valeurs possibles d'une bande int16, indexées par leur vue uint16 (tables du profil compact)
+INT16_VALUES = 1 << 16
+
+
+@lru_cache(maxsize=8)
+def _class_table(dtype_str, classes_key):
+    """
+    Table de classification pour des NDVI de type dtype_str : seuils hauts triés et, par intervalle,
+    classe, seuil bas et inclusion du seuil bas (classe minimale : [bas, haut], autres : ]bas, haut]).
+    Une case supplémentaire (classe 0) reçoit les valeurs au-delà du dernier seuil et les NaN.
+    Retourne None si des plages se chevauchent (la dernière classe l'emporterait : boucle de référence).
+    contiguous : chaque seuil bas est le seuil haut précédent, seul le premier seuil bas reste à tester.
+    """
+    dtype = np.dtype(dtype_str)
+    first_class = min(index for index, _, _ in classes_key)
+    ranges = sorted(classes_key, key=lambda item: item[2])
+    for (_, _, previous_upper), (_, lower, _) in zip(ranges, ranges[1:]):
+        if lower < previous_upper:
+            return None
+    # Seuils convertis dans le type des NDVI, comme le fait la comparaison tableau / scalaire de numpy
+    uppers = np.array([upper for _, _, upper in ranges], dtype=dtype)
+    classes = np.array([index for index, _, _ in ranges] + [0], dtype=np.uint8)
+    lowers = np.array([lower for _, lower, _ in ranges] + [np.inf], dtype=dtype)
+    lower_inclusive = np.array([index == first_class for index, _, _ in ranges] + [False])
+    contiguous = bool(lower_inclusive[0]) and all(lowers[1:-1] == uppers[:-1])
+    return uppers, classes, lowers, lower_inclusive, contiguous
+
+
+def _classes_key():
+    return tuple((index, details["range"][0], details["range"][1]) for index, details in constantes.NDVI_CLASSES.items())
+
+
+def _classify_reference(ndvi, out):
+    """ Classification historique (un masque par classe) : référence, et repli si les plages se chevauchent. """
+    out[...] = 0
+    for class_index, details in constantes.NDVI_CLASSES.items():
+        lower_bound, upper_bound = details["range"]
+        if class_index == min(constantes.NDVI_CLASSES.keys()):
+            mask = (ndvi >= lower_bound) & (ndvi <= upper_bound)
+        else:
+            mask = (ndvi > lower_bound) & (ndvi <= upper_bound)
+        out[mask] = class_index
+    return out
+
+
+def classify_into(ndvi, out, valid_mask=None):
+    """
+    Classes NDVI (uint8, 0 hors classes, NaN et hors masque) écrites dans out (contigu) en une seule passe :
+    recherche dichotomique des seuils (np.searchsorted, ou backend de calcul actif) par morceaux de
+    KERNEL_CHUNK_PIXELS pixels. Résultat identique bit à bit à la boucle historique sur constantes.NDVI_CLASSES.
+    """
+    # Entiers comparés aux seuils en float64, comme le ferait numpy avec des seuils Python
+    dtype = ndvi.dtype if np.issubdtype(ndvi.dtype, np.floating) else np.dtype(np.float64)
+    table = _class_table(dtype.str, _classes_key())
+    if table is None:
+        _classify_reference(ndvi, out)
+    else:
+        backend = get_backend()
+        flat_ndvi, flat_out = ndvi.reshape(-1), out.reshape(-1)
+        for start in range(0, flat_ndvi.size, KERNEL_CHUNK_PIXELS):
+            chunk = flat_ndvi[start:start + KERNEL_CHUNK_PIXELS]
+            backend.classify_into(chunk, flat_out[start:start + chunk.size], table)
+    if valid_mask is not None:
+        out[~valid_mask] = 0
+    return out
+
+
+@lru_cache(maxsize=8)
+def _scaled_tables(scale, offset, nodata, classes_key, bounds):
+    raw = np.arange(INT16_VALUES, dtype=np.uint16).view(np.int16)
+    # Décodage identique à scaled_raster.read_bands (float32 : brut, NaN si nodata, * scale + offset) puis borné
+    ndvi = raw.astype(np.float32)
+    if nodata is not None:
+        ndvi[raw == nodata] = np.nan
+    ndvi *= np.float32(scale)
+    ndvi += np.float32(offset)
+    np.clip(ndvi, bounds[0], bounds[1], out=ndvi)
+    classes = classify(ndvi)
+    for table in (ndvi, classes):
+        table.flags.writeable = False
+    return ndvi, classes
+
+
+def scaled_ndvi_tables(scale, offset, nodata):
+    """
+    Tables d'une bande NDVI int16 mise à l'échelle (valeur = brut * scale + offset), indexées par la valeur
+    brute vue en uint16 : NDVI float32 décodé (NaN pour nodata, borné à [NDVI_MIN, NDVI_MAX]) et classe NDVI.
+    scale et offset sont ainsi repliés dans les seuils des classes : la classe d'un pixel se lit directement
+    sur l'entier stocké, bit à bit comme classify_into sur le NDVI décodé.
+    """
+    return _scaled_tables(float(scale), float(offset), nodata, _classes_key(),
+                          (constantes.NDVI_MIN, constantes.NDVI_MAX))
+
+
+def lookup_into(raw, table, out):
+    """ out = table[raw] pour une bande int16 brute (out contigu), par morceaux de KERNEL_CHUNK_PIXELS pixels. """
+    flat_raw, flat_out = raw.reshape(-1).view(np.uint16), out.reshape(-1)
+    for start in range(0, flat_raw.size, KERNEL_CHUNK_PIXELS):
+        chunk = flat_raw[start:start + KERNEL_CHUNK_PIXELS]
+        np.take(table, chunk, out=flat_out[start:start + chunk.size])
+    return out
+
+
+def classify(ndvi, valid_mask=None):
+    """ Carte des classes NDVI (uint8) d'une matrice NDVI ; voir classify_into. """
+    return classify_into(ndvi, np.empty(ndvi.shape, dtype=np.uint8), valid_mask)
+
+
+def ndvi_into(red, nir, out):
+    """
+    NDVI (NIR - Rouge) / (NIR + Rouge), 0 là où la somme est nulle, borné à [NDVI_MIN, NDVI_MAX], écrit dans out
+    sans autre tableau de la taille de l'image (backend de calcul actif, utils/compute_backend.py) :
+    red peut être réutilisé pour la somme (son contenu est perdu).
+    """
+    return get_backend().ndvi_into(red, nir, out)
+
+
+def ndvi_classes_into(red, nir, ndvi_out, class_out, valid_mask=None):
+    """
+    Noyau fusionné : NDVI puis classes, bande de lignes par bande de lignes pendant qu'elle est en cache.
+    Hors valid_mask, NDVI = NaN et classe 0. red est écrasé (voir ndvi_into).
+    """
+    chunk_rows = max(1, KERNEL_CHUNK_PIXELS // max(1, ndvi_out.shape[-1]))
+    for row in range(0, ndvi_out.shape[0], chunk_rows):
+        rows = slice(row, row + chunk_rows)
+        ndvi_chunk = ndvi_into(red[rows], nir[rows], ndvi_out[rows])
+        if valid_mask is not None:
+            ndvi_chunk[~valid_mask[rows]] = np.nan
+        classify_into(ndvi_chunk, class_out[rows])
+    return ndvi_out, class_out
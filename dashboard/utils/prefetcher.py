@@ -0,0 +1,108 @@
+import threading
+from functools import wraps
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Prefetcher:
+    """
+    Préchargement en arrière-plan des rasters que l'utilisateur demandera probablement ensuite.
+    Les tâches tournent sur un pool de max_concurrent threads, et le total des octets en attente ou
+    en cours est borné par max_bytes : une tâche qui dépasse le budget est abandonnée, pas retardée.
+    Une tâche ne démarre que lorsqu'aucune requête utilisateur n'est en cours dans le processus
+    (voir foreground()), pour ne jamais ralentir l'affichage.
+    """
+
+    def __init__(self, max_concurrent=2, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_concurrent), thread_name_prefix="prechargement")
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending = {}
+        self._pending_bytes = 0
+        self._foreground = 0
+        self.access_counts = Counter()
+        self.scheduled = 0
+        self.skipped = 0
+        self.completed = 0
+        self.failed = 0
+
+    @contextmanager
+    def foreground(self):
+        """ Marque une requête utilisateur en cours : les préchargements attendent qu'elle se termine. """
+        with self._lock:
+            self._foreground += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._foreground -= 1
+                if self._foreground == 0:
+                    self._idle.notify_all()
+
+    def foreground_task(self, func):
+        """ Décorateur : exécute func comme une requête utilisateur (voir foreground()). """
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.foreground():
+                return func(*args, **kwargs)
+        return wrapper
+
+    def record_access(self, name):
+        """ Compte un accès (ex: une forêt affichée) pour prédire le prochain. """
+        with self._lock:
+            self.access_counts[name] += 1
+
+    def most_accessed(self, exclude=None):
+        """ Nom le plus consulté (hors exclude), ou None. """
+        with self._lock:
+            for name, _ in self.access_counts.most_common():
+                if name != exclude:
+                    return name
+        return None
+
+    def submit(self, key, size, fn):
+        """
+        Planifie fn() en arrière-plan. Retourne False si la même clé est déjà planifiée
+        ou si le budget d'octets est atteint.
+        """
+        size = size or 0
+        with self._lock:
+            if key in self._pending or self._pending_bytes + size > self.max_bytes:
+                self.skipped += 1
+                return False
+            self._pending[key] = size
+            self._pending_bytes += size
+            self.scheduled += 1
+        self._executor.submit(self._run, key, fn)
+        return True
+
+    def _run(self, key, fn):
+        with self._lock:
+            while self._foreground > 0:
+                self._idle.wait()
+        try:
+            fn()
+            with self._lock:
+                self.completed += 1
+        except Exception as e:
+            print(f"Avertissement : préchargement échoué pour {key}: {e}")
+            with self._lock:
+                self.failed += 1
+        finally:
+            with self._lock:
+                self._pending_bytes -= self._pending.pop(key)
+
+    def stats(self):
+        """ Compteurs des préchargements (planifiés, ignorés, terminés, en échec) et octets en attente. """
+        with self._lock:
+            return {
+                "scheduled": self.scheduled,
+                "skipped": self.skipped,
+                "completed": self.completed,
+                "failed": self.failed,
+                "pending": len(self._pending),
+                "pending_bytes": self._pending_bytes,
+                "max_bytes": self.max_bytes,
+            }
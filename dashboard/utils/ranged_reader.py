@@ -0,0 +1,189 @@
+import io
+import os
+import threading
+from collections import OrderedDict
+
+# Taille des blocs récupérés par requête (les lectures GDAL sont alignées sur ces blocs)
+DEFAULT_BLOCK_SIZE = 256 * 1024
+# Nombre maximal de blocs gardés en mémoire par fichier ouvert
+DEFAULT_MAX_BLOCKS = 64
+
+
+def _contiguous_runs(indices):
+    """ Regroupe une liste triée d'indices en séquences contiguës. """
+    runs = []
+    for index in indices:
+        if runs and index == runs[-1][-1] + 1:
+            runs[-1].append(index)
+        else:
+            runs.append([index])
+    return runs
+
+
+class RangedFile(io.RawIOBase):
+    """
+    Fichier binaire en lecture seule dont les octets sont récupérés par plages, à la demande.
+    fetch_range(start, end) doit retourner les octets [start, end[ de l'objet distant.
+    Les blocs manquants contigus sont récupérés en une seule requête.
+    """
+
+    def __init__(self, fetch_range, size, block_size=DEFAULT_BLOCK_SIZE, max_blocks=DEFAULT_MAX_BLOCKS, stats=None):
+        super().__init__()
+        self._fetch_range = fetch_range
+        self.size = size
+        self.block_size = block_size
+        self._max_blocks = max_blocks
+        self._blocks = OrderedDict()
+        self._pos = 0
+        self._stats = stats
+        self.bytes_fetched = 0
+        self.requests = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._pos + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"whence invalide: {whence}")
+        if position < 0:
+            raise ValueError("Position négative")
+        self._pos = position
+        return position
+
+    def read(self, size=-1):
+        end = self.size if size is None or size < 0 else min(self.size, self._pos + size)
+        if self._pos >= end:
+            return b""
+        data = self._read_range(self._pos, end)
+        self._pos = end
+        return data
+
+    def readall(self):
+        return self.read(-1)
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self._blocks.clear()
+        super().close()
+
+    def _read_range(self, start, end):
+        bs = self.block_size
+        first, last = start // bs, (end - 1) // bs
+        missing = [index for index in range(first, last + 1) if index not in self._blocks]
+        for run in _contiguous_runs(missing):
+            range_start = run[0] * bs
+            range_end = min(self.size, (run[-1] + 1) * bs)
+            payload = self._fetch_range(range_start, range_end)
+            self.requests += 1
+            self.bytes_fetched += len(payload)
+            if self._stats is not None:
+                self._stats.record(len(payload))
+            for offset, index in enumerate(run):
+                self._blocks[index] = payload[offset * bs:(offset + 1) * bs]
+
+        parts = []
+        for index in range(first, last + 1):
+            parts.append(self._blocks[index])
+            self._blocks.move_to_end(index)
+        while len(self._blocks) > self._max_blocks:
+            self._blocks.popitem(last=False)
+
+        data = b"".join(parts)
+        offset = start - first * bs
+        return data[offset:offset + (end - start)]
+
+
+class RangeOpener:
+    """
+    Opener à passer à rasterio.open(path, opener=...) : chaque fichier est ouvert comme un RangedFile.
+    size_of(path) retourne la taille de l'objet (None s'il n'existe pas, ex: fichiers annexes .aux.xml)
+    et make_fetcher(path) la fonction fetch_range correspondante.
+    Les compteurs bytes_fetched / requests cumulent toutes les ouvertures. max_blocks borne les blocs
+    gardés en mémoire par fichier ouvert (au plus max_blocks x block_size octets).
+    """
+
+    def __init__(self, size_of, make_fetcher, block_size=DEFAULT_BLOCK_SIZE, max_blocks=DEFAULT_MAX_BLOCKS):
+        self._size_of = size_of
+        self._make_fetcher = make_fetcher
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        self._lock = threading.Lock()
+        self.bytes_fetched = 0
+        self.requests = 0
+
+    def record(self, nbytes):
+        with self._lock:
+            self.bytes_fetched += nbytes
+            self.requests += 1
+
+    def __call__(self, path, mode="rb"):
+        if "w" in mode or "+" in mode or "a" in mode:
+            raise PermissionError(f"Ouverture en écriture non supportée: {path}")
+        size = self._size_of(path)
+        if size is None:
+            raise FileNotFoundError(path)
+        return RangedFile(self._make_fetcher(path), size, block_size=self.block_size, max_blocks=self.max_blocks, stats=self)
+
+
+def s3_range_fetcher(client, bucket, key, etag=None):
+    """ fetch_range pour un objet S3 (GET avec en-tête Range ; If-Match protège contre un objet remplacé en cours de lecture). """
+    def fetch_range(start, end):
+        params = {"Bucket": bucket, "Key": key, "Range": f"bytes={start}-{end - 1}"}
+        if etag:
+            params["IfMatch"] = etag
+        return client.get_object(**params)['Body'].read()
+    return fetch_range
+
+
+def s3_range_opener(client, bucket, block_size=DEFAULT_BLOCK_SIZE, max_blocks=DEFAULT_MAX_BLOCKS):
+    """
+    Opener par plages pour des objets S3 hors catalogue (scripts de data_preprocessing) : taille et ETag de
+    chaque objet lus par un HEAD à la première ouverture (objet absent, ex: .aux.xml : FileNotFoundError).
+    """
+    heads = {}
+
+    def head(key):
+        if key not in heads:
+            try:
+                response = client.head_object(Bucket=bucket, Key=key)
+                heads[key] = (response['ContentLength'], response['ETag'].strip('"'))
+            except Exception:
+                heads[key] = (None, None)
+        return heads[key]
+
+    return RangeOpener(lambda key: head(key)[0], lambda key: s3_range_fetcher(client, bucket, key, etag=head(key)[1]),
+                       block_size=block_size, max_blocks=max_blocks)
+
+
+def local_range_opener(root="", block_size=DEFAULT_BLOCK_SIZE, max_blocks=DEFAULT_MAX_BLOCKS):
+    """ Équivalent local de l'opener S3 (mêmes lectures par plages sur des fichiers du disque), utile pour les tests. """
+    def size_of(path):
+        full_path = os.path.join(root, path)
+        return os.path.getsize(full_path) if os.path.isfile(full_path) else None
+
+    def make_fetcher(path):
+        full_path = os.path.join(root, path)
+
+        def fetch_range(start, end):
+            with open(full_path, "rb") as f:
+                f.seek(start)
+                return f.read(end - start)
+        return fetch_range
+
+    return RangeOpener(size_of, make_fetcher, block_size=block_size, max_blocks=max_blocks)
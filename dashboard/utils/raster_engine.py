@@ -0,0 +1,844 @@
+import time
+import sqlite3
+import threading
+
+import rasterio
+import numpy as np
+import pandas as pd
+from rasterio.warp import transform_geom
+from rasterio.windows import Window
+from rasterio.transform import Affine
+from rasterio.crs import CRS
+from rasterio.enums import Resampling
+from rasterio.errors import RasterioIOError
+
+import utils.constantes as constantes
+from utils.s3_catalog import S3Catalog
+from utils.array_cache import ArrayCache
+from utils.memmap_store import MemmapStore
+from utils.single_flight import SingleFlight
+from utils.prefetcher import Prefetcher
+from utils.year_pipeline import run_year_pipeline
+from utils.scaled_raster import read_bands
+from utils.bands import band_layout
+from utils.ndvi_kernel import classify
+from utils.validity import read_valid_mask, read_ndvi_with_mask, pack_mask, unpack_mask
+from utils.class_codec import encode_class_map, decode_class_map, class_counts
+from utils.grid_alignment import canonical_grid
+from utils.stats_store import StatsStore
+from utils.class_stats import accumulate_class_stats, stats_from_counts, stats_frame, COUNT
+from utils.windowed import (raster_budget, working_budget, budget_env, windowed_mode, budget_windows, read_ndvi_windowed,
+                            stream_class_stats, RGB_WINDOW_BYTES_PER_PIXEL)
+
+
+# --- Calculs indépendants du stockage ---
+
+def classify_ndvi(ndvi_matrix, valid_mask=None):
+    """
+    Classifie la matrice NDVI selon les seuils définis dans constantes (une passe, utils/ndvi_kernel.py).
+    Avec valid_mask, seuls les pixels valides sont classifiés ; les autres (hors forêt) restent en classe 0.
+    """
+    if ndvi_matrix is None: return None
+    return classify(ndvi_matrix, valid_mask)
+
+def calcul_class_stats(ndvi_class_map, ndvi_matrix=None):
+    """
+    Calcule les statistiques (nombre de pixels, surface en ha, et %) pour chaque classe NDVI, en une passe
+    (np.bincount, sans tri). Avec ndvi_matrix, ajoute la moyenne, l'écart-type, le min et le max du NDVI par classe.
+    """
+    if ndvi_class_map is None: return pd.DataFrame()
+    stats = accumulate_class_stats(ndvi_class_map, ndvi_matrix)
+    return stats_frame(stats, with_ndvi=ndvi_matrix is not None)
+
+def class_stats_from_counts(dict_class_pixel_count):
+    """ Statistiques par classe à partir des effectifs {classe: nombre de pixels} (ex: issus des runs RLE). """
+    return stats_frame(stats_from_counts(dict_class_pixel_count))
+
+def calculate_stats_difference(stats_df_new, stats_df_old, year_new, year_old):
+     """ Calcule la différence de surface et de pourcentage entre deux DataFrames de statistiques. """
+     if stats_df_new.empty or stats_df_old.empty: return pd.DataFrame()
+     merged_stats = pd.merge(
+         stats_df_new[['Classe Index', 'Classe Label', 'Surface (ha)', '% Couverture']],
+         stats_df_old[['Classe Index', 'Surface (ha)', '% Couverture']],
+         on='Classe Index',
+         suffixes=(f'_{year_new}', f'_{year_old}'),
+         how='outer'
+     ).fillna(0)
+     label_map = pd.concat([stats_df_new[['Classe Index', 'Classe Label']], stats_df_old[['Classe Index', 'Classe Label']]]).drop_duplicates(subset=['Classe Index']).set_index('Classe Index')
+     merged_stats['Classe Label'] = merged_stats['Classe Index'].map(label_map['Classe Label'])
+     surf_col_new = f'Surface (ha)_{year_new}'; surf_col_old = f'Surface (ha)_{year_old}'
+     perc_col_new = f'% Couverture_{year_new}'; perc_col_old = f'% Couverture_{year_old}'
+     if surf_col_new not in merged_stats.columns: merged_stats[surf_col_new] = 0
+     if surf_col_old not in merged_stats.columns: merged_stats[surf_col_old] = 0
+     if perc_col_new not in merged_stats.columns: merged_stats[perc_col_new] = 0
+     if perc_col_old not in merged_stats.columns: merged_stats[perc_col_old] = 0
+     merged_stats['Différence Surface (ha)'] = merged_stats[surf_col_new] - merged_stats[surf_col_old]
+     merged_stats['Différence % Couverture'] = merged_stats[perc_col_new] - merged_stats[perc_col_old]
+     diff_df = merged_stats[[
+         'Classe Label', surf_col_new, surf_col_old,
+         'Différence Surface (ha)', 'Différence % Couverture'
+     ]].round(2)
+     return diff_df
+
+def calculate_trend(stats_df, class_label):
+    """Calcule la tendance linéaire de la surface pour une classe donnée."""
+    if stats_df is None or stats_df.empty: return None, "Données manquantes"
+    class_stats = stats_df[stats_df['Classe Label'] == class_label].dropna(subset=['Year', 'Surface (ha)'])
+    if len(class_stats) < 2: return None, f"Pas assez de données pour {class_label}"
+    years = class_stats['Year'].values; surface = class_stats['Surface (ha)'].values
+    try:
+        coeffs = np.polyfit(years, surface, 1); slope = coeffs[0]
+        if abs(slope) < 0.1: trend_text = "Stable"
+        elif slope > 0: trend_text = f"Hausse ({slope:+.1f} ha/an)"
+        else: trend_text = f"Baisse ({slope:+.1f} ha/an)"
+        return slope, trend_text
+    except Exception as e:
+        print(f"Erreur calcul tendance pour {class_label}: {e}")
+        return None, "Erreur calcul"
+
+def _profile_to_json(profile):
+    """ Convertit un profil rasterio en dict sérialisable en JSON. """
+    data = {}
+    for name, value in dict(profile).items():
+        if name == "crs":
+            data[name] = value.to_string() if value else None
+        elif name == "transform":
+            data[name] = list(value)[:6]
+        else:
+            data[name] = value
+    return data
+
+def _profile_from_json(data):
+    """ Reconstruit un profil rasterio à partir de sa forme JSON. """
+    profile = dict(data)
+    if profile.get("crs"):
+        profile["crs"] = CRS.from_string(profile["crs"])
+    if profile.get("transform"):
+        profile["transform"] = Affine(*profile["transform"])
+    return profile
+
+
+# --- Construction des composants partagés d'après constantes ---
+
+def create_single_flight():
+    """ Regroupement des chargements concurrents, avec verrous entre workers si SINGLE_FLIGHT_FILE_LOCKS. """
+    try:
+        return SingleFlight(
+            constantes.SINGLE_FLIGHT_LOCK_DIR if constantes.SINGLE_FLIGHT_FILE_LOCKS else None,
+            lock_timeout=constantes.SINGLE_FLIGHT_LOCK_TIMEOUT
+        )
+    except OSError as e:
+        print(f"Avertissement : verrous entre workers désactivés ({constantes.SINGLE_FLIGHT_LOCK_DIR}): {e}")
+        return SingleFlight()
+
+def create_engine(storage, single_flight=None):
+    """ Moteur raster sur un stockage, avec les caches et le préchargement configurés dans constantes. """
+    memmap_store = None
+    if constantes.MEMMAP_STORE_ENABLED:
+        try:
+            memmap_store = MemmapStore(constantes.MEMMAP_STORE_DIR, constantes.MEMMAP_STORE_MAX_BYTES)
+        except OSError as e:
+            print(f"Avertissement : magasin memmap désactivé ({constantes.MEMMAP_STORE_DIR}): {e}")
+    prefetcher = None
+    if constantes.PREFETCH_ENABLED:
+        prefetcher = Prefetcher(constantes.PREFETCH_MAX_CONCURRENT, constantes.PREFETCH_MAX_BYTES)
+    return RasterEngine(
+        storage,
+        array_cache=ArrayCache(constantes.ARRAY_CACHE_MAX_BYTES),
+        memmap_store=memmap_store,
+        single_flight=single_flight or create_single_flight(),
+        prefetcher=prefetcher,
+    )
+
+
+class RasterEngine:
+    """
+    Lecture des rasters, NDVI, classification et statistiques, écrits une seule fois au-dessus d'un
+    stockage (utils/storage.py : local, S3 ou mémoire). Les caches (mémoire, memmap), le regroupement
+    des chargements concurrents, le pipeline multi-années et le préchargement s'appliquent donc
+    quel que soit le stockage. Les clés manipulées sont celles du stockage (chemin local ou clé S3).
+    """
+
+    def __init__(self, storage, array_cache=None, memmap_store=None, single_flight=None, prefetcher=None):
+        self.storage = storage
+        # Catalogue : un seul listage par worker, rafraîchi après storage.catalog_ttl
+        self.catalog = S3Catalog(storage.list_objects, ttl=storage.catalog_ttl,
+                                 list_forests=storage.list_forests,
+                                 list_forest_objects=storage.list_forest_objects,
+                                 list_manifest=storage.list_manifest)
+        self.array_cache = array_cache or ArrayCache(constantes.ARRAY_CACHE_MAX_BYTES)
+        self.memmap_store = memmap_store
+        self.single_flight = single_flight or SingleFlight()
+        self.prefetcher = prefetcher
+        # Base de stats précalculées, revérifiée après STATS_STORE_TTL_SECONDS
+        self._stats_store = None
+        self._stats_store_loaded_at = None
+        self._stats_store_lock = threading.Lock()
+
+    # --- Catalogue ---
+
+    def refresh_catalog(self):
+        """ Force le rechargement du catalogue (ex: après l'ajout de nouveaux TIFs). """
+        return self.catalog.refresh()
+
+    def get_forest_names(self):
+        """ Obtient la liste unique et triée des noms de forêts. """
+        forest_names = self.catalog.forests()
+        if not forest_names:
+            print(f"Avertissement : Aucun fichier .tif trouvé dans {self.storage.description}")
+        return forest_names
+
+    def get_available_years(self, forest_name=None):
+        """ Obtient les années disponibles filtrées par forêt (le plus récent en premier). """
+        years = self.catalog.years(forest_name)
+        if not years:
+            if forest_name:
+                 print(f"Aucun fichier .tif trouvé pour la forêt '{forest_name}' dans {self.storage.description}")
+            else:
+                 print(f"Aucun fichier .tif trouvé dans {self.storage.description}")
+        return years
+
+    def get_file_path(self, forest_name, year):
+        """ Trouve la clé (chemin local ou clé S3) du TIF d'une forêt et d'une année données. """
+        entry = self.catalog.entry(forest_name, year)
+        if entry:
+            return entry["key"]
+        print(f"Erreur : Aucun fichier trouvé pour {forest_name} en {year} dans {self.storage.description}")
+        return None
+
+    def get_initial_data(self):
+        """ Charge les listes initiales pour les sélecteurs. """
+        if not self.storage.available: return [], []
+        forests = self.get_forest_names()
+        initial_years = self.get_available_years(forests[0]) if forests else self.get_available_years()
+        return forests, initial_years
+
+    # --- Caches des tableaux décodés ---
+
+    def _array_cache_key(self, key, kind, level=0):
+        """ Clé du cache mémoire : (clé, ETag, type de tableau, niveau de résolution). """
+        entry = self.catalog.entry_for_key(key)
+        return (key, entry["etag"] if entry else None, kind, level)
+
+    def _shared_array(self, key, kind, level, compute, with_profile):
+        """
+        Charge depuis le magasin memmap la version d'un tableau publiée pour l'ETag courant ; sinon la
+        calcule avec compute() (-> (tableau, profil) si with_profile, sinon tableau) et la publie.
+        """
+        entry = self.catalog.entry_for_key(key)
+        etag = entry["etag"] if entry else None
+        if self.memmap_store is None or not etag:
+            return compute()
+
+        name = f"{kind}-{level}"
+        array, metadata = self.memmap_store.load(key, etag, name)
+        if array is None:
+            result = compute()
+            value, profile = result if with_profile else (result, None)
+            if value is None:
+                return result
+            try:
+                array, metadata = self.memmap_store.publish(
+                    key, etag, name, value, _profile_to_json(profile) if with_profile else None
+                )
+            except OSError as e:
+                print(f"Avertissement : publication memmap impossible pour {key} ({name}): {e}")
+                return result
+            if array is None:
+                return result
+        if with_profile:
+            return array, _profile_from_json(metadata or {})
+        return array
+
+    def _load_array(self, key, kind, level, compute, with_profile):
+        """
+        Tableau décodé servi par le cache mémoire, sinon par le magasin memmap, sinon calculé.
+        Les demandes simultanées d'un même tableau attendent un seul calcul et partagent son résultat.
+        """
+        cache_key = self._array_cache_key(key, kind, level)
+        return self.array_cache.get_or_compute(
+            cache_key,
+            lambda: self.single_flight.do(cache_key, lambda: self._shared_array(key, kind, level, compute, with_profile))
+        )
+
+    def get_cache_stats(self):
+        """ Compteurs des caches du moteur et du stockage (hits/misses...), pour le suivi en production. """
+        storage_stats = self.storage.stats() or {}
+        return {
+            "disk": storage_stats.get("disk"),
+            "memory": self.array_cache.stats(),
+            "single_flight": self.single_flight.stats(),
+            "prefetch": self.prefetcher.stats() if self.prefetcher else None,
+        }
+
+    # --- Lecture des rasters ---
+
+    def open_raster(self, key, partial=False):
+        """
+        Ouvre un TIF du stockage avec rasterio (à fermer par l'appelant). Retourne None s'il est illisible.
+        partial=True pour une lecture partielle (pixel, aperçu, en-tête) : en S3, lectures par plages sans
+        télécharger l'objet entier dans le cache disque.
+        """
+        return self.storage.open_raster(key, partial=partial)
+
+    def calcul_ndvi(self, key):
+        """ Calcule la matrice NDVI d'un TIF (mise en cache mémoire, en lecture seule). """
+        if not key:
+            return None, None
+        return self._load_array(key, "ndvi", 0, lambda: self._compute_ndvi(key), with_profile=True)
+
+    def _compute_ndvi(self, key, with_classes=False):
+        """
+        (NDVI, profil) d'un TIF, NaN hors forêt. Avec with_classes, (NDVI, profil, carte des classes) :
+        NDVI et classes sont alors calculés en une passe par le noyau fusionné (utils/ndvi_kernel.py).
+        """
+        failure = (None, None, None) if with_classes else (None, None)
+        try:
+            windowed = windowed_mode()
+            src = self.open_raster(key)
+            if src is None:
+                return failure # Erreur lors de la lecture
+
+            with src:
+                # Bande NDVI lue directement quand elle existe (une seule bande lue),
+                # sinon calcul à partir des bandes Rouge et NIR repérées par leurs descriptions
+                layout = band_layout(src)
+                if not layout["ndvi"] and src.count < 4:
+                    raise ValueError(f"Le fichier {key} a moins de 4 bandes")
+                if windowed:
+                    # Masque de validité lu fenêtre par fenêtre avec les bandes.
+                    # Mémoire de travail bornée par la part de RASTER_MEMORY_BUDGET_MB d'un raster (raster_budget ; le NDVI
+                    # et les classes renvoyés, entiers, s'y ajoutent), fenêtres réparties entre RASTER_WORKERS threads
+                    # (un dataset par thread, plafonnés au nombre de cœurs), résultat identique
+                    result = read_ndvi_windowed(src, layout, with_classes=with_classes, open_src=lambda: self.open_raster(key))
+                    if with_classes:
+                        return result[0], src.profile, result[1]
+                    return result, src.profile
+                # Hors forêt : NaN (ni classé, ni compté, transparent à l'affichage) et classe 0. Le masque vient
+                # de la même lecture (masque de la bande NDVI, ou bandes Rouge/NIR déjà lues) et rejoint son cache
+                ndvi, ndvi_class_map, valid = read_ndvi_with_mask(src, layout, with_classes=with_classes)
+                packed_valid = self._packed_valid(src, valid)
+                self._load_array(key, "valid", 0, lambda: packed_valid, with_profile=True)
+                if with_classes:
+                    return ndvi, src.profile, ndvi_class_map
+                return ndvi, src.profile
+
+        except RasterioIOError as e:
+            print(f"Erreur Rasterio lors de l'ouverture/lecture de {key}: {e}")
+            return failure
+        except ValueError as e:
+            print(f"Erreur lors du calcul NDVI pour {key}: {e}")
+            return failure
+        except Exception as e:
+            print(f"Erreur inattendue lors du calcul NDVI pour {key}: {e}")
+            return failure
+
+    def _ndvi_available(self, key):
+        """ Vrai si le NDVI d'un TIF est déjà calculé (cache mémoire ou magasin memmap) : inutile de relire le raster. """
+        cache_key = self._array_cache_key(key, "ndvi")
+        if self.array_cache.contains(cache_key):
+            return True
+        etag = cache_key[1]
+        return self.memmap_store is not None and bool(etag) and self.memmap_store.load(key, etag, "ndvi-0")[0] is not None
+
+    def calcul_valid_mask(self, key):
+        """
+        Masque des pixels valides d'un TIF (True = dans le polygone de la forêt), None si tous le sont
+        ou si le TIF est illisible. Mis en cache sous forme de bits (8 pixels par octet).
+        """
+        if not key:
+            return None
+        packed, shape = self._load_array(key, "valid", 0, lambda: self._compute_valid_mask(key), with_profile=True)
+        if packed is None or shape.get("all_valid"):
+            return None
+        return unpack_mask(packed, shape["width"])
+
+    def _compute_valid_mask(self, key):
+        try:
+            src = self.open_raster(key)
+            if src is None:
+                return None, None
+            with src:
+                if raster_budget() > 0:
+                    valid = self._read_valid_mask_windowed(src)
+                else:
+                    valid = read_valid_mask(src)
+                return self._packed_valid(src, valid)
+        except RasterioIOError as e:
+            print(f"Erreur Rasterio lecture du masque de validité {key}: {e}")
+            return None, None
+        except Exception as e:
+            print(f"Erreur inattendue lecture du masque de validité {key}: {e}")
+            return None, None
+
+    @staticmethod
+    def _packed_valid(src, valid):
+        """ (masque en bits, {width, height, all_valid}) tel que mis en cache par calcul_valid_mask. """
+        shape = {"width": src.width, "height": src.height, "all_valid": valid is None or bool(valid.all())}
+        if shape["all_valid"]:
+            return np.zeros((0, 0), dtype=np.uint8), shape # Mis en cache aussi : pas de relecture
+        return pack_mask(valid), shape
+
+    @staticmethod
+    def _read_valid_mask_windowed(src):
+        """ Masque de validité (voir read_valid_mask) lu par fenêtres du budget mémoire ; None si tout est valide. """
+        layout = band_layout(src)
+        valid = np.ones((src.height, src.width), dtype=bool)
+        with budget_env(raster_budget()):
+            for window in budget_windows(src, working_budget(raster_budget())):
+                window_valid = read_valid_mask(src, layout, window=window)
+                if window_valid is not None:
+                    valid[window.row_off:window.row_off + window.height] = window_valid
+        return valid
+
+    def read_rgb_bands(self, key, max_size=constantes.RGB_DISPLAY_MAX_SIZE):
+        """
+        Lit les bandes RGB d'un TIF, redimensionnées si l'image est trop grande pour l'affichage
+        (mise en cache mémoire par résolution d'affichage).
+        """
+        if not key:
+            return None, None
+        return self._load_array(key, "rgb", max_size, lambda: self._read_rgb_bands(key, max_size), with_profile=True)
+
+    def _read_rgb_bands(self, key, max_size):
+        try:
+            # Aperçu réduit : lecture partielle (en S3, plages des seuls aperçus du COG) ;
+            # pleine résolution : lecture complète, copie locale via le cache disque
+            src = self.open_raster(key, partial=True)
+            if src is not None and max(src.height, src.width) <= max_size:
+                src.close()
+                src = self.open_raster(key)
+            if src is None:
+                return None, None
+
+            with src:
+                if src.count < 3:
+                    print(f"ERREUR: Moins de 3 bandes dans {key}, impossible de lire RGB.")
+                    return None, None
+
+                band_r_idx, band_g_idx, band_b_idx = band_layout(src)["rgb"]
+                print(f"Lecture bandes RGB {key}: R={band_r_idx}, G={band_g_idx}, B={band_b_idx}")
+
+                # Redimensionner si trop grand pour éviter de saturer la mémoire
+                height, width = src.height, src.width
+                if max(height, width) > max_size:
+                    scale = max_size / max(height, width)
+                    new_height = int(height * scale)
+                    new_width = int(width * scale)
+                    print(f"Redimensionnement RGB: ({height}x{width}) -> ({new_height}x{new_width})")
+                    rgb_bands = read_bands(
+                        src,
+                        [band_r_idx, band_g_idx, band_b_idx],
+                        out_shape=(3, new_height, new_width),
+                        resampling=Resampling.bilinear
+                    )
+                    self._mask_rgb(src, rgb_bands, out_shape=rgb_bands.shape[1:])
+                elif raster_budget() > 0:
+                    # Mode fenêtré : seule l'image de sortie est allouée en entier
+                    rgb_bands = np.empty((3, height, width), dtype=np.float32)
+                    with budget_env(raster_budget()):
+                        for window in budget_windows(src, working_budget(raster_budget()), RGB_WINDOW_BYTES_PER_PIXEL):
+                            rows = slice(window.row_off, window.row_off + window.height)
+                            window_bands = read_bands(src, [band_r_idx, band_g_idx, band_b_idx], window=window)
+                            rgb_bands[:, rows] = self._mask_rgb(src, window_bands, window=window)
+                else:
+                    rgb_bands = read_bands(src, [band_r_idx, band_g_idx, band_b_idx])
+                    self._mask_rgb(src, rgb_bands, out_shape=rgb_bands.shape[1:])
+
+                rgb_image = np.moveaxis(rgb_bands, 0, -1)
+                return rgb_image, src.profile
+
+        except RasterioIOError as e:
+            print(f"Erreur Rasterio ouverture/lecture RGB {key}: {e}")
+            return None, None
+        except IndexError:
+            print(f"ERREUR: Index de bande RGB ({band_r_idx},{band_g_idx},{band_b_idx}) invalide pour {key}")
+            return None, None
+        except Exception as e:
+            print(f"Erreur inattendue lecture RGB {key}: {e}")
+            return None, None
+
+    @staticmethod
+    def _mask_rgb(src, rgb_bands, **kwargs):
+        """ Pixels hors forêt d'après le masque stocké (ou nodata) : noirs, comme le remplissage du découpage. """
+        valid = read_valid_mask(src, zero_fill=False, **kwargs)
+        if valid is not None:
+            rgb_bands[:, ~valid] = 0
+        return np.nan_to_num(rgb_bands, copy=False)
+
+    def _encoded_class_map(self, key):
+        """
+        Carte des classes NDVI d'un TIF sous forme compacte (utils/class_codec.py, CLASS_MAP_CODEC) :
+        (tampon uint8, métadonnées), calculée une seule fois tant qu'elle reste en cache.
+        """
+        def compute():
+            if self._ndvi_available(key):
+                ndvi_matrix, _ = self.calcul_ndvi(key)
+                ndvi_class_map = classify_ndvi(ndvi_matrix, self.calcul_valid_mask(key))
+            else:
+                # NDVI et classes en une passe ; le NDVI rejoint les caches comme l'aurait fait calcul_ndvi
+                ndvi_matrix, profile, ndvi_class_map = self._compute_ndvi(key, with_classes=True)
+                if ndvi_matrix is not None:
+                    self._load_array(key, "ndvi", 0, lambda: (ndvi_matrix, profile), with_profile=True)
+            if ndvi_class_map is None:
+                return None, None
+            return encode_class_map(ndvi_class_map, constantes.CLASS_MAP_CODEC)
+        return self._load_array(key, "class", 0, compute, with_profile=True)
+
+    def calcul_class_map(self, key):
+        """ Carte des classes NDVI d'un TIF (uint8), décodée depuis sa forme compacte en cache. """
+        if not key:
+            return None
+        encoded, metadata = self._encoded_class_map(key)
+        if encoded is None:
+            return None
+        return decode_class_map(encoded, metadata)
+
+    def calcul_class_counts(self, key):
+        """ Nombre de pixels par classe d'un TIF ({classe: pixels}), calculé sans décoder la carte de classes. """
+        if not key:
+            return None
+        if windowed_mode() and not self.array_cache.contains(self._array_cache_key(key, "class")):
+            # Mode fenêtré : effectifs issus des stats accumulées par fenêtres (stats annuelles sans image entière)
+            stats = self.calcul_class_ndvi_stats(key)
+            if stats is None:
+                return None
+            return {class_index: int(count) for class_index, count in enumerate(stats[COUNT]) if count}
+        encoded, metadata = self._encoded_class_map(key)
+        if encoded is None:
+            return None
+        counts = class_counts(encoded, metadata, minlength=max(constantes.NDVI_CLASSES) + 1)
+        return {class_index: int(count) for class_index, count in enumerate(counts) if count}
+
+    def calcul_class_ndvi_stats(self, key):
+        """
+        Statistiques compactes par classe d'un TIF (utils/class_stats.py : effectifs, sommes, min et max du NDVI),
+        calculées en une passe sur la carte de classes et le NDVI, puis gardées en cache. À convertir avec stats_frame.
+        """
+        if not key:
+            return None
+
+        def compute():
+            if windowed_mode() and not self._ndvi_available(key):
+                # Mode fenêtré : stats accumulées fenêtre par fenêtre, sans NDVI ni carte de classes entiers
+                return self._stream_class_stats(key)
+            ndvi_matrix, _ = self.calcul_ndvi(key)
+            ndvi_class_map = self.calcul_class_map(key)
+            if ndvi_matrix is None or ndvi_class_map is None:
+                return None
+            return accumulate_class_stats(ndvi_class_map, ndvi_matrix)
+        return self._load_array(key, "classstats", 0, compute, with_profile=False)
+
+    def _stream_class_stats(self, key):
+        try:
+            src = self.open_raster(key)
+            if src is None:
+                return None
+            with src:
+                layout = band_layout(src)
+                if not layout["ndvi"] and src.count < 4:
+                    raise ValueError(f"Le fichier {key} a moins de 4 bandes")
+                return stream_class_stats(src, layout, open_src=lambda: self.open_raster(key))
+        except RasterioIOError as e:
+            print(f"Erreur Rasterio lors de l'ouverture/lecture de {key}: {e}")
+            return None
+        except ValueError as e:
+            print(f"Erreur lors du calcul des stats pour {key}: {e}")
+            return None
+        except Exception as e:
+            print(f"Erreur inattendue lors du calcul des stats pour {key}: {e}")
+            return None
+
+    # --- Statistiques annuelles ---
+
+    def _forest_sources(self, forest_name):
+        """ {année: ETag du TIF} d'une forêt d'après le catalogue. """
+        return {year: self.catalog.entry(forest_name, year)["etag"] for year in self.catalog.years(forest_name)}
+
+    def open_cube(self, forest_name):
+        """
+        Cube multi-années de la forêt (utils/forest_cube.py) s'il est à jour, c'est-à-dire s'il contient
+        exactement les années du catalogue aux mêmes ETags ; None sinon (les TIFs sont alors relus).
+        """
+        if not constantes.FOREST_CUBE_ENABLED or not forest_name:
+            return None
+        cube = self.storage.open_cube(forest_name)
+        if cube is None:
+            return None
+        if not cube.matches(self._forest_sources(forest_name)):
+            print(f"Cube de {forest_name} périmé (années ou TIFs modifiés), lecture des TIFs.")
+            return None
+        return cube
+
+    def get_stats_store(self):
+        """ Base de stats précalculées du stockage (utils/stats_store.py), ou None si absente ou incompatible. """
+        if not constantes.STATS_STORE_ENABLED:
+            return None
+        with self._stats_store_lock:
+            loaded_at = self._stats_store_loaded_at
+            if loaded_at is None or time.monotonic() - loaded_at >= constantes.STATS_STORE_TTL_SECONDS:
+                path = self.storage.stats_store_path()
+                store = StatsStore(path) if path else None
+                if store is not None and not store.is_compatible():
+                    print(f"Base de stats {path} ignorée (version ou seuils de classes différents).")
+                    store = None
+                self._stats_store, self._stats_store_loaded_at = store, time.monotonic()
+            return self._stats_store
+
+    def _stored_stats(self, forest_name, sources):
+        """ (stats stockées à jour, années à calculer) pour les années {année: ETag} d'une forêt. """
+        store = self.get_stats_store()
+        if store is None:
+            return pd.DataFrame(), list(sources)
+        try:
+            return store.forest_stats(forest_name, sources)
+        except (sqlite3.Error, pd.errors.DatabaseError) as e:
+            print(f"Erreur de lecture de la base de stats ({store.path}): {e}")
+            return pd.DataFrame(), list(sources)
+
+    def get_year_stats(self, forest_name, year):
+        """
+        Stats par classe (pixels, surface, %) d'une forêt pour une année : lues dans la base précalculée
+        si elle est à jour pour ce TIF, sinon tirées de la carte de classes compacte (cache partagé).
+        """
+        entry = self.catalog.entry(forest_name, year)
+        if not entry:
+            return pd.DataFrame()
+        stats_df, missing = self._stored_stats(forest_name, {entry["year"]: entry["etag"]})
+        if not missing:
+            return stats_df
+        counts = self.calcul_class_counts(entry["key"])
+        if counts is None:
+            return pd.DataFrame()
+        stats_df = class_stats_from_counts(counts)
+        if not stats_df.empty:
+            stats_df['Year'] = entry["year"]
+        return stats_df
+
+    def load_all_year_stats(self, forest_name):
+        """
+        Charge TOUTES les stats annuelles d'une forêt : depuis la base de stats précalculées pour les années
+        à jour, puis depuis son cube multi-années s'il est à jour, sinon à partir des TIFs. Les lectures des
+        années restantes se font alors en parallèle et chaque calcul (NDVI, classification, stats) démarre
+        dès que son TIF est disponible.
+        """
+        if not self.storage.available: return pd.DataFrame()
+        available_years = self.get_available_years(forest_name)
+        stored_stats_df, missing_years = self._stored_stats(forest_name, self._forest_sources(forest_name))
+        if not missing_years:
+            print(f"Stats annuelles de {forest_name} lues dans la base de stats, années: {available_years}")
+            return stored_stats_df
+        cube = self.open_cube(forest_name)
+        if cube is not None:
+            print(f"Stats annuelles de {forest_name} lues dans le cube, années: {sorted(cube.years, reverse=True)}")
+            return self._cube_year_stats(cube)
+        missing_years = sorted(missing_years, reverse=True)
+        print(f"Calcul des stats annuelles pour {forest_name} ({self.storage.name}), années: {missing_years}")
+
+        def fetch(year):
+            key = self.get_file_path(forest_name, year)
+            if not key:
+                raise ValueError(f"Erreur: Fichier TIF non trouvé pour {year}.")
+            if not self.array_cache.contains(self._array_cache_key(key, "class")):
+                self.storage.fetch(key) # Ex: téléchargement vers le cache disque (sans effet en local)
+            return key
+
+        def compute(year, key):
+            # Effectifs tirés de la carte de classes compacte (cache partagé avec la vue NDVI), sans la décoder
+            counts = self.calcul_class_counts(key)
+            if counts is None:
+                raise ValueError("Erreur: Calcul NDVI/classification échoué.")
+            stats_df_year = class_stats_from_counts(counts)
+            if stats_df_year.empty:
+                raise ValueError("Stats vides après classification.")
+            stats_df_year['Year'] = year
+            return stats_df_year
+
+        results = run_year_pipeline(missing_years, fetch, compute,
+                                    io_workers=constantes.YEAR_PIPELINE_IO_WORKERS,
+                                    cpu_workers=constantes.YEAR_PIPELINE_CPU_WORKERS)
+        all_stats = [stored_stats_df] if not stored_stats_df.empty else []
+        for year, stats_df_year, error in results:
+            print(f"  Année {year}:")
+            if error:
+                print(f"    -> {error}")
+                continue
+            all_stats.append(stats_df_year)
+            print(f"    -> Stats calculées.")
+
+        if not all_stats: return pd.DataFrame()
+        full_stats_df = pd.concat(all_stats, ignore_index=True)
+        if not stored_stats_df.empty:
+            full_stats_df = full_stats_df.sort_values(['Year', 'Classe Index'], ascending=[False, True], ignore_index=True)
+        return full_stats_df
+
+    @staticmethod
+    def _cube_year_stats(cube):
+        """ Stats annuelles à partir des effectifs par classe du cube (aucun TIF ouvert). """
+        all_stats = []
+        for year, counts in sorted(cube.class_counts().items(), reverse=True):
+            stats_df_year = class_stats_from_counts(counts)
+            if stats_df_year.empty:
+                continue
+            stats_df_year['Year'] = year
+            all_stats.append(stats_df_year)
+        if not all_stats: return pd.DataFrame()
+        return pd.concat(all_stats, ignore_index=True)
+
+    # --- Préchargement en arrière-plan ---
+
+    def foreground_request(self, func):
+        """ Décorateur des callbacks : les préchargements attendent la fin des requêtes utilisateur en cours. """
+        if self.prefetcher is None:
+            return func
+        return self.prefetcher.foreground_task(func)
+
+    def _prefetch_array(self, key, kind):
+        """ Planifie le calcul d'un tableau (ndvi, class ou rgb) s'il n'est pas déjà en cache mémoire. """
+        level = constantes.RGB_DISPLAY_MAX_SIZE if kind == "rgb" else 0
+        if not key or self.array_cache.contains(self._array_cache_key(key, kind, level)):
+            return
+        loaders = {
+            "ndvi": lambda: self.calcul_ndvi(key),
+            "class": lambda: self._encoded_class_map(key),
+            "rgb": lambda: self.read_rgb_bands(key, constantes.RGB_DISPLAY_MAX_SIZE),
+        }
+        entry = self.catalog.entry_for_key(key)
+        self.prefetcher.submit((key, kind), entry.get("size") if entry else None, loaders[kind])
+
+    def prefetch_after_request(self, forest_name, year, view_type, mode=None):
+        """
+        Après un affichage (forêt, année), précharge en arrière-plan ce que l'utilisateur demandera
+        probablement ensuite : les années voisines (curseur), l'année de comparaison par défaut
+        et la dernière année de la forêt la plus consultée.
+        """
+        if self.prefetcher is None or not forest_name or not year:
+            return
+        self.prefetcher.record_access(forest_name)
+        view_kinds = ["rgb"] if view_type == "rgb" else ["ndvi", "class"]
+
+        available_years = self.catalog.years(forest_name) # Ordre décroissant
+        if year in available_years:
+            index = available_years.index(year)
+            for neighbour in available_years[max(0, index - 1):index] + available_years[index + 1:index + 2]:
+                for kind in view_kinds:
+                    self._prefetch_array(self.get_file_path(forest_name, neighbour), kind)
+        # Année 2 proposée par défaut en mode comparaison (la plus récente différente de l'année 1)
+        comparison_year = next((y for y in available_years if y != year), None)
+        if comparison_year is not None:
+            self._prefetch_array(self.get_file_path(forest_name, comparison_year), "class")
+
+        next_forest = self.prefetcher.most_accessed(exclude=forest_name)
+        if next_forest:
+            next_years = self.catalog.years(next_forest)
+            if next_years:
+                for kind in view_kinds:
+                    self._prefetch_array(self.get_file_path(next_forest, next_years[0]), kind)
+
+    # --- Évolution d'un pixel ---
+
+    def get_raster_metadata(self, forest_name, year):
+        """
+        Retourne les métadonnées de géoréférencement (crs, transform, width, height) d'un raster.
+        Elles viennent du manifeste si disponible, sinon de l'en-tête du TIF.
+        """
+        entry = self.catalog.entry(forest_name, year)
+        if not entry:
+            return None
+        if entry.get("crs") and entry.get("transform"):
+            return {
+                "crs": entry["crs"],
+                "transform": Affine(*entry["transform"]),
+                "width": entry["width"],
+                "height": entry["height"],
+            }
+
+        try:
+            src = self.open_raster(entry["key"], partial=True) # En-tête seul
+            if src is None:
+                return None
+            with src:
+                return {"crs": src.crs, "transform": src.transform, "width": src.width, "height": src.height}
+        except RasterioIOError as e:
+            print(f"Erreur ouverture {entry['key']} pour métadonnées: {e}")
+            return None
+
+    def get_forest_grid(self, forest_name):
+        """
+        Grille canonique d'une forêt (utils/grid_alignment.py) : union des emprises et plus fine résolution
+        de ses années, dont les dimensions peuvent varier. Retourne None si aucune année n'est lisible.
+        """
+        grids = [self.get_raster_metadata(forest_name, year) for year in self.get_available_years(forest_name)]
+        grids = [grid for grid in grids if grid is not None]
+        return canonical_grid(grids) if grids else None
+
+    @staticmethod
+    def _pixel_position(metadata, lat, lon, label):
+        """ (ligne, colonne) du point (lat, lon) dans la grille décrite par metadata, ou None s'il en sort. """
+        point_geom = {'type': 'Point', 'coordinates': (lon, lat)}
+        try:
+            coords_raster = transform_geom("EPSG:4326", metadata["crs"], point_geom, precision=6)
+            raster_x, raster_y = coords_raster['coordinates']
+            row, col = rasterio.transform.rowcol(metadata["transform"], raster_x, raster_y)
+        except Exception as e:
+            print(f"Erreur lors de la conversion des coordonnées pour {label}: {e}")
+            return None
+        if not (0 <= row < metadata["height"] and 0 <= col < metadata["width"]):
+            print(f"Avertissement: Coordonnées ({row}, {col}) hors limites pour {label} ({metadata['height']}x{metadata['width']})")
+            return None
+        return row, col
+
+    def get_pixel_evolution(self, forest_name, lat, lon):
+        """
+        Récupère le NDVI du pixel aux coordonnées (lat, lon) pour toutes les années disponibles.
+        Avec un cube à jour, la série est lue d'un coup dans le cube ; sinon chaque TIF est ouvert et la
+        position du pixel est calculée à partir des métadonnées du manifeste quand il existe.
+        Retourne une liste de tuples (année, valeur) ou None en cas d'erreur.
+        """
+        available_years = self.get_available_years(forest_name)
+        if not available_years:
+            print(f"Aucune année trouvée pour {forest_name}")
+            return None
+
+        cube = self.open_cube(forest_name)
+        if cube is not None:
+            # Une seule conversion de coordonnées (grille commune) et une lecture par année dans le cube
+            metadata = {"crs": cube.meta["crs"], "transform": Affine(*cube.meta["transform"]),
+                        "width": cube.width, "height": cube.height}
+            position = self._pixel_position(metadata, lat, lon, "le cube")
+            if position is None:
+                return [(year, np.nan) for year in sorted(available_years)]
+            try:
+                return cube.pixel_series(*position)
+            except Exception as e:
+                print(f"Erreur de lecture du cube de {forest_name}, lecture des TIFs: {e}")
+
+        pixel_values = []
+        for year in available_years:
+            metadata = self.get_raster_metadata(forest_name, year)
+            if metadata is None:
+                pixel_values.append((year, np.nan))
+                continue
+            position = self._pixel_position(metadata, lat, lon, year)
+            if position is None:
+                pixel_values.append((year, np.nan))
+                continue
+            row, col = position
+
+            try:
+                # En lecture par plages, seul le bloc contenant le pixel est récupéré
+                src = self.open_raster(self.get_file_path(forest_name, year), partial=True)
+                if src is None:
+                    pixel_values.append((year, np.nan))
+                    continue
+                with src:
+                    # NaN si le pixel est hors forêt cette année-là (masque lu avec la bande NDVI)
+                    ndvi, _, _ = read_ndvi_with_mask(src, window=Window(col, row, 1, 1))
+                    pixel_values.append((year, float(ndvi[0, 0])))
+            except Exception as e:
+                print(f"Erreur I/O lecture pixel {year}: {e}")
+                pixel_values.append((year, np.nan))
+
+        # Trier par année
+        pixel_values.sort(key=lambda item: item[0])
+        return pixel_values
@@ -0,0 +1,236 @@
+import os
+import time
+import threading
+
+# Préfixe et suffixe des noms de fichiers produits par le script d'ingestion
+FILE_PREFIX = "Foret_Classee_de_"
+FOREST_SUFFIX = "_01-01"
+# Version du format du manifeste publié par data_preprocessing/04.build_manifest.py
+MANIFEST_VERSION = 1
+# Arborescence partitionnée : <préfixe>forest=<nom>/year=<aaaa>/<nom du fichier>
+FOREST_PARTITION = "forest="
+YEAR_PARTITION = "year="
+# Index de redirection (ancienne clé à plat -> nouvelle clé) écrit par data_preprocessing/05.migrate_partitioned_layout.py
+REDIRECTS_FILENAME = "redirects.json"
+
+
+def extract_forest_name(basename):
+    """ Extrait le nom de la forêt d'un nom de fichier (None si le format n'est pas reconnu). """
+    try:
+        return basename.split(FILE_PREFIX)[1].split(FOREST_SUFFIX)[0]
+    except IndexError:
+        return None
+
+
+def extract_year(basename):
+    """ Extrait l'année (int) d'un nom de fichier (None si le format n'est pas reconnu). """
+    year_str = basename.split(".tif")[0].split("-")[-1]
+    return int(year_str) if year_str.isdigit() else None
+
+
+def forest_prefix(prefix, forest_name):
+    """ Préfixe de la partition d'une forêt (ex: 'raster/forest=Mbao/'). """
+    return f"{prefix}{FOREST_PARTITION}{forest_name}/"
+
+
+def partitioned_key(prefix, forest_name, year, basename):
+    """ Clé d'un raster dans l'arborescence partitionnée forêt/année (le nom du fichier est conservé). """
+    return f"{forest_prefix(prefix, forest_name)}{YEAR_PARTITION}{int(year)}/{basename}"
+
+
+def forest_from_prefix(common_prefix):
+    """ Nom de forêt d'un préfixe de partition ('.../forest=Mbao/' -> 'Mbao'), ou None. """
+    last = common_prefix.rstrip("/").rsplit("/", 1)[-1]
+    if not last.startswith(FOREST_PARTITION):
+        return None
+    return last[len(FOREST_PARTITION):] or None
+
+
+def forest_from_key(key):
+    """ Nom de forêt d'une clé : partition 'forest=' si présente, sinon nom du fichier. """
+    for part in key.split("/")[:-1]:
+        if part.startswith(FOREST_PARTITION):
+            return part[len(FOREST_PARTITION):]
+    return extract_forest_name(os.path.basename(key))
+
+
+def manifest_to_objects(manifest):
+    """
+    Convertit un manifeste publié en liste d'objets au format du listage S3.
+    Les métadonnées raster (bandes, CRS, transform, dimensions...) sont placées sous 'Metadata'.
+    """
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"Version de manifeste non supportée: {manifest.get('version')}")
+    objects = []
+    for item in manifest["objects"]:
+        metadata = {name: value for name, value in item.items() if name not in ("key", "etag", "size")}
+        objects.append({"Key": item["key"], "ETag": item["etag"], "Size": item["size"], "Metadata": metadata})
+    return objects
+
+
+class S3Catalog:
+    """
+    Index en mémoire des rasters disponibles : forêt -> année -> {key, etag, size}.
+    Construit à partir du manifeste publié (list_manifest) ou, à défaut, d'un seul listage, puis servi
+    sans appel réseau jusqu'à expiration du TTL (ou appel explicite à refresh()).
+    Sans manifeste, avec list_forests et list_forest_objects (arborescence partitionnée), seul le listage
+    des forêts est global : l'index d'une forêt est chargé à sa première consultation par un listage
+    limité à sa partition, et expire indépendamment des autres.
+    """
+
+    def __init__(self, list_objects, ttl=600, list_forests=None, list_forest_objects=None, list_manifest=None):
+        # list_objects() retourne une liste de dicts au format S3 ({'Key', 'ETag', 'Size'},
+        # plus 'Metadata' optionnel) ou None en cas d'erreur (l'index précédent est alors conservé)
+        self._list_objects = list_objects
+        # list_manifest() retourne les objets du manifeste (même format) ou None sans manifeste :
+        # essayé en premier, il évite tout LIST (forêts comme objets)
+        self._list_manifest = list_manifest
+        # list_forests() retourne les forêts partitionnées ([] si l'arborescence est à plat, None en cas d'erreur)
+        # et list_forest_objects(forêt) les objets d'une partition, au même format que list_objects()
+        self._list_forests = list_forests
+        self._list_forest_objects = list_forest_objects
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._index = {}
+        self._by_key = {}
+        self._loaded_at = None
+        self._partitioned = False
+        self._forest_names = []
+        self._forest_loaded_at = {}
+
+    def _expired(self, loaded_at):
+        if loaded_at is None:
+            return True
+        if self.ttl is None:
+            return False
+        return time.monotonic() - loaded_at >= self.ttl
+
+    def _is_stale(self):
+        return self._expired(self._loaded_at)
+
+    @staticmethod
+    def _build(objects):
+        """ Construit (index forêt -> année -> entrée, index clé -> entrée) à partir d'un listage. """
+        index, by_key = {}, {}
+        for obj in objects:
+            key = obj['Key']
+            if not key.lower().endswith('.tif'):
+                continue
+            basename = os.path.basename(key)
+            forest_name = forest_from_key(key)
+            year = extract_year(basename)
+            if forest_name is None or year is None:
+                print(f"Avertissement : Impossible d'extraire forêt/année de la clé S3 {key} (basename: {basename})")
+                continue
+            # Métadonnées raster éventuelles (présentes si le catalogue vient du manifeste)
+            entry = dict(obj.get('Metadata') or {})
+            entry.update({
+                "key": key,
+                "forest": forest_name,
+                "year": year,
+                "etag": obj.get('ETag', '').strip('"'),
+                "size": obj.get('Size'),
+            })
+            # En cas de doublon forêt/année, on garde la première clé listée (comme avant)
+            index.setdefault(forest_name, {}).setdefault(year, entry)
+            by_key[key] = entry
+        return index, by_key
+
+    def refresh(self):
+        """ Reconstruit l'index à partir d'un nouveau listage. Retourne False si le listage a échoué. """
+        objects = self._list_manifest() if self._list_manifest is not None else None
+        if objects is None and self._list_forests is not None:
+            forest_names = self._list_forests()
+            if forest_names is None:
+                print("Avertissement : listage des forêts échoué, le catalogue précédent est conservé.")
+                return False
+            if forest_names:
+                # Arborescence partitionnée : les index des forêts seront rechargés à la demande
+                with self._lock:
+                    self._partitioned = True
+                    self._forest_names = sorted(forest_names)
+                    self._index, self._by_key, self._forest_loaded_at = {}, {}, {}
+                    self._loaded_at = time.monotonic()
+                return True
+
+        if objects is None:
+            objects = self._list_objects()
+        if objects is None:
+            print("Avertissement : listage échoué, le catalogue précédent est conservé.")
+            return False
+
+        index, by_key = self._build(objects)
+        with self._lock:
+            self._partitioned = False
+            self._index = index
+            self._by_key = by_key
+            self._loaded_at = time.monotonic()
+        return True
+
+    def _ensure_fresh(self):
+        if self._is_stale():
+            # Un seul thread relance le listage, les autres attendent son résultat
+            with self._refresh_lock:
+                if self._is_stale():
+                    self.refresh()
+
+    def _forest_index(self, forest_name):
+        """ Index année -> entrée d'une forêt (listage de sa seule partition si besoin). """
+        self._ensure_fresh()
+        if not self._partitioned:
+            return self._index.get(forest_name, {})
+        if forest_name not in self._forest_names:
+            return {}
+        if self._expired(self._forest_loaded_at.get(forest_name)):
+            with self._refresh_lock:
+                if self._expired(self._forest_loaded_at.get(forest_name)):
+                    self._load_forest(forest_name)
+        return self._index.get(forest_name, {})
+
+    def _load_forest(self, forest_name):
+        objects = self._list_forest_objects(forest_name)
+        if objects is None:
+            print(f"Avertissement : listage de la forêt {forest_name} échoué, son index précédent est conservé.")
+            return False
+        index, by_key = self._build(objects)
+        with self._lock:
+            by_key_all = {key: entry for key, entry in self._by_key.items() if entry["forest"] != forest_name}
+            by_key_all.update(by_key)
+            self._by_key = by_key_all
+            self._index = {**self._index, forest_name: index.get(forest_name, {})}
+            self._forest_loaded_at[forest_name] = time.monotonic()
+        return True
+
+    def forests(self):
+        """ Liste triée des forêts présentes dans le catalogue. """
+        self._ensure_fresh()
+        if self._partitioned:
+            return list(self._forest_names)
+        return sorted(self._index)
+
+    def years(self, forest_name=None):
+        """ Années disponibles (la plus récente en premier), pour une forêt ou pour toutes. """
+        if forest_name:
+            years = set(self._forest_index(forest_name))
+        else:
+            years = {year for name in self.forests() for year in self._forest_index(name)}
+        return sorted(years, reverse=True)
+
+    def entry(self, forest_name, year):
+        """ Retourne {key, etag, size, ...} pour une forêt et une année, ou None. """
+        try:
+            return self._forest_index(forest_name).get(int(year))
+        except (TypeError, ValueError):
+            return None
+
+    def entry_for_key(self, key):
+        """ Retourne l'entrée du catalogue pour une clé S3, ou None. """
+        self._ensure_fresh()
+        entry = self._by_key.get(key)
+        if entry is None and self._partitioned:
+            forest_name = forest_from_key(key)
+            if forest_name:
+                self._forest_index(forest_name)
+                entry = self._by_key.get(key)
+        return entry
@@ -0,0 +1,44 @@
+import threading
+
+import boto3
+from botocore.config import Config
+
+import utils.constantes as constantes
+
+_lock = threading.Lock()
+_clients = {}
+
+
+def s3_client_config(max_pool_connections=None):
+    """
+    Configuration botocore commune : pool de connexions dimensionné pour la concurrence du dashboard
+    (les connexions TLS sont réutilisées d'un appel à l'autre), relances en mode adaptatif,
+    keepalive TCP et délais d'attente bornés.
+    """
+    return Config(
+        max_pool_connections=max_pool_connections or constantes.S3_MAX_POOL_CONNECTIONS,
+        retries={"mode": "adaptive", "max_attempts": constantes.S3_MAX_ATTEMPTS},
+        tcp_keepalive=True,
+        connect_timeout=constantes.S3_CONNECT_TIMEOUT,
+        read_timeout=constantes.S3_READ_TIMEOUT,
+    )
+
+
+def get_s3_client(region_name=None, aws_access_key_id=None, aws_secret_access_key=None, max_pool_connections=None):
+    """
+    Retourne le client S3 partagé pour ces paramètres (créé au premier appel).
+    Un client boto3 est thread-safe une fois créé, mais pas sa création : elle se fait sous verrou,
+    avec une session dédiée. Chaque worker gunicorn (processus) crée donc un seul client.
+    """
+    cache_key = (region_name, aws_access_key_id, aws_secret_access_key, max_pool_connections)
+    with _lock:
+        client = _clients.get(cache_key)
+        if client is None:
+            session = boto3.session.Session(
+                aws_access_key_id=aws_access_key_id,
+                aws_secret_access_key=aws_secret_access_key,
+                region_name=region_name,
+            )
+            client = session.client("s3", config=s3_client_config(max_pool_connections))
+            _clients[cache_key] = client
+        return client
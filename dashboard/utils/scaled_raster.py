@@ -0,0 +1,136 @@
+import numpy as np
+import rasterio
+from rasterio.enums import MaskFlags
+from utils.cog import write_cog, convert_to_cog
+
+# Profil de stockage compact : entiers 16 bits + facteurs d'échelle GDAL par bande (valeur = brut * scale + offset)
+SCALED_PROFILE = "scaled_int16"
+STORAGE_PROFILE_TAG = "STORAGE_PROFILE"
+QUANTITY_TAG = "QUANTITY"
+# Un GeoTIFF n'a qu'un type de données pour toutes ses bandes : réflectances et NDVI sont donc en int16
+SCALED_DTYPE = "int16"
+SCALED_NODATA = -32768
+# Réflectance 0..1 -> 0..10000 (plage utile -3.2767..3.2767), NDVI -1..1 -> -10000..10000
+QUANTITY_SCALES = {"reflectance": 1e-4, "ndvi": 1e-4}
+
+
+def band_quantity(description):
+    """ Grandeur stockée dans une bande d'après sa description : "ndvi" ou "reflectance". """
+    return "ndvi" if description and "ndvi" in description.lower() else "reflectance"
+
+
+def encode_scaled(data, band_descriptions=None, nodata=None):
+    """
+    Convertit un tableau flottant (bandes, lignes, colonnes) en int16 mis à l'échelle.
+    Les NaN et les valeurs nodata deviennent SCALED_NODATA.
+    Retourne (tableau int16, scales, offsets, grandeurs).
+    """
+    descriptions = list(band_descriptions or []) + [None] * data.shape[0]
+    quantities = [band_quantity(descriptions[i]) for i in range(data.shape[0])]
+    scales = [QUANTITY_SCALES[quantity] for quantity in quantities]
+    encoded = np.empty(data.shape, dtype=SCALED_DTYPE)
+    limit = np.iinfo(SCALED_DTYPE).max
+    for i in range(data.shape[0]):
+        band = data[i].astype(np.float64)
+        invalid = np.isnan(band)
+        if nodata is not None and not np.isnan(nodata):
+            invalid |= band == nodata
+        scaled = np.clip(np.rint(np.where(invalid, 0, band) / scales[i]), -limit, limit)
+        encoded[i] = np.where(invalid, SCALED_NODATA, scaled)
+    return encoded, scales, [0.0] * data.shape[0], quantities
+
+
+def is_scaled(src):
+    """ Vrai si le raster ouvert stocke des entiers mis à l'échelle (facteurs d'échelle non triviaux). """
+    if not np.issubdtype(np.dtype(src.dtypes[0]), np.integer):
+        return False
+    return any(scale != 1 for scale in src.scales) or any(offset != 0 for offset in src.offsets)
+
+
+def scaled_int16_band(src, index):
+    """
+    (scale, offset, nodata) de la bande index (1..count) si elle est stockée en int16 mis à l'échelle,
+    None sinon : ses valeurs peuvent alors être décodées et classées par tables (utils/ndvi_kernel.py).
+    """
+    if src.dtypes[index - 1] != SCALED_DTYPE or not is_scaled(src):
+        return None
+    return src.scales[index - 1], src.offsets[index - 1], src.nodata
+
+
+def shares_linear_scale(src, indexes):
+    """
+    Vrai si les bandes ont le même facteur d'échelle et aucun décalage : un rapport comme le NDVI,
+    (b - a) / (b + a), se calcule alors directement sur les valeurs brutes, sans remise à l'échelle.
+    """
+    scales = {src.scales[i - 1] for i in indexes}
+    return len(scales) == 1 and all(src.offsets[i - 1] == 0 for i in indexes)
+
+
+def read_bands(src, indexes, unscale=True, out=None, **kwargs):
+    """
+    Lit des bandes (liste d'indices) en float32, quel que soit le profil de stockage.
+    Pour un raster mis à l'échelle, les pixels nodata valent NaN et les valeurs ne sont remises
+    à l'échelle (brut * scale + offset) que si unscale ; les rasters flottants sont lus tels quels.
+    out : tampon float32 (bandes, lignes, colonnes) préalloué à remplir, lu directement par GDAL
+    pour un raster float32. kwargs est transmis à src.read (window, out_shape, resampling...).
+    """
+    if out is not None and src.dtypes[0] == "float32":
+        return src.read(indexes, out=out, **kwargs)
+    raw = src.read(indexes, **kwargs)
+    if out is None:
+        data = raw.astype(np.float32)
+    else:
+        data = out
+        np.copyto(data, raw, casting="unsafe")
+    if not is_scaled(src):
+        return data
+    if src.nodata is not None:
+        data[raw == src.nodata] = np.nan
+    if unscale:
+        scales = np.array([src.scales[i - 1] for i in indexes], dtype=np.float32)
+        offsets = np.array([src.offsets[i - 1] for i in indexes], dtype=np.float32)
+        data *= scales[:, None, None]
+        data += offsets[:, None, None]
+    return data
+
+
+def write_scaled_raster(data, profile, output_path, band_descriptions=None, tags=None, **cog_options):
+    """
+    Écrit un tableau flottant au profil compact (COG int16 mis à l'échelle, scale/offset dans les métadonnées).
+    Retourne True si le fichier a été écrit, False en cas d'erreur.
+    """
+    encoded, scales, offsets, quantities = encode_scaled(data, band_descriptions, profile.get("nodata"))
+    out_profile = profile.copy()
+    out_profile.update({"dtype": SCALED_DTYPE, "nodata": SCALED_NODATA})
+    return write_cog(encoded, out_profile, output_path, band_descriptions=band_descriptions,
+                     scales=scales, offsets=offsets, tags=dict(tags or {}, **{STORAGE_PROFILE_TAG: SCALED_PROFILE}),
+                     band_tags=[{QUANTITY_TAG: quantity} for quantity in quantities], **cog_options)
+
+
+def convert_to_scaled(input_path, output_path=None, valid_mask=None, **cog_options):
+    """
+    Convertit un GeoTIFF flottant existant au profil compact (en place si output_path est omis).
+    valid_mask (pixels valides) est écrit comme masque interne ; par défaut, celui du fichier source.
+    Un fichier déjà au profil compact est seulement remis en page COG.
+    Retourne True si la conversion a réussi, False sinon.
+    """
+    output_path = output_path or input_path
+    try:
+        with rasterio.open(input_path) as src:
+            already_scaled = is_scaled(src)
+            if not already_scaled:
+                data = src.read()
+                profile = src.profile.copy()
+                descriptions = src.descriptions
+                tags = src.tags()
+                # Masque interne de validité (pixels hors forêt) conservé
+                if valid_mask is None and MaskFlags.per_dataset in src.mask_flag_enums[0]:
+                    valid_mask = src.dataset_mask() > 0
+    except Exception as e:
+        print(f"Erreur lors de la lecture de {input_path}: {e}")
+        return False
+    if already_scaled:
+        # Seule la mise en page COG est éventuellement à refaire
+        return convert_to_cog(input_path, output_path, **cog_options)
+    return write_scaled_raster(data, profile, output_path, band_descriptions=descriptions, tags=tags,
+                               valid_mask=valid_mask, **cog_options)
@@ -0,0 +1,116 @@
+import os
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl  # verrous de fichiers entre processus (indisponible sous Windows)
+except ImportError:
+    fcntl = None
+
+# Intervalle entre deux tentatives de prise du verrou fichier
+LOCK_POLL_SECONDS = 0.05
+
+
+class _Call:
+    """ Calcul en cours pour une clé : les appels concurrents attendent son résultat. """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Regroupe les appels concurrents identiques : pour une même clé, un seul appel (le premier)
+    exécute la fonction, les autres attendent et reçoivent son résultat (ou son exception).
+    Avec lock_dir, le premier appel de chaque processus prend en plus un verrou fichier (fcntl.flock)
+    propre à la clé : les autres workers gunicorn attendent la fin du calcul, puis retrouvent
+    le résultat publié dans les caches partagés (cache disque, magasin memmap).
+    Les fichiers de verrou (vides) sont conservés : les supprimer ouvrirait une course entre workers.
+    """
+
+    def __init__(self, lock_dir=None, lock_timeout=120):
+        self.lock_dir = lock_dir if fcntl is not None else None
+        self.lock_timeout = lock_timeout
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+        self.lock_waits = 0
+
+    def do(self, key, fn):
+        """ Exécute fn() pour cette clé, ou attend l'exécution déjà en cours et partage son résultat. """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.leaders += 1
+            else:
+                self.followers += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            with self._file_lock(key):
+                call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    @contextmanager
+    def _file_lock(self, key):
+        """ Verrou exclusif entre processus pour une clé ; sans effet si lock_dir est absent. """
+        if not self.lock_dir:
+            yield
+            return
+        name = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()[:32]
+        fd = os.open(os.path.join(self.lock_dir, f"{name}.lock"), os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            locked = False
+            deadline = time.monotonic() + self.lock_timeout
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    locked = True
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        # Un worker bloqué ne doit pas geler les autres : on calcule sans le verrou
+                        print(f"Avertissement : verrou non obtenu après {self.lock_timeout}s pour {key}")
+                        break
+                    with self._lock:
+                        self.lock_waits += 1
+                    time.sleep(LOCK_POLL_SECONDS)
+            try:
+                yield
+            finally:
+                if locked:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def stats(self):
+        """ Compteurs : appels exécutés, appels ayant partagé un calcul en cours, attentes de verrou fichier. """
+        with self._lock:
+            return {
+                "leaders": self.leaders,
+                "followers": self.followers,
+                "lock_waits": self.lock_waits,
+                "in_flight": len(self._calls),
+            }
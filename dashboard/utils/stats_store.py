@@ -0,0 +1,117 @@
+import json
+import sqlite3
+import hashlib
+from contextlib import closing
+
+import pandas as pd
+
+import utils.constantes as constantes
+
+# Base SQLite des statistiques par forêt / année / classe, construite hors ligne par
+# data_preprocessing/08.build_stats_store.py et publiée à côté des rasters
+STATS_STORE_FILENAME = "stats.sqlite"
+STATS_STORE_VERSION = 1
+# Colonnes des DataFrames de stats du dashboard (class_stats_from_counts + 'Year')
+STATS_COLUMNS = {
+    "class_index": "Classe Index",
+    "class_label": "Classe Label",
+    "pixel_count": "Pixel Count",
+    "surface_ha": "Surface (ha)",
+    "percent": "% Couverture",
+    "year": "Year",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS sources (
+    forest TEXT NOT NULL, year INTEGER NOT NULL, etag TEXT NOT NULL,
+    PRIMARY KEY (forest, year)
+);
+CREATE TABLE IF NOT EXISTS class_stats (
+    forest TEXT NOT NULL, year INTEGER NOT NULL, class_index INTEGER NOT NULL, class_label TEXT NOT NULL,
+    pixel_count INTEGER NOT NULL, surface_ha REAL NOT NULL, percent REAL NOT NULL,
+    PRIMARY KEY (forest, year, class_index)
+);
+"""
+
+
+def classification_signature():
+    """ Empreinte des seuils de classes et de la surface d'un pixel : les stats stockées n'ont de sens qu'avec les mêmes. """
+    payload = json.dumps({
+        "classes": {str(index): details["range"] for index, details in constantes.NDVI_CLASSES.items()},
+        "pixel_surface_m2": constantes.PIXEL_SURFACE_M2,
+    }, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class StatsStore:
+    """
+    Statistiques annuelles précalculées (pixels, surface en ha, % par classe), chacune associée à l'ETag du
+    TIF dont elle est issue : une ligne n'est servie que si l'ETag correspond encore au catalogue.
+    Lecture seule côté dashboard (une connexion par requête, utilisable depuis tous les threads).
+    """
+
+    def __init__(self, path, readonly=True):
+        self.path = path
+        self.readonly = readonly
+        if not readonly:
+            with closing(self._connect()) as connection, connection:
+                connection.executescript(SCHEMA)
+                connection.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?), ('classification', ?)",
+                                   (str(STATS_STORE_VERSION), classification_signature()))
+
+    def _connect(self):
+        if self.readonly:
+            return sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        return sqlite3.connect(self.path)
+
+    def is_compatible(self):
+        """ Vrai si la base a la version attendue et a été construite avec les seuils de classes actuels. """
+        try:
+            with closing(self._connect()) as connection:
+                meta = dict(connection.execute("SELECT name, value FROM meta").fetchall())
+        except sqlite3.Error as e:
+            print(f"Avertissement : base de stats illisible ({self.path}): {e}")
+            return False
+        return meta.get("version") == str(STATS_STORE_VERSION) and meta.get("classification") == classification_signature()
+
+    def sources(self, forest_name):
+        """ {année: ETag} des années stockées pour une forêt. """
+        with closing(self._connect()) as connection:
+            rows = connection.execute("SELECT year, etag FROM sources WHERE forest = ?", (forest_name,)).fetchall()
+        return {year: etag for year, etag in rows}
+
+    def forest_stats(self, forest_name, sources):
+        """
+        Stats stockées d'une forêt pour les années {année: ETag} demandées dont l'ETag est à jour.
+        Retourne (DataFrame au format du dashboard, années manquantes ou périmées).
+        """
+        stored = self.sources(forest_name)
+        fresh = sorted((year for year, etag in sources.items() if stored.get(year) == etag), reverse=True)
+        missing = [year for year in sources if year not in fresh]
+        if not fresh:
+            return pd.DataFrame(), missing
+        placeholders = ",".join("?" * len(fresh))
+        query = (f"SELECT {', '.join(STATS_COLUMNS)} FROM class_stats WHERE forest = ? AND year IN ({placeholders}) "
+                 "ORDER BY year DESC, class_index")
+        with closing(self._connect()) as connection:
+            stats_df = pd.read_sql_query(query, connection, params=[forest_name, *fresh])
+        return stats_df.rename(columns=STATS_COLUMNS), missing
+
+    def put_year(self, forest_name, year, etag, stats_df):
+        """ Remplace les stats d'une forêt / année (DataFrame de class_stats_from_counts) et l'ETag de leur TIF. """
+        rows = [(forest_name, int(year), int(row["Classe Index"]), row["Classe Label"], int(row["Pixel Count"]),
+                 float(row["Surface (ha)"]), float(row["% Couverture"])) for _, row in stats_df.iterrows()]
+        with closing(self._connect()) as connection, connection:
+            connection.execute("DELETE FROM class_stats WHERE forest = ? AND year = ?", (forest_name, int(year)))
+            connection.executemany("INSERT INTO class_stats VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            connection.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?)", (forest_name, int(year), etag))
+
+    def prune(self, forest_name, years):
+        """ Supprime les années d'une forêt absentes du catalogue (TIF supprimé). Retourne le nombre d'années retirées. """
+        removed = set(self.sources(forest_name)) - set(years)
+        with closing(self._connect()) as connection, connection:
+            for year in removed:
+                connection.execute("DELETE FROM class_stats WHERE forest = ? AND year = ?", (forest_name, year))
+                connection.execute("DELETE FROM sources WHERE forest = ? AND year = ?", (forest_name, year))
+        return len(removed)
@@ -0,0 +1,471 @@
+import io
+import os
+import json
+import time
+import hashlib
+import threading
+
+import rasterio
+from rasterio.errors import RasterioIOError
+from botocore.exceptions import ClientError
+
+import utils.constantes as constantes
+from utils.s3_catalog import (manifest_to_objects, forest_prefix, forest_from_prefix,
+                              FOREST_PARTITION, REDIRECTS_FILENAME)
+from utils.ranged_reader import RangeOpener, s3_range_fetcher
+from utils.forest_cube import (ForestCube, open_local_cube, cube_key, CUBE_DIRNAME, CUBE_META_FILENAME,
+                               CUBE_VERSION)
+from utils.stats_store import STATS_STORE_FILENAME
+
+
+class StorageBackend:
+    """
+    Interface commune des sources de rasters utilisées par le moteur (utils/raster_engine.py) :
+    - list_manifest() : objets du manifeste publié, au format de list_objects() ; None sans manifeste
+      (le catalogue se replie alors sur les listages ci-dessous) ;
+    - list_objects() : liste de dicts au format du listage S3 ({'Key', 'ETag', 'Size'}, plus
+      'Metadata' optionnel), ou None en cas d'erreur ;
+    - list_forests() / list_forest_objects(forêt) : listages limités à une partition forêt
+      (arborescence partitionnée ; [] par défaut, le catalogue utilise alors list_objects()) ;
+    - open_raster(key, partial) : dataset rasterio ouvert (à fermer par l'appelant), ou None ; partial=True
+      annonce une lecture partielle (pixel, fenêtre, aperçu, en-tête) qui ne justifie pas de copie complète ;
+    - fetch(key) : prépare une lecture prochaine (ex: téléchargement vers le cache disque) ;
+    - open_cube(forêt) : cube multi-années de la forêt (utils/forest_cube.py), ou None s'il n'existe pas ;
+    - stats_store_path() : chemin local de la base de stats précalculées (utils/stats_store.py), ou None.
+    L'ETag identifie une version de l'objet : il sert de clé aux caches du moteur.
+    """
+
+    name = "stockage"
+    # Durée de validité du catalogue construit à partir de list_objects() (None = jamais expiré)
+    catalog_ttl = None
+
+    @property
+    def available(self):
+        return True
+
+    @property
+    def description(self):
+        return self.name
+
+    def list_manifest(self):
+        return None
+
+    def list_objects(self):
+        raise NotImplementedError
+
+    def list_forests(self):
+        return []
+
+    def list_forest_objects(self, forest_name):
+        raise NotImplementedError
+
+    def open_raster(self, key, partial=False):
+        raise NotImplementedError
+
+    def fetch(self, key):
+        """ Sans effet par défaut : l'objet est lu directement à l'ouverture. """
+        return None
+
+    def open_cube(self, forest_name):
+        return None
+
+    def stats_store_path(self):
+        return None
+
+    def stats(self):
+        return None
+
+
+class LocalStorage(StorageBackend):
+    """
+    Rasters d'un dossier local (ex: constantes.DATA_DIR). Les clés sont les chemins des fichiers :
+    GDAL les lit directement, via le cache de pages du système, sans copie préalable.
+    L'ETag est dérivé de la date de modification et de la taille : réécrire un fichier invalide les caches.
+    """
+
+    name = "local"
+
+    def __init__(self, root, catalog_ttl=None):
+        self.root = root
+        self.catalog_ttl = catalog_ttl
+
+    @property
+    def description(self):
+        return f"le dossier {self.root}"
+
+    def list_objects(self):
+        if not os.path.isdir(self.root):
+            print(f"Avertissement : dossier de données introuvable: {self.root}")
+            return None
+        objects = []
+        for entry in os.scandir(self.root):
+            if not entry.is_file() or not entry.name.lower().endswith(".tif"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            objects.append({
+                "Key": entry.path,
+                "ETag": f"{stat.st_mtime_ns:x}-{stat.st_size:x}",
+                "Size": stat.st_size,
+            })
+        # Tri pour que la règle du catalogue (premier fichier gardé en cas de doublon) soit stable
+        return sorted(objects, key=lambda obj: obj["Key"])
+
+    def open_raster(self, key, partial=False):
+        return rasterio.open(key)
+
+    def open_cube(self, forest_name):
+        """ Cube du sous-dossier cubes/<forêt>/, projeté en mémoire. """
+        return open_local_cube(os.path.join(self.root, CUBE_DIRNAME, forest_name))
+
+    def stats_store_path(self):
+        path = os.path.join(self.root, STATS_STORE_FILENAME)
+        return path if os.path.isfile(path) else None
+
+
+class MemoryStorage(StorageBackend):
+    """ Rasters gardés en mémoire (clé -> octets du TIF) : tests et mesures de performance sans disque ni réseau. """
+
+    name = "mémoire"
+
+    def __init__(self, objects=None):
+        self._objects = {}
+        self._lock = threading.Lock()
+        for key, data in (objects or {}).items():
+            self.put(key, data)
+
+    def put(self, key, data):
+        with self._lock:
+            self._objects[key] = bytes(data)
+
+    def list_objects(self):
+        with self._lock:
+            items = sorted(self._objects.items())
+        return [{"Key": key, "ETag": hashlib.md5(data).hexdigest(), "Size": len(data)} for key, data in items]
+
+    def open_raster(self, key, partial=False):
+        with self._lock:
+            data = self._objects.get(key)
+        if data is None:
+            print(f"Erreur: objet absent du stockage mémoire: {key}")
+            return None
+        # rasterio copie le contenu dans un MemoryFile, libéré à la fermeture du dataset
+        return rasterio.open(io.BytesIO(data))
+
+
+class S3Storage(StorageBackend):
+    """
+    Rasters d'un préfixe S3. Le catalogue vient du manifeste publié (un seul GET, sans LIST), qu'il
+    pointe vers l'arborescence partitionnée ou à plat ; à défaut, les listages sont limités à une forêt
+    dans l'arborescence partitionnée (forest=<nom>/year=<aaaa>/), sinon c'est le listage paginé de tout le préfixe. Les lectures complètes (NDVI, RGB, stats) passent par le cache disque
+    (téléchargement de l'objet au premier accès) ; les lectures partielles (pixel, fenêtre, aperçu, en-tête)
+    utilisent la copie locale si elle existe déjà, sinon des plages HTTP (range_reads). À défaut, l'objet est
+    téléchargé entièrement en mémoire.
+    """
+
+    name = "S3"
+
+    def __init__(self, client, bucket, prefix, disk_cache=None, single_flight=None,
+                 range_reads=True, block_size=constantes.RANGE_READ_BLOCK_SIZE,
+                 use_manifest=True, catalog_ttl=constantes.S3_CATALOG_TTL_SECONDS):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.disk_cache = disk_cache
+        self.single_flight = single_flight
+        self.range_reads = range_reads
+        self.use_manifest = use_manifest
+        self.catalog_ttl = catalog_ttl
+        # Version (ETag, taille) de chaque objet d'après le dernier listage réussi
+        self._objects = {}
+        # Opener rasterio : GDAL ne récupère que les plages d'octets (en-tête, bandes, fenêtres) dont il a besoin
+        self.range_opener = RangeOpener(self._object_size, self._make_fetcher, block_size=block_size)
+        # cube.json parsé de chaque forêt ({forêt: (instant, meta ou None si absent)}), relu après catalog_ttl
+        self._cube_metas = {}
+        self._cube_metas_lock = threading.Lock()
+
+    @property
+    def available(self):
+        return self.client is not None
+
+    @property
+    def description(self):
+        return f"S3 (Bucket: {self.bucket}, Prefix: {self.prefix})"
+
+    # --- Listage ---
+
+    def _list_objects_details(self, prefix=None):
+        """
+        Liste tous les objets S3 (dicts 'Key', 'ETag', 'Size') d'un préfixe (par défaut celui du stockage,
+        gère la pagination). Retourne None en cas d'erreur.
+        """
+        if not self.client:
+            print("Erreur: Client S3 non initialisé.")
+            return None
+
+        prefix = self.prefix if prefix is None else prefix
+        objects = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        try:
+            pages = paginator.paginate(Bucket=self.bucket, Prefix=prefix)
+            for page in pages:
+                if 'Contents' in page:
+                    objects.extend(page['Contents'])
+            return objects
+        except Exception as e:
+            print(f"Erreur lors du listage des objets S3 (Bucket: {self.bucket}, Prefix: {prefix}): {e}")
+            return None
+
+    def list_forests(self):
+        """
+        Forêts de l'arborescence partitionnée, d'après les préfixes communs 'forest=<nom>/' (un listage
+        avec délimiteur, sans parcourir les objets). [] si le bucket est encore à plat, None en cas d'erreur.
+        """
+        if not self.client:
+            print("Erreur: Client S3 non initialisé.")
+            return None
+        forest_names = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        try:
+            pages = paginator.paginate(Bucket=self.bucket, Prefix=self.prefix + FOREST_PARTITION, Delimiter="/")
+            for page in pages:
+                for common_prefix in page.get('CommonPrefixes', []):
+                    forest_name = forest_from_prefix(common_prefix['Prefix'])
+                    if forest_name:
+                        forest_names.append(forest_name)
+            return forest_names
+        except Exception as e:
+            print(f"Erreur lors du listage des forêts S3 (Bucket: {self.bucket}, Prefix: {self.prefix}): {e}")
+            return None
+
+    def list_forest_objects(self, forest_name):
+        """ Objets de la partition d'une forêt (le coût ne dépend que des données de cette forêt). """
+        objects = self._list_objects_details(forest_prefix(self.prefix, forest_name))
+        if objects is not None:
+            self._remember(objects)
+        return objects
+
+    def _remember(self, objects):
+        """ Retient (ETag, taille) des objets listés, pour les lectures par plages et le cache disque. """
+        versions = {obj['Key']: (obj.get('ETag', '').strip('"'), obj.get('Size')) for obj in objects}
+        self._objects = {**self._objects, **versions}
+
+    def _read_redirects(self):
+        """ Index de redirection (ancienne clé -> nouvelle clé) écrit lors de la migration, ou {} s'il est absent. """
+        key = self.prefix + REDIRECTS_FILENAME
+        try:
+            s3_object = self.client.get_object(Bucket=self.bucket, Key=key)
+            return json.loads(s3_object['Body'].read()).get("redirects", {})
+        except self.client.exceptions.NoSuchKey:
+            return {}
+        except Exception as e:
+            print(f"Erreur lors de la lecture de l'index de redirection (Bucket: {self.bucket}, Key: {key}): {e}")
+            return {}
+
+    def _read_manifest(self):
+        """Lit le manifeste JSON publié à côté des rasters. Retourne None s'il est absent ou illisible."""
+        if not self.client:
+            return None
+        key = self.prefix + constantes.MANIFEST_FILENAME
+        try:
+            s3_object = self.client.get_object(Bucket=self.bucket, Key=key)
+            return json.loads(s3_object['Body'].read())
+        except self.client.exceptions.NoSuchKey:
+            print(f"Manifeste absent (Bucket: {self.bucket}, Key: {key}), repli sur le listage S3.")
+            return None
+        except Exception as e:
+            print(f"Erreur lors de la lecture du manifeste (Bucket: {self.bucket}, Key: {key}): {e}")
+            return None
+
+    def list_manifest(self):
+        """
+        Objets du manifeste publié (clés à plat redirigées vers l'arborescence partitionnée si la migration
+        a eu lieu après sa construction), ou None s'il est désactivé, absent ou invalide.
+        """
+        if not self.use_manifest:
+            return None
+        manifest = self._read_manifest()
+        if manifest is None:
+            return None
+        try:
+            objects = manifest_to_objects(manifest)
+        except (KeyError, ValueError) as e:
+            print(f"Manifeste invalide, repli sur le listage S3: {e}")
+            return None
+        # Un manifeste antérieur à la migration pointe vers les anciennes clés à plat
+        redirects = self._read_redirects()
+        for obj in objects:
+            obj['Key'] = redirects.get(obj['Key'], obj['Key'])
+        self._objects = {}
+        self._remember(objects)
+        return objects
+
+    def list_objects(self):
+        """Listage complet du préfixe (repli du catalogue quand aucun manifeste n'est publié)."""
+        objects = self._list_objects_details()
+        if objects is not None:
+            self._objects = {}
+            self._remember(objects)
+        return objects
+
+    def _object_size(self, key):
+        """ Taille d'un objet d'après le listage (None pour les fichiers annexes absents, ex: .aux.xml). """
+        version = self._objects.get(key)
+        return version[1] if version else None
+
+    def _object_etag(self, key):
+        version = self._objects.get(key)
+        return version[0] if version else None
+
+    def _make_fetcher(self, key):
+        return s3_range_fetcher(self.client, self.bucket, key, etag=self._object_etag(key))
+
+    # --- Lecture ---
+
+    def _read_object_to_bytesio(self, key):
+        """Lit un objet S3 et le retourne comme un objet BytesIO."""
+        if not self.client:
+            print("Erreur: Client S3 non initialisé.")
+            return None
+        try:
+            s3_object = self.client.get_object(Bucket=self.bucket, Key=key)
+            return io.BytesIO(s3_object['Body'].read())
+        except self.client.exceptions.NoSuchKey:
+            print(f"Erreur: Clé S3 non trouvée (Bucket: {self.bucket}, Key: {key})")
+            return None
+        except Exception as e:
+            print(f"Erreur lors de la lecture de l'objet S3 (Bucket: {self.bucket}, Key: {key}): {e}")
+            return None
+
+    def fetch(self, key):
+        """
+        Retourne le chemin d'une copie locale à jour de l'objet S3, en la téléchargeant si besoin.
+        Une copie à l'ETag du listage est servie sans appel réseau ; une copie plus ancienne est
+        revalidée par un GET conditionnel (If-None-Match). Retourne None si le cache est désactivé,
+        si l'objet dépasse le budget ou en cas d'erreur.
+        """
+        if self.disk_cache is None or not self.client:
+            return None
+        etag, size = self._objects.get(key, (None, None))
+        if etag:
+            path = self.disk_cache.get(self.bucket, key, etag)
+            if path:
+                return path
+            if size and size > self.disk_cache.max_bytes:
+                return None
+        if self.single_flight is None:
+            return self._download_to_disk_cache(key, etag)
+        # Un seul téléchargement par objet, même si plusieurs callbacks (ou workers) le demandent en même temps
+        return self.single_flight.do(("telechargement", key), lambda: self._download_to_disk_cache(key, etag))
+
+    def _download_to_disk_cache(self, key, expected_etag):
+        """ Télécharge (ou revalide) la copie locale d'un objet S3 ; appelé par un seul appelant à la fois. """
+        params = {"Bucket": self.bucket, "Key": key}
+        cached_etag, cached_path = self.disk_cache.find(self.bucket, key)
+        if expected_etag and cached_etag == expected_etag:
+            # Un autre worker a publié la copie pendant l'attente du verrou
+            return cached_path
+        if cached_etag:
+            params["IfNoneMatch"] = f'"{cached_etag}"'
+        try:
+            s3_object = self.client.get_object(**params)
+            etag = s3_object['ETag'].strip('"')
+            return self.disk_cache.put_stream(self.bucket, key, etag, s3_object['Body'], size=s3_object.get('ContentLength'))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('304', 'NotModified'):
+                return self.disk_cache.revalidated(cached_path)
+            print(f"Erreur lors du téléchargement vers le cache disque (Key: {key}): {e}")
+            return None
+        except Exception as e:
+            print(f"Erreur lors du téléchargement vers le cache disque (Key: {key}): {e}")
+            return None
+
+    def _cached_copy(self, key):
+        """ Chemin de la copie locale à l'ETag du listage si elle existe déjà (sans téléchargement), sinon None. """
+        etag = self._object_etag(key)
+        if self.disk_cache is None or not etag:
+            return None
+        return self.disk_cache.get(self.bucket, key, etag)
+
+    def open_raster(self, key, partial=False):
+        """
+        Dataset rasterio d'un objet S3. Lecture partielle (partial=True) : seules les plages demandées par GDAL
+        sont récupérées, l'objet entier n'est ni téléchargé ni mis dans le cache disque.
+        """
+        if not self.client:
+            print("Erreur: Client S3 non initialisé.")
+            return None
+        ranged = self.range_reads and self._object_size(key) is not None
+        cached_path = self._cached_copy(key) if partial and ranged else self.fetch(key)
+        if cached_path:
+            try:
+                return rasterio.open(cached_path)
+            except RasterioIOError as e:
+                # Copie locale corrompue (ex: disque plein) : on repasse par S3
+                print(f"Avertissement : copie locale illisible pour {key}: {e}")
+        if ranged:
+            return rasterio.open(key, opener=self.range_opener)
+
+        file_like_object = self._read_object_to_bytesio(key)
+        if file_like_object is None:
+            return None
+        try:
+            # rasterio copie le contenu dans un MemoryFile, le BytesIO peut être fermé
+            return rasterio.open(file_like_object)
+        finally:
+            file_like_object.close()
+
+    def _cube_meta(self, forest_name):
+        """
+        cube.json parsé d'une forêt, ou None si le cube est absent ou d'une autre version. Le résultat (absence
+        comprise) est gardé catalog_ttl secondes, comme le catalogue : pas de GET à chaque rendu ou clic.
+        Une erreur de lecture n'est pas gardée (nouvel essai au prochain appel).
+        """
+        with self._cube_metas_lock:
+            cached = self._cube_metas.get(forest_name)
+        if cached is not None and (self.catalog_ttl is None or time.monotonic() - cached[0] < self.catalog_ttl):
+            return cached[1]
+        key = cube_key(self.prefix, forest_name, CUBE_META_FILENAME)
+        try:
+            meta = json.loads(self.client.get_object(Bucket=self.bucket, Key=key)['Body'].read())
+        except self.client.exceptions.NoSuchKey:
+            meta = None
+        except Exception as e:
+            print(f"Erreur lors de la lecture du cube (Bucket: {self.bucket}, Key: {key}): {e}")
+            return None
+        if meta is not None and meta.get("version") != CUBE_VERSION:
+            print(f"Avertissement : version de cube non supportée (Key: {key}): {meta.get('version')}")
+            meta = None
+        with self._cube_metas_lock:
+            self._cube_metas[forest_name] = (time.monotonic(), meta)
+        return meta
+
+    def open_cube(self, forest_name):
+        """
+        Cube publié sous <préfixe>cubes/<forêt>/ : cube.json (mis en cache, voir _cube_meta), puis des lectures
+        par plages des seules tranches (années, lignes, pixels) demandées.
+        """
+        if not self.client:
+            return None
+        meta = self._cube_meta(forest_name)
+        if meta is None:
+            return None
+
+        def read_range(filename, start, end):
+            fetch_range = s3_range_fetcher(self.client, self.bucket, cube_key(self.prefix, forest_name, filename))
+            return fetch_range(start, end)
+        return ForestCube(meta, read_range=read_range)
+
+    def stats_store_path(self):
+        """ Copie locale (cache disque, revalidée par ETag) de la base de stats publiée sous <préfixe>stats.sqlite. """
+        if self.disk_cache is None:
+            return None
+        return self.fetch(self.prefix + STATS_STORE_FILENAME)
+
+    def stats(self):
+        return {
+            "disk": self.disk_cache.stats() if self.disk_cache else None,
+            "range_reads": {"requests": self.range_opener.requests, "bytes_fetched": self.range_opener.bytes_fetched},
+        }
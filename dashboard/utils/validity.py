@@ -0,0 +1,97 @@
+import numpy as np
+from rasterio.enums import MaskFlags
+import utils.constantes as constantes
+from utils.bands import band_layout, read_ndvi, read_red_nir, read_scaled_ndvi_band
+from utils.ndvi_kernel import ndvi_into, ndvi_classes_into, classify_into, lookup_into
+
+
+def has_stored_mask(src):
+    """ Vrai si le raster porte sa propre validité : valeur nodata, masque interne (écrit à l'ingestion) ou alpha. """
+    return MaskFlags.all_valid not in src.mask_flag_enums[0]
+
+
+def read_valid_mask(src, layout=None, zero_fill=None, **kwargs):
+    """
+    Masque des pixels valides (True = dans le polygone de la forêt) d'un raster ouvert.
+    Le masque stocké est utilisé s'il existe ; sinon, pour les TIFs découpés sans nodata
+    (pixels hors polygone remplis de 0), un pixel est invalide si ses bandes Rouge et NIR valent 0
+    exactement (zero_fill, VALID_MASK_ZERO_FILL par défaut).
+    Retourne None si tous les pixels sont considérés valides. kwargs : window, out_shape...
+    """
+    if has_stored_mask(src):
+        return src.dataset_mask(**kwargs) > 0
+    if zero_fill is None:
+        zero_fill = constantes.VALID_MASK_ZERO_FILL
+    if not zero_fill:
+        return None
+    layout = layout or band_layout(src)
+    if max(layout["red"], layout["nir"]) > src.count:
+        return None
+    bands = src.read([layout["red"], layout["nir"]], **kwargs)
+    return np.any(bands != 0, axis=0)
+
+
+def read_ndvi_with_mask(src, layout=None, with_classes=False, zero_fill=None, **kwargs):
+    """
+    NDVI (NaN hors forêt), carte des classes (0 hors forêt, None sans with_classes) et masque de validité
+    (None si tout est valide) d'un raster ouvert, lus dans la même passe et le même dataset :
+    - bande NDVI présente : seule cette bande est lue ; validité d'après son masque (nodata ou masque interne),
+      sinon, pour les TIFs remplis de 0 sans nodata (zero_fill), un NDVI exactement nul est hors forêt.
+      Au profil compact (int16), NDVI et classes viennent des tables de la bande brute (bands.read_scaled_ndvi_band) ;
+    - sinon : bandes Rouge et NIR lues une fois, validité d'après leurs masques ou, à défaut, Rouge et NIR nuls.
+    kwargs : window, out_shape...
+    """
+    layout = layout or band_layout(src)
+    if zero_fill is None:
+        zero_fill = constantes.VALID_MASK_ZERO_FILL
+    stored = has_stored_mask(src)
+    valid = None
+    if layout["ndvi"]:
+        raw, tables = read_scaled_ndvi_band(src, layout, kwargs)
+        ndvi = read_ndvi(src, layout, **kwargs) if raw is None else lookup_into(
+            raw, tables[0], np.empty(raw.shape, dtype=np.float32))
+        if stored:
+            valid = src.read_masks(layout["ndvi"], **kwargs) > 0
+        elif zero_fill:
+            valid = ndvi != 0
+        if valid is not None:
+            ndvi[~valid] = np.nan
+        classes = None
+        if with_classes and raw is not None:
+            classes = lookup_into(raw, tables[1], np.empty(raw.shape, dtype=np.uint8))
+            if valid is not None:
+                classes[~valid] = 0
+        elif with_classes:
+            classes = classify_into(ndvi, np.empty(ndvi.shape, dtype=np.uint8))
+    else:
+        red_band, nir_band = read_red_nir(src, layout, kwargs)
+        if stored:
+            valid = (src.read_masks(layout["red"], **kwargs) > 0) & (src.read_masks(layout["nir"], **kwargs) > 0)
+        elif zero_fill:
+            valid = (red_band != 0) | (nir_band != 0)
+        ndvi = np.empty(red_band.shape, dtype=np.float32)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if with_classes:
+                ndvi, classes = ndvi_classes_into(red_band, nir_band, ndvi, np.empty(ndvi.shape, dtype=np.uint8), valid)
+            else:
+                ndvi, classes = ndvi_into(red_band, nir_band, ndvi), None
+                if valid is not None:
+                    ndvi[~valid] = np.nan
+    if valid is not None and valid.all():
+        valid = None
+    return ndvi, classes, valid
+
+
+def read_masked_ndvi(src):
+    """ NDVI d'un raster ouvert (voir bands.read_ndvi) avec NaN hors du masque de validité. """
+    return read_ndvi_with_mask(src)[0]
+
+
+def pack_mask(valid):
+    """ Masque booléen (lignes, colonnes) -> bits (8 pixels par octet), pour le cache. """
+    return np.packbits(valid, axis=-1)
+
+
+def unpack_mask(packed, width):
+    """ Inverse de pack_mask. """
+    return np.unpackbits(packed, axis=-1, count=width).astype(bool)
@@ -0,0 +1,326 @@
+import os
+import time
+import threading
+import contextlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import rasterio
+from rasterio.env import get_gdal_config, set_gdal_config
+from rasterio.windows import Window
+import utils.constantes as constantes
+import utils.class_stats as class_stats
+from utils.bands import band_layout
+from utils.validity import read_ndvi_with_mask
+from utils.class_stats import chunk_partials, merge_class_stats, empty_stats, chunk_rows
+from utils.compute_backend import get_backend
+from utils.ranged_reader import DEFAULT_BLOCK_SIZE, DEFAULT_MAX_BLOCKS
+
+# Octets de mémoire de travail par pixel d'une fenêtre (NDVI + classes + stats) : bandes Rouge/NIR float32 (8),
+# lecture brute int16 et pixels nodata (6), masque de validité (2), NDVI et classes de la fenêtre (5),
+# temporaires du noyau fusionné (index searchsorted, masques : 11) ; arrondi au-dessus
+WINDOW_BYTES_PER_PIXEL = 32
+# Octets par pixel pour la lecture RGB (3 bandes float32, brut, masque de validité)
+RGB_WINDOW_BYTES_PER_PIXEL = 24
+# Part du budget réservée au cache de blocs GDAL (GDAL_CACHEMAX, 5 % de la RAM par défaut) : un quart.
+# Ce cache est alloué par GDAL, hors des tableaux numpy des fenêtres qui se partagent le reste
+GDAL_CACHE_BUDGET_DIVISOR = 4
+
+
+def memory_budget():
+    """
+    Budget de mémoire de travail (octets) du mode fenêtré pour tout le processus, 0 si désactivé
+    (RASTER_MEMORY_BUDGET_MB). Il borne les fenêtres en cours et le cache de blocs GDAL (gdal_cache_bytes, fixé
+    par budget_env), pas les tableaux de sortie entiers (NDVI, classes, RGB affichés) qui s'y ajoutent.
+    Les scripts traitent un raster à la fois ; le dashboard le partage entre ses rasters (raster_budget).
+    """
+    return int(constantes.RASTER_MEMORY_BUDGET_MB * 2**20)
+
+
+def concurrent_rasters():
+    """ Rasters calculés en même temps par le dashboard : les YEAR_PIPELINE_CPU_WORKERS années des stats annuelles. """
+    return max(1, constantes.YEAR_PIPELINE_CPU_WORKERS)
+
+
+def raster_budget():
+    """
+    Budget (octets) d'un raster calculé par le dashboard : memory_budget() partagé entre les concurrent_rasters()
+    années calculées en parallèle, pour que leurs fenêtres et le cache de blocs GDAL tiennent ensemble dans le budget.
+    """
+    return memory_budget() // concurrent_rasters()
+
+
+def gdal_cache_bytes(budget_bytes):
+    """ Cache de blocs GDAL accordé par un budget (octets), 0 sans budget. """
+    return max(0, budget_bytes) // GDAL_CACHE_BUDGET_DIVISOR
+
+
+def working_budget(budget_bytes):
+    """ Part d'un budget laissée aux fenêtres une fois le cache de blocs GDAL réservé. """
+    return budget_bytes - gdal_cache_bytes(budget_bytes)
+
+
+# Lectures fenêtrées en cours et GDAL_CACHEMAX à rétablir après la dernière (le cache GDAL est global au processus)
+_gdal_cache_lock = threading.Lock()
+_gdal_cache_state = {"users": 0, "previous": None}
+
+
+@contextlib.contextmanager
+def budget_env(budget_bytes):
+    """
+    Contexte des lectures fenêtrées : cache de blocs GDAL (GDAL_CACHEMAX, en octets) limité à gdal_cache_bytes(budget_bytes).
+    Le cache étant global au processus, la plus petite limite des lectures en cours s'applique et la valeur
+    précédente est rétablie à la sortie de la dernière. Sans budget, le cache de GDAL reste tel quel.
+    """
+    if budget_bytes <= 0:
+        yield
+        return
+    with _gdal_cache_lock:
+        current = get_gdal_config("GDAL_CACHEMAX")
+        if _gdal_cache_state["users"] == 0:
+            _gdal_cache_state["previous"] = current
+        _gdal_cache_state["users"] += 1
+        set_gdal_config("GDAL_CACHEMAX", max(1, min(current, gdal_cache_bytes(budget_bytes))))
+    try:
+        yield
+    finally:
+        with _gdal_cache_lock:
+            _gdal_cache_state["users"] -= 1
+            if _gdal_cache_state["users"] == 0:
+                set_gdal_config("GDAL_CACHEMAX", _gdal_cache_state["previous"])
+
+
+def raster_workers():
+    """
+    Threads de calcul par raster (RASTER_WORKERS) entre lesquels les fenêtres sont réparties, plafonnés pour que
+    les concurrent_rasters() années calculées en parallèle n'utilisent pas plus de threads que de cœurs.
+    """
+    cores = os.cpu_count() or 1
+    return max(1, min(constantes.RASTER_WORKERS, cores // concurrent_rasters()))
+
+
+def windowed_mode():
+    """ Vrai si NDVI, classes et stats passent par les fenêtres : budget mémoire ou plusieurs threads par raster. """
+    return memory_budget() > 0 or raster_workers() > 1
+
+
+def fixed_overhead():
+    """ Mémoire indépendante de la taille des fenêtres : morceau en cours des statistiques (tampons et temporaires). """
+    return class_stats.STATS_CHUNK_PIXELS * 48
+
+
+def budget_windows(src, budget_bytes, bytes_per_pixel=WINDOW_BYTES_PER_PIXEL, row_step=1):
+    """
+    Fenêtres pleine largeur (bandes de lignes, dans l'ordre) couvrant un raster ouvert, de sorte que
+    lignes x largeur x bytes_per_pixel <= budget_bytes pour chacune. Les fins de fenêtres suivent les
+    lignes de blocs de src.block_windows() (tuiles d'un COG, bandes d'un GeoTIFF) quand c'est possible,
+    pour que chaque bloc ne soit décodé qu'une fois. Au minimum row_step lignes par fenêtre, et toutes
+    les fenêtres sauf la dernière ont un multiple de row_step lignes.
+    """
+    max_rows = max(row_step, budget_bytes // (src.width * bytes_per_pixel) // row_step * row_step)
+    block_rows = sorted({window.row_off for _, window in src.block_windows(1)} | {src.height})
+    row = 0
+    while row < src.height:
+        stop = min(row + max_rows, src.height)
+        aligned = [block_row for block_row in block_rows
+                   if row < block_row <= stop and ((block_row - row) % row_step == 0 or block_row == src.height)]
+        if aligned:
+            stop = aligned[-1]
+        yield Window(0, row, src.width, stop - row)
+        row = stop
+
+
+def split_budget(budget_bytes, sources=2, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Partage du budget des scripts qui lisent leurs rasters sources par plages (utils/ranged_reader.py) :
+    (budget de write_windowed, blocs gardés par source). La moitié du budget va à write_windowed (fenêtres et cache
+    de blocs GDAL), un quart aux blocs gardés des sources (au moins 2 par source), le dernier quart aux copies des
+    plages en cours de lecture. Sans budget : (0, DEFAULT_MAX_BLOCKS).
+    """
+    if budget_bytes <= 0:
+        return 0, DEFAULT_MAX_BLOCKS
+    return budget_bytes // 2, max(2, budget_bytes // 4 // (sources * block_size))
+
+
+def write_windowed(src, path, profile, compute, budget_bytes=None):
+    """
+    Écrit dans le GeoTIFF local path (profil profile, une bande, grille de src) le résultat de compute(window)
+    pour chaque fenêtre de budget_windows(src, working_budget(budget_bytes)), cache de blocs GDAL borné par
+    budget_env : une seule fenêtre en mémoire à la fois, l'image entière n'est jamais allouée.
+    Sans budget, une seule fenêtre. Retourne path.
+    """
+    budget_bytes = memory_budget() if budget_bytes is None else budget_bytes
+    windows = budget_windows(src, working_budget(budget_bytes)) if budget_bytes > 0 else [Window(0, 0, src.width, src.height)]
+    with budget_env(budget_bytes), rasterio.open(path, "w", **profile) as dst:
+        for window in windows:
+            dst.write(compute(window), 1, window=window)
+    return path
+
+
+def difference_windows(raster1, raster2):
+    """ compute de write_windowed : différence raster2 - raster1 (bande 1, float32) d'une fenêtre, même grille. """
+    def compute(window):
+        difference = get_backend().difference(raster1.read(1, window=window), raster2.read(1, window=window))
+        return difference.astype(np.float32)
+    return compute
+
+
+def class_mask_windows(raster1, raster2, class_value, nodata):
+    """ compute de write_windowed : bande 1 de raster2, nodata là où raster1 n'est pas de la classe class_value. """
+    def compute(window):
+        data = raster2.read(1, window=window)
+        data[raster1.read(1, window=window) != class_value] = nodata
+        return data
+    return compute
+
+
+def _tile_windows(src, budget_bytes, workers):
+    """
+    (fenêtres, threads) : chaque fenêtre tient dans working_budget(budget_bytes) / threads (les threads travaillent
+    en même temps) et commence sur une frontière de morceau des stats (lignes multiples de chunk_rows).
+    Le nombre de threads est réduit à ce que le budget permet (une fenêtre minimale de chunk_rows lignes et un
+    morceau des stats par thread) ; sous une seule fenêtre minimale, le budget sera dépassé (avertissement).
+    Sans budget, quelques fenêtres par thread pour équilibrer la charge, d'au moins une ligne de blocs
+    (chaque thread ayant son propre dataset, un bloc partagé entre deux fenêtres serait décodé deux fois).
+    """
+    if budget_bytes > 0:
+        working = working_budget(budget_bytes)
+        minimum = fixed_overhead() + chunk_rows(src.width) * src.width * WINDOW_BYTES_PER_PIXEL
+        if working < minimum:
+            print(f"Avertissement : budget mémoire de {budget_bytes / 2**20:.1f} Mo inférieur au minimum d'une fenêtre "
+                  f"({(minimum + gdal_cache_bytes(budget_bytes)) / 2**20:.1f} Mo, cache GDAL compris) : il sera dépassé")
+        workers = max(1, min(workers, working // minimum))
+        window_budget = max(1, (working - workers * fixed_overhead()) // workers)
+    else:
+        block_height = src.block_shapes[0][0]
+        window_budget = max(-(-src.height * src.width // (4 * workers)), block_height * src.width) * WINDOW_BYTES_PER_PIXEL
+    return list(budget_windows(src, window_budget, row_step=chunk_rows(src.width))), workers
+
+
+def _map_windows(src, open_src, windows, func, workers):
+    """
+    Résultats de func(dataset, window) pour chaque fenêtre, dans l'ordre. Avec plusieurs workers, les fenêtres
+    sont traitées par un pool de threads (GDAL et numpy libèrent le GIL) ; un dataset rasterio ne devant pas être
+    partagé entre threads, chaque thread ouvre le sien avec open_src(). Au plus workers fenêtres en cours ou en
+    attente de lecture : la mémoire de travail reste sous workers x budget d'une fenêtre.
+    """
+    if workers <= 1 or open_src is None or len(windows) <= 1:
+        for window in windows:
+            yield func(src, window)
+        return
+    local = threading.local()
+    opened = []
+    lock = threading.Lock()
+
+    def run(window):
+        dataset = getattr(local, "src", None)
+        if dataset is None:
+            dataset = open_src()
+            if dataset is None:
+                raise ValueError("Ouverture du raster impossible dans un thread de calcul")
+            local.src = dataset
+            with lock:
+                opened.append(dataset)
+        return func(dataset, window)
+
+    pending = deque()
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="raster-tile") as pool:
+            for window in windows:
+                pending.append(pool.submit(run, window))
+                if len(pending) >= workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        for dataset in opened:
+            dataset.close()
+
+
+def _window_ndvi_classes(layout):
+    """
+    func de _map_windows : (fenêtre, NDVI, classes) d'une fenêtre, NaN / classe 0 hors du masque de validité
+    (lu avec les bandes de la fenêtre, voir read_ndvi_with_mask).
+    """
+    def compute(src, window):
+        ndvi, class_map, _ = read_ndvi_with_mask(src, layout, with_classes=True, window=window)
+        return window, ndvi, class_map
+    return compute
+
+
+def read_ndvi_windowed(src, layout=None, budget_bytes=None, with_classes=False, open_src=None, workers=None):
+    """
+    NDVI (float32, NaN hors forêt) d'un raster ouvert et, avec with_classes, sa carte des classes, calculés
+    fenêtre par fenêtre dans des tableaux de sortie préalloués. Les sorties sont entières (5 octets par pixel
+    avec les classes) : budget_bytes (raster_budget() par défaut) ne borne que la mémoire de travail qui s'y
+    ajoute. Pour des stats sans image entière, voir stream_class_stats. Avec open_src (ouverture d'un nouveau dataset du même
+    raster), les fenêtres sont réparties entre workers threads (raster_workers() par défaut).
+    Résultat identique à la lecture des bandes entières.
+    """
+    layout = layout or band_layout(src)
+    budget_bytes = raster_budget() if budget_bytes is None else budget_bytes
+    workers = workers or raster_workers()
+    ndvi_out = np.empty((src.height, src.width), dtype=np.float32)
+    class_out = np.empty((src.height, src.width), dtype=np.uint8) if with_classes else None
+    windows, workers = _tile_windows(src, budget_bytes, workers)
+    with budget_env(budget_bytes):
+        for window, ndvi, class_map in _map_windows(src, open_src, windows, _window_ndvi_classes(layout), workers):
+            rows = slice(window.row_off, window.row_off + window.height)
+            ndvi_out[rows] = ndvi
+            if with_classes:
+                class_out[rows] = class_map
+    return (ndvi_out, class_out) if with_classes else ndvi_out
+
+
+def stream_class_stats(src, layout=None, budget_bytes=None, open_src=None, workers=None):
+    """
+    Statistiques compactes par classe (utils/class_stats.py) d'un raster ouvert, accumulées fenêtre par
+    fenêtre sans jamais garder l'image entière : mémoire de travail (cache de blocs GDAL compris) sous budget_bytes
+    (raster_budget() par défaut).
+    Avec open_src, chaque thread calcule les stats partielles de ses fenêtres, fusionnées ensuite dans l'ordre.
+    Identiques à accumulate_class_stats sur la carte de classes et le NDVI entiers.
+    """
+    layout = layout or band_layout(src)
+    budget_bytes = raster_budget() if budget_bytes is None else budget_bytes
+    workers = workers or raster_workers()
+    ndvi_classes = _window_ndvi_classes(layout)
+
+    def partials(dataset, window):
+        _, ndvi, class_map = ndvi_classes(dataset, window)
+        return chunk_partials(class_map, ndvi)
+
+    stats = empty_stats()
+    windows, workers = _tile_windows(src, budget_bytes, workers)
+    with budget_env(budget_bytes):
+        for window_partials in _map_windows(src, open_src, windows, partials, workers):
+            for partial in window_partials:
+                merge_class_stats(stats, partial)
+    return stats
+
+
+def benchmark_workers(path, worker_counts=(1, 2, 4), repeat=3, budget_bytes=0):
+    """
+    Temps de calcul des stats par classe d'un TIF (stream_class_stats) selon le nombre de threads.
+    Retourne une liste de dicts {"workers", "seconds" (meilleur de repeat essais), "speedup" (par rapport au 1er)}.
+    """
+    results = []
+    reference = None
+    for workers in worker_counts:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            # Dataset rouvert à chaque essai : pas de blocs déjà décodés dans le cache GDAL d'un essai précédent
+            with rasterio.open(path) as src:
+                stats = stream_class_stats(src, band_layout(src), budget_bytes, open_src=lambda: rasterio.open(path),
+                                           workers=workers)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        if reference is None:
+            reference = stats
+        elif not np.array_equal(stats, reference, equal_nan=True):
+            print(f"Avertissement : stats différentes avec {workers} threads")
+        results.append({"workers": workers, "seconds": best, "speedup": results[0]["seconds"] / best if results else 1.0})
+    return results
@@ -0,0 +1,36 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+def run_year_pipeline(years, fetch, compute, io_workers=4, cpu_workers=2):
+    """
+    Traite plusieurs années en parallèle : fetch(year) (téléchargement, I/O) tourne sur un pool de threads
+    borné et chaque résultat est passé dès qu'il arrive à compute(year, fetched) (NDVI, classification,
+    stats) sur un second pool. numpy et GDAL relâchent le GIL, les deux étapes se recouvrent donc
+    réellement : la durée totale suit l'année la plus lente et non plus la somme des années.
+
+    Une étape qui lève une exception n'interrompt pas les autres années : le message de l'exception
+    est rapporté pour l'année concernée. Retourne une liste (year, result, error) dans l'ordre de
+    `years`, error étant None en cas de succès.
+    """
+    outcomes = {}
+    with ThreadPoolExecutor(max_workers=max(1, io_workers), thread_name_prefix="annees-io") as io_pool, \
+         ThreadPoolExecutor(max_workers=max(1, cpu_workers), thread_name_prefix="annees-calcul") as cpu_pool:
+        fetch_futures = {io_pool.submit(fetch, year): year for year in years}
+        compute_futures = {}
+        for future in as_completed(fetch_futures):
+            year = fetch_futures[future]
+            try:
+                fetched = future.result()
+            except Exception as e:
+                outcomes[year] = (None, str(e))
+                continue
+            compute_futures[cpu_pool.submit(compute, year, fetched)] = year
+
+        for future in as_completed(compute_futures):
+            year = compute_futures[future]
+            try:
+                outcomes[year] = (future.result(), None)
+            except Exception as e:
+                outcomes[year] = (None, str(e))
+
+    return [(year, *outcomes[year]) for year in years]
@@ -3,7 +3,7 @@ import numpy as np
 import geopandas as gpd
 import rasterio
 from rasterio.mask import mask
-from rasterio.features import shapes
+from rasterio.features import shapes, geometry_mask
 from shapely.geometry import mapping, shape
 import pandas as pd
 from datetime import datetime
@@ -18,6 +18,14 @@ from oauthlib.oauth2 import BackendApplicationClient
 from requests_oauthlib import OAuth2Session
 from datetime import datetime, timedelta
 
+# Écriture des rasters en Cloud-Optimized GeoTIFF (convertisseur partagé avec le dashboard)
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "dashboard")))
+import utils.constantes as constantes
+from utils.cog import write_cog
+from utils.scaled_raster import write_scaled_raster, SCALED_PROFILE
+from utils.validity import read_masked_ndvi
+
 
 # Supprimer les avertissements pour plus de clarté
 warnings.filterwarnings("ignore")
@@ -297,44 +305,55 @@ def clip_raster_to_polygon(data, profile, geometry):
         print(f"Erreur lors du découpage du raster: {e}")
         return None, None
 
-def save_multiband_raster(data, profile, output_path):
+def polygon_valid_mask(profile, geometry):
+    """
+    Masque des pixels situés dans le polygone (True = dans la forêt) pour un raster découpé,
+    avec le même critère que le découpage (centre du pixel dans le polygone).
+    """
+    return geometry_mask([mapping(geometry)], out_shape=(profile["height"], profile["width"]),
+                         transform=profile["transform"], all_touched=False, invert=True)
+
+def save_multiband_raster(data, profile, output_path, valid_mask=None):
     """
-    Sauvegarde un raster multi-bandes (RGB, NIR, et NDVI) dans un seul fichier GeoTIFF.
+    Sauvegarde un raster multi-bandes (RGB, NIR, et NDVI) dans un seul fichier GeoTIFF,
+    au format COG : tuiles internes, bandes séparées, aperçus internes et compression
+    avec prédicteur (constantes COG_COMPRESS / COG_BLOCK_SIZE du dashboard).
+    Avec RASTER_STORAGE_PROFILE=scaled_int16, les bandes sont stockées en int16 mis à l'échelle.
+    valid_mask (pixels dans le polygone) est écrit comme masque interne du GeoTIFF.
     """
     if data is None:
         print("Pas de données à sauvegarder")
         return False
     
-    try:
-        # Mise à jour du profil pour le fichier de sortie
-        out_profile = profile.copy()
-        out_profile.update({
-            'count': 5,
-            'dtype': rasterio.float32,
-            'driver': 'GTiff',
-            'compress': 'lzw',
-            'nodata': None
-        })
-        
-        # Création du fichier de sortie
-        with rasterio.open(output_path, 'w', **out_profile) as dst:
-            # Écriture de toutes les bandes
-            for i in range(data.shape[0]):
-                dst.write(data[i], i+1)
-            
-            # Ajout des descriptions de bandes
-            dst.set_band_description(1, "Rouge (B4) - normalisé")
-            dst.set_band_description(2, "Vert (B3) - normalisé")
-            dst.set_band_description(3, "Bleu (B2) - normalisé")
-            dst.set_band_description(4, "Proche Infrarouge (B8)")
-            dst.set_band_description(5, "NDVI")
-        
-        print(f"Raster multi-bandes sauvegardé: {output_path}")
-        return True
-    
-    except Exception as e:
-        print(f"Erreur lors de la sauvegarde du raster: {e}")
+    # Mise à jour du profil pour le fichier de sortie
+    out_profile = profile.copy()
+    out_profile.update({
+        'count': 5,
+        'dtype': rasterio.float32,
+        'driver': 'GTiff',
+        'nodata': None
+    })
+    
+    # Descriptions des bandes
+    band_descriptions = [
+        "Rouge (B4) - normalisé",
+        "Vert (B3) - normalisé",
+        "Bleu (B2) - normalisé",
+        "Proche Infrarouge (B8)",
+        "NDVI",
+    ]
+    
+    # Création du fichier de sortie
+    if constantes.RASTER_STORAGE_PROFILE == SCALED_PROFILE:
+        written = write_scaled_raster(data, out_profile, output_path, band_descriptions=band_descriptions, valid_mask=valid_mask)
+    else:
+        written = write_cog(data.astype(np.float32, copy=False), out_profile, output_path, band_descriptions=band_descriptions,
+                            valid_mask=valid_mask)
+    if not written:
         return False
+    
+    print(f"Raster multi-bandes sauvegardé: {output_path}")
+    return True
 
 def create_quick_rgb_preview(data, output_path, percentile_clip=(2, 98)):
     """
@@ -388,8 +407,9 @@ def create_ndvi_classified_raster(raster_path, output_path):
                 print(f"Le raster {raster_path} ne contient pas de bande NDVI")
                 return False
             
-            # Lire la bande NDVI (5ème bande)
-            ndvi = src.read(5)
+            # Lire la bande NDVI (5ème bande), remise à l'échelle si le raster est stocké en int16,
+            # avec NaN hors du polygone (masque interne) : ces pixels restent sans classe (0)
+            ndvi = read_masked_ndvi(src)
             
             # Créer un nouveau raster pour les classes
             classified = np.zeros_like(ndvi, dtype=np.uint8)
@@ -532,8 +552,9 @@ def process_polygon(oauth_session, token, gdf_row, year, output_dir, shapefile_d
     raster_output_path = os.path.join(polygon_output_dir, f"{output_filename}.tif")
     preview_output_path = os.path.join(polygon_output_dir, f"{output_filename}_preview.png")
     
-    # Sauvegarder le raster multi-bandes
-    if not save_multiband_raster(clipped_data, clipped_profile, raster_output_path):
+    # Sauvegarder le raster multi-bandes, avec le masque des pixels dans le polygone
+    valid_mask = polygon_valid_mask(clipped_profile, polygon_geom)
+    if not save_multiband_raster(clipped_data, clipped_profile, raster_output_path, valid_mask=valid_mask):
         return False
     
     # Créer un aperçu RGB pour vérification visuelle rapide
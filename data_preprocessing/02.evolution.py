@@ -1,11 +1,24 @@
-import boto3
 import rasterio
 import os
 import io
+import tempfile
 import numpy as np
 import argparse
+import sys
 from botocore.exceptions import NoCredentialsError
 
+# Client S3 partagé avec le dashboard (pool de connexions, relances adaptatives)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "dashboard")))
+import utils.constantes as constantes
+from utils.s3_client import get_s3_client
+from utils.grid_alignment import grid_of, same_grid, canonical_grid, align
+from utils.storage import S3Storage
+from utils.raster_engine import RasterEngine
+from utils.s3_catalog import extract_forest_name
+from utils.windowed import memory_budget, split_budget, write_windowed, difference_windows
+from utils.ranged_reader import s3_range_opener
+from utils.compute_backend import get_backend
+
 # Configuration AWS
     # Identifiants d'accès à l'API
     #client_id = 
@@ -16,10 +29,11 @@ bucket_name = 'hackaton-stat'
 # Dossiers de travail
 input_folder = 'data_raster/'
 output_folder = 'data_evolution/'
+# Rasters du dashboard : leur catalogue (manifeste) donne la grille canonique de chaque forêt
+grid_folder = 'Data_hackathon_stat_data_raster/'
 
 # Connexion à S3
-s3_client = boto3.client(
-    's3',
+s3_client = get_s3_client(
         # Identifiants d'accès à l'API
     #client_id = 
     # client_secret = remplir
@@ -35,11 +49,10 @@ def check_raster_exists(bucket, key):
         return False
 
 def load_raster_from_s3(bucket, key):
-    """Charge un fichier raster depuis S3 dans un objet rasterio"""
+    """Ouvre un raster S3 par lectures de plages : seuls les blocs lus sont récupérés (cache de blocs borné par RASTER_MEMORY_BUDGET_MB)"""
     try:
-        response = s3_client.get_object(Bucket=bucket, Key=key)
-        raster_bytes = response['Body'].read()
-        return rasterio.open(io.BytesIO(raster_bytes))
+        _, max_blocks = split_budget(memory_budget())
+        return rasterio.open(key, opener=s3_range_opener(s3_client, bucket, max_blocks=max_blocks))
     except Exception as e:
         print(f"Erreur lors du chargement de {key}: {e}")
         return None
@@ -52,16 +65,45 @@ def check_output_exists(bucket, output_key):
     except:
         return False
 
-def calculate_difference(raster1, raster2):
-    """Calcule la différence entre deux rasters"""
+def forest_grid(raster1, raster2, raster_path):
+    """
+    Grille canonique de la forêt du raster (toutes ses années, RasterEngine.get_forest_grid sur le catalogue de
+    grid_folder) : les différences de toutes les paires d'années d'une forêt partagent ainsi la même grille.
+    À défaut (forêt inconnue du catalogue), grille commune aux deux rasters.
+    """
+    forest_name = extract_forest_name(os.path.basename(raster_path))
+    grid = None
+    if forest_name:
+        storage = S3Storage(s3_client, bucket_name, grid_folder, range_reads=constantes.S3_RANGE_READS,
+                            use_manifest=constantes.S3_USE_MANIFEST)
+        grid = RasterEngine(storage).get_forest_grid(forest_name)
+    if grid is None:
+        print(f"Grille canonique de la forêt introuvable pour {raster_path} : grille commune aux deux rasters")
+        grid = canonical_grid([grid_of(raster1), grid_of(raster2)])
+    return grid
+
+def calculate_difference(raster1, raster2, grid=None):
+    """Calcule la différence entre deux rasters, sur la grille canonique de la forêt (grid) si l'un d'eux en diffère"""
     # Lire les données des rasters
     data1 = raster1.read(1)  # Lecture de la première bande
     data2 = raster2.read(1)  # Lecture de la première bande
+    profile = raster1.profile
+
+    # Les dimensions varient d'une année à l'autre (plafond max_dimension de l'ingestion) :
+    # les deux rasters sont projetés pixel à pixel sur la grille canonique de la forêt (NaN hors emprise)
+    grid1, grid2 = grid_of(raster1), grid_of(raster2)
+    grid = grid or canonical_grid([grid1, grid2])
+    if not (same_grid(grid1, grid) and same_grid(grid2, grid)):
+        print(f"Grilles différentes ({raster1.height}x{raster1.width} et {raster2.height}x{raster2.width}), "
+              f"alignement sur {grid['height']}x{grid['width']}")
+        data1 = align(data1.astype(float), grid1, grid, fill=np.nan)
+        data2 = align(data2.astype(float), grid2, grid, fill=np.nan)
+        profile.update(crs=grid["crs"], transform=grid["transform"], width=grid["width"], height=grid["height"])
+
+    # Calculer la différence (raster2 - raster1) en float64, avec le backend de calcul actif
+    diff_data = get_backend().difference(data1, data2)
     
-    # Calculer la différence (raster2 - raster1)
-    diff_data = data2.astype(float) - data1.astype(float)
-    
-    return diff_data, raster1.profile
+    return diff_data, profile
 
 def save_raster_to_s3(data, profile, bucket, output_key):
     """Sauvegarde un raster dans S3"""
@@ -91,6 +133,25 @@ def save_raster_to_s3(data, profile, bucket, output_key):
         print(f"Erreur lors de la sauvegarde du raster: {e}")
         return False
 
+def save_difference_windowed_to_s3(raster1, raster2, bucket, output_key):
+    """
+    Différence de deux rasters de même grille écrite fenêtre par fenêtre dans un fichier temporaire, puis téléversée :
+    ni les rasters ni la différence ne sont gardés en entier en mémoire (RASTER_MEMORY_BUDGET_MB)
+    """
+    try:
+        profile = raster1.profile
+        profile.update(dtype=rasterio.float32, count=1, compress='lzw')
+        window_budget, _ = split_budget(memory_budget())
+        with tempfile.TemporaryDirectory(prefix="evolution-") as workdir:
+            path = write_windowed(raster1, os.path.join(workdir, "diff.tif"), profile,
+                                  difference_windows(raster1, raster2), window_budget)
+            s3_client.upload_file(path, bucket, output_key)
+        print(f"Raster de différence sauvegardé avec succès: {output_key}")
+        return True
+    except Exception as e:
+        print(f"Erreur lors de la sauvegarde du raster: {e}")
+        return False
+
 def process_rasters(raster1_path, raster2_path):
     """Traite deux rasters en calculant leur différence"""
     # Construire les chemins complets des rasters
@@ -130,13 +191,19 @@ def process_rasters(raster1_path, raster2_path):
         print("Impossible de charger les rasters. Arrêt du traitement.")
         return False
     
-    # Calculer la différence
-    print("Calcul de la différence entre les rasters...")
-    diff_data, profile = calculate_difference(raster1, raster2)
-    
-    # Sauvegarder le résultat
-    print(f"Sauvegarde du résultat dans {output_key}...")
-    success = save_raster_to_s3(diff_data, profile, bucket_name, output_key)
+    grid = forest_grid(raster1, raster2, raster1_path)
+    if memory_budget() > 0 and same_grid(grid_of(raster1), grid) and same_grid(grid_of(raster2), grid):
+        # Mode fenêtré : calcul et écriture fenêtre par fenêtre, dans un fichier temporaire téléversé ensuite
+        print(f"Calcul de la différence fenêtre par fenêtre et sauvegarde dans {output_key}...")
+        success = save_difference_windowed_to_s3(raster1, raster2, bucket_name, output_key)
+    else:
+        # Calculer la différence
+        print("Calcul de la différence entre les rasters...")
+        diff_data, profile = calculate_difference(raster1, raster2, grid)
+
+        # Sauvegarder le résultat
+        print(f"Sauvegarde du résultat dans {output_key}...")
+        success = save_raster_to_s3(diff_data, profile, bucket_name, output_key)
     
     # Fermer les fichiers
     raster1.close()
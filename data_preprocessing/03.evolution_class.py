@@ -1,11 +1,23 @@
-import boto3
 import rasterio
 import numpy as np
 import os
 import io
+import tempfile
 import argparse
+import sys
 from botocore.exceptions import NoCredentialsError
 
+# Client S3 partagé avec le dashboard (pool de connexions, relances adaptatives)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "dashboard")))
+import utils.constantes as constantes
+from utils.s3_client import get_s3_client
+from utils.grid_alignment import grid_of, same_grid, canonical_grid, align
+from utils.storage import S3Storage
+from utils.raster_engine import RasterEngine
+from utils.s3_catalog import extract_forest_name
+from utils.windowed import memory_budget, split_budget, write_windowed, class_mask_windows
+from utils.ranged_reader import s3_range_opener
+
     # Identifiants d'accès à l'API
     #client_id = 
     # client_secret = remplir
@@ -15,10 +27,11 @@ bucket_name = 'hackaton-stat'
 # Dossiers de travail
 input_folder = 'data_raster/'
 output_folder = 'data_evolution/'
+# Rasters du dashboard : leur catalogue (manifeste) donne la grille canonique de chaque forêt
+grid_folder = 'Data_hackathon_stat_data_raster/'
 
 # Connexion à S3
-s3_client = boto3.client(
-    's3',
+s3_client = get_s3_client(
         # Identifiants d'accès à l'API
     #client_id = 
     # client_secret = remplir
@@ -34,11 +47,10 @@ def check_raster_exists(bucket, key):
         return False
 
 def load_raster_from_s3(bucket, key):
-    """Charge un fichier raster depuis S3 dans un objet rasterio"""
+    """Ouvre un raster S3 par lectures de plages : seuls les blocs lus sont récupérés (cache de blocs borné par RASTER_MEMORY_BUDGET_MB)"""
     try:
-        response = s3_client.get_object(Bucket=bucket, Key=key)
-        raster_bytes = response['Body'].read()
-        return rasterio.open(io.BytesIO(raster_bytes))
+        _, max_blocks = split_budget(memory_budget())
+        return rasterio.open(key, opener=s3_range_opener(s3_client, bucket, max_blocks=max_blocks))
     except Exception as e:
         print(f"Erreur lors du chargement de {key}: {e}")
         return None
@@ -51,20 +63,52 @@ def check_output_exists(bucket, output_key):
     except:
         return False
 
-def create_class_mask(raster1, class_value):
-    """Crée un masque booléen où True indique la présence de la classe spécifiée"""
+def forest_grid(raster1, raster2, raster_path):
+    """
+    Grille canonique de la forêt du raster (toutes ses années, RasterEngine.get_forest_grid sur le catalogue de
+    grid_folder) : les masques de toutes les paires d'années d'une forêt partagent ainsi la même grille.
+    À défaut (forêt inconnue du catalogue), grille commune aux deux rasters.
+    """
+    forest_name = extract_forest_name(os.path.basename(raster_path))
+    grid = None
+    if forest_name:
+        storage = S3Storage(s3_client, bucket_name, grid_folder, range_reads=constantes.S3_RANGE_READS,
+                            use_manifest=constantes.S3_USE_MANIFEST)
+        grid = RasterEngine(storage).get_forest_grid(forest_name)
+    if grid is None:
+        print(f"Grille canonique de la forêt introuvable pour {raster_path} : grille commune aux deux rasters")
+        grid = canonical_grid([grid_of(raster1), grid_of(raster2)])
+    return grid
+
+def create_class_mask(raster1, class_value, grid=None):
+    """
+    Crée un masque booléen où True indique la présence de la classe spécifiée.
+    Avec grid (grille canonique de la forêt, de dimensions éventuellement différentes), le masque est
+    projeté pixel à pixel sur cette grille (False hors de l'emprise de raster1).
+    """
     data = raster1.read(1)
     mask = data == class_value
+    if grid is not None:
+        mask = align(mask, grid_of(raster1), grid, fill=False)
     return mask
 
-def apply_mask_to_raster(raster2, mask):
-    """Applique un masque à un raster, conservant les valeurs uniquement où le masque est True"""
-    data = raster2.read(1)
-    # Créer une copie des données
-    masked_data = data.copy()
+def apply_mask_to_raster(raster2, mask, grid=None):
+    """
+    Applique un masque à un raster, conservant les valeurs uniquement où le masque est True.
+    Avec grid, le raster est d'abord projeté sur cette grille (NoData hors de son emprise).
+    """
+    nodata = raster2.nodata if raster2.nodata is not None else -9999
+    profile = raster2.profile
+    # Copie des données (projetées sur la grille de la forêt si besoin)
+    masked_data = raster2.read(1)
+    if grid is not None and not same_grid(grid_of(raster2), grid):
+        masked_data = align(masked_data, grid_of(raster2), grid, fill=nodata)
+        profile.update(crs=grid["crs"], transform=grid["transform"], width=grid["width"], height=grid["height"])
+    else:
+        masked_data = masked_data.copy()
     # Appliquer le masque - remplacer par une valeur NoData là où le masque est False
-    masked_data[~mask] = raster2.nodata if raster2.nodata is not None else -9999
-    return masked_data, raster2.profile
+    masked_data[~mask] = nodata
+    return masked_data, profile
 
 def save_raster_to_s3(data, profile, bucket, output_key):
     """Sauvegarde un raster dans S3"""
@@ -91,6 +135,26 @@ def save_raster_to_s3(data, profile, bucket, output_key):
         print(f"Erreur lors de la sauvegarde du raster: {e}")
         return False
 
+def save_class_mask_windowed_to_s3(raster1, raster2, class_value, bucket, output_key):
+    """
+    Masque de classe (rasters de même grille) appliqué et écrit fenêtre par fenêtre dans un fichier temporaire,
+    puis téléversé : ni les rasters ni le résultat ne sont gardés en entier en mémoire (RASTER_MEMORY_BUDGET_MB)
+    """
+    try:
+        profile = raster2.profile
+        if 'nodata' not in profile or profile['nodata'] is None:
+            profile.update(nodata=-9999)
+        window_budget, _ = split_budget(memory_budget())
+        with tempfile.TemporaryDirectory(prefix="evolution-") as workdir:
+            path = write_windowed(raster2, os.path.join(workdir, "mask.tif"), profile,
+                                  class_mask_windows(raster1, raster2, class_value, profile['nodata']), window_budget)
+            s3_client.upload_file(path, bucket, output_key)
+        print(f"Raster masqué sauvegardé avec succès: {output_key}")
+        return True
+    except Exception as e:
+        print(f"Erreur lors de la sauvegarde du raster: {e}")
+        return False
+
 def process_rasters(class_value, raster1_path, raster2_path):
     """Traite deux rasters en appliquant un masque de classe du premier raster au deuxième"""
     # Construire les chemins complets des rasters
@@ -130,17 +194,23 @@ def process_rasters(class_value, raster1_path, raster2_path):
         print("Impossible de charger les rasters. Arrêt du traitement.")
         return False
     
-    # Créer le masque à partir de la classe spécifiée dans le premier raster
-    print(f"Création du masque pour la classe {class_value}...")
-    mask = create_class_mask(raster1, class_value)
-    
-    # Appliquer le masque au deuxième raster
-    print("Application du masque au deuxième raster...")
-    masked_data, profile = apply_mask_to_raster(raster2, mask)
-    
-    # Sauvegarder le résultat
-    print(f"Sauvegarde du résultat dans {output_key}...")
-    success = save_raster_to_s3(masked_data, profile, bucket_name, output_key)
+    grid = forest_grid(raster1, raster2, raster1_path)
+    if memory_budget() > 0 and same_grid(grid_of(raster1), grid) and same_grid(grid_of(raster2), grid):
+        # Mode fenêtré : masque appliqué et écrit fenêtre par fenêtre, dans un fichier temporaire téléversé ensuite
+        print(f"Application du masque de la classe {class_value} fenêtre par fenêtre et sauvegarde dans {output_key}...")
+        success = save_class_mask_windowed_to_s3(raster1, raster2, class_value, bucket_name, output_key)
+    else:
+        # Créer le masque à partir de la classe spécifiée dans le premier raster
+        print(f"Création du masque pour la classe {class_value}...")
+        mask = create_class_mask(raster1, class_value, grid=grid)
+
+        # Appliquer le masque au deuxième raster
+        print("Application du masque au deuxième raster...")
+        masked_data, profile = apply_mask_to_raster(raster2, mask, grid)
+
+        # Sauvegarder le résultat
+        print(f"Sauvegarde du résultat dans {output_key}...")
+        success = save_raster_to_s3(masked_data, profile, bucket_name, output_key)
     
     # Fermer les fichiers
     raster1.close()
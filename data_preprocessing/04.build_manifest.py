@@ -0,0 +1,172 @@
+import rasterio
+import os
+import sys
+import json
+import argparse
+from datetime import datetime, timezone
+
+# Réutiliser les règles de nommage et les constantes du dashboard
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "dashboard")))
+import utils.constantes as constantes
+from utils.s3_catalog import extract_year, extract_forest_name, forest_from_key, partitioned_key, MANIFEST_VERSION
+from utils.s3_client import get_s3_client
+from utils.ranged_reader import s3_range_opener
+
+# Configuration AWS
+    # Identifiants d'accès à l'API
+    #client_id =
+    # client_secret = remplir
+region_name = 'us-east-1'
+bucket_name = 'hackaton-stat'
+
+# Dossier des rasters consommés par le dashboard
+input_folder = 'Data_hackathon_stat_data_raster/'
+
+# Connexion à S3
+s3_client = get_s3_client(region_name=region_name)
+
+def list_tif_objects(bucket, prefix):
+    """Liste les objets .tif (clé, ETag, taille) sous un préfixe"""
+    objects = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            if obj['Key'].lower().endswith('.tif'):
+                objects.append(obj)
+    return objects
+
+def drop_migrated_sources(objects, prefix):
+    """
+    Écarte les TIFs à plat dont la copie partitionnée (forest=<nom>/year=<aaaa>/) existe : le manifeste
+    pointe alors vers l'arborescence partitionnée, lue sans aucun LIST par le dashboard
+    """
+    keys = {obj['Key'] for obj in objects}
+    kept = []
+    for obj in objects:
+        basename = os.path.basename(obj['Key'])
+        forest_name, year = extract_forest_name(basename), extract_year(basename)
+        if obj['Key'] == prefix + basename and forest_name and year \
+                and partitioned_key(prefix, forest_name, year, basename) in keys:
+            continue
+        kept.append(obj)
+    return kept
+
+def load_existing_manifest(bucket, key):
+    """Charge le manifeste déjà publié (dict clé -> entrée) pour ne réouvrir que les TIFs modifiés"""
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+        manifest = json.loads(response['Body'].read())
+        if manifest.get("version") != MANIFEST_VERSION:
+            return {}
+        return {item["key"]: item for item in manifest["objects"]}
+    except Exception:
+        return {}
+
+def raster_metadata(src):
+    """Extrait les métadonnées utiles au dashboard d'un dataset rasterio ouvert"""
+    return {
+        "count": src.count,
+        "descriptions": list(src.descriptions),
+        "dtype": src.dtypes[0],
+        "nodata": src.nodata,
+        "crs": src.crs.to_string() if src.crs else None,
+        "transform": list(src.transform)[:6],
+        "width": src.width,
+        "height": src.height,
+        "bounds": list(src.bounds),
+    }
+
+def build_manifest_entry(bucket, obj, opener=None):
+    """
+    Construit l'entrée du manifeste d'un objet S3 : TIF ouvert par lectures de plages (opener, s3_range_opener),
+    seuls les octets de l'en-tête sont téléchargés
+    """
+    key = obj['Key']
+    basename = os.path.basename(key)
+    forest_name = forest_from_key(key) # partition forest=<nom>/ ou nom du fichier
+    year = extract_year(basename)
+    if forest_name is None or year is None:
+        print(f"Nom de fichier non reconnu, ignoré: {key}")
+        return None
+
+    try:
+        with rasterio.open(key, opener=opener or s3_range_opener(s3_client, bucket, max_blocks=2)) as src:
+            metadata = raster_metadata(src)
+    except Exception as e:
+        print(f"Erreur lors de la lecture de {key}: {e}")
+        return None
+
+    entry = {
+        "key": key,
+        "forest": forest_name,
+        "year": year,
+        "etag": obj['ETag'].strip('"'),
+        "size": obj['Size'],
+    }
+    entry.update(metadata)
+    return entry
+
+def build_manifest(bucket, prefix, force=False):
+    """Construit le manifeste de tous les TIFs du préfixe (les entrées à ETag inchangé sont réutilisées)"""
+    manifest_key = prefix + constantes.MANIFEST_FILENAME
+    previous = {} if force else load_existing_manifest(bucket, manifest_key)
+
+    # Un opener pour tous les TIFs : compteurs d'octets et de requêtes cumulés
+    opener = s3_range_opener(s3_client, bucket, max_blocks=2)
+    entries = []
+    reused = 0
+    for obj in drop_migrated_sources(list_tif_objects(bucket, prefix), prefix):
+        old_entry = previous.get(obj['Key'])
+        if old_entry and old_entry.get("etag") == obj['ETag'].strip('"'):
+            entries.append(old_entry)
+            reused += 1
+            continue
+        print(f"Lecture des métadonnées de {obj['Key']}...")
+        entry = build_manifest_entry(bucket, obj, opener)
+        if entry:
+            entries.append(entry)
+
+    print(f"{len(entries)} entrées dans le manifeste ({reused} réutilisées, "
+          f"{opener.bytes_fetched / 2**20:.1f} Mo d'en-têtes lus en {opener.requests} requêtes)")
+    return {
+        "version": MANIFEST_VERSION,
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "bucket": bucket,
+        "prefix": prefix,
+        "objects": sorted(entries, key=lambda item: (item["forest"], item["year"])),
+    }
+
+def publish_manifest(manifest, bucket, key):
+    """Publie le manifeste JSON dans S3"""
+    try:
+        s3_client.put_object(
+            Bucket=bucket,
+            Key=key,
+            Body=json.dumps(manifest, ensure_ascii=False).encode('utf-8'),
+            ContentType='application/json'
+        )
+        print(f"Manifeste publié avec succès: {key}")
+        return True
+    except Exception as e:
+        print(f"Erreur lors de la publication du manifeste: {e}")
+        return False
+
+def main():
+    """Fonction principale"""
+    parser = argparse.ArgumentParser(description='Publie le manifeste des rasters consommé par le dashboard')
+    parser.add_argument('--prefix', default=input_folder, help='Préfixe S3 des rasters (par défaut: Data_hackathon_stat_data_raster/)')
+    parser.add_argument('--force', action='store_true', help='Relit tous les TIFs même si leur ETag est inchangé')
+    parser.add_argument('--output', help='Écrit le manifeste dans un fichier local au lieu de le publier')
+
+    args = parser.parse_args()
+
+    manifest = build_manifest(bucket_name, args.prefix, force=args.force)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        print(f"Manifeste écrit dans {args.output}")
+    else:
+        publish_manifest(manifest, bucket_name, args.prefix + constantes.MANIFEST_FILENAME)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import os
+import sys
+import json
+import argparse
+from datetime import datetime, timezone
+from botocore.exceptions import ClientError
+
+# Réutiliser les règles de nommage et le client S3 du dashboard
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "dashboard")))
+from utils.s3_catalog import extract_forest_name, extract_year, partitioned_key, REDIRECTS_FILENAME
+from utils.s3_client import get_s3_client
+
+# Configuration AWS
+    # Identifiants d'accès à l'API
+    #client_id =
+    # client_secret = remplir
+region_name = 'us-east-1'
+bucket_name = 'hackaton-stat'
+
+# Dossier des rasters consommés par le dashboard
+input_folder = 'Data_hackathon_stat_data_raster/'
+
+# Connexion à S3
+s3_client = get_s3_client(region_name=region_name)
+
+def list_flat_tif_objects(bucket, prefix):
+    """Liste les TIFs rangés directement sous le préfixe (arborescence à plat, hors partitions)"""
+    objects = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter='/'):
+        for obj in page.get('Contents', []):
+            if obj['Key'].lower().endswith('.tif'):
+                objects.append(obj)
+    return objects
+
+def object_etag(bucket, key):
+    """ETag d'un objet, ou None s'il n'existe pas"""
+    try:
+        return s3_client.head_object(Bucket=bucket, Key=key)['ETag'].strip('"')
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        raise
+
+def load_redirects(bucket, key):
+    """Charge l'index de redirection déjà publié (ancienne clé -> nouvelle clé)"""
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+        return json.loads(response['Body'].read()).get("redirects", {})
+    except Exception:
+        return {}
+
+def migrate_object(bucket, prefix, obj, dry_run=False):
+    """
+    Copie un TIF vers forest=<nom>/year=<aaaa>/ (copie côté serveur, sans téléchargement).
+    Retourne la nouvelle clé, ou None si le nom n'est pas reconnu ou si la copie échoue.
+    """
+    key = obj['Key']
+    basename = os.path.basename(key)
+    forest_name = extract_forest_name(basename)
+    year = extract_year(basename)
+    if forest_name is None or year is None:
+        print(f"Nom de fichier non reconnu, ignoré: {key}")
+        return None
+
+    new_key = partitioned_key(prefix, forest_name, year, basename)
+    if object_etag(bucket, new_key) == obj['ETag'].strip('"'):
+        print(f"Déjà migré: {key}")
+        return new_key
+    if dry_run:
+        print(f"[simulation] {key} -> {new_key}")
+        return new_key
+    try:
+        # copy_object suffit pour des objets de moins de 5 Go ; l'ETag est conservé
+        s3_client.copy_object(Bucket=bucket, Key=new_key, CopySource={'Bucket': bucket, 'Key': key})
+        print(f"Copié: {key} -> {new_key}")
+        return new_key
+    except Exception as e:
+        print(f"Erreur lors de la copie de {key}: {e}")
+        return None
+
+def publish_redirects(bucket, prefix, redirects):
+    """Publie l'index de redirection, utilisé par le dashboard pour les manifestes antérieurs à la migration"""
+    key = prefix + REDIRECTS_FILENAME
+    document = {
+        "version": 1,
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "redirects": dict(sorted(redirects.items())),
+    }
+    try:
+        s3_client.put_object(
+            Bucket=bucket,
+            Key=key,
+            Body=json.dumps(document, ensure_ascii=False).encode('utf-8'),
+            ContentType='application/json'
+        )
+        print(f"Index de redirection publié: {key} ({len(redirects)} entrées)")
+        return True
+    except Exception as e:
+        print(f"Erreur lors de la publication de l'index de redirection: {e}")
+        return False
+
+def migrate(bucket, prefix, dry_run=False, delete_source=False):
+    """Migre tous les TIFs à plat du préfixe vers l'arborescence partitionnée forêt/année"""
+    redirects = load_redirects(bucket, prefix + REDIRECTS_FILENAME)
+    objects = list_flat_tif_objects(bucket, prefix)
+    print(f"{len(objects)} TIFs à plat trouvés sous {prefix}")
+
+    migrated = {}
+    for obj in objects:
+        new_key = migrate_object(bucket, prefix, obj, dry_run=dry_run)
+        if new_key:
+            migrated[obj['Key']] = new_key
+    redirects.update(migrated)
+
+    if dry_run:
+        print(f"[simulation] {len(migrated)} objets seraient migrés")
+        return migrated
+    if not publish_redirects(bucket, prefix, redirects):
+        return migrated
+
+    if delete_source:
+        # Une source n'est supprimée que si sa copie existe avec le même contenu
+        for obj in objects:
+            new_key = migrated.get(obj['Key'])
+            if new_key and object_etag(bucket, new_key) == obj['ETag'].strip('"'):
+                s3_client.delete_object(Bucket=bucket, Key=obj['Key'])
+                print(f"Source supprimée: {obj['Key']}")
+    return migrated
+
+def main():
+    """Fonction principale"""
+    parser = argparse.ArgumentParser(description='Range les rasters S3 par forêt et par année (forest=<nom>/year=<aaaa>/)')
+    parser.add_argument('--prefix', default=input_folder, help='Préfixe S3 des rasters (par défaut: Data_hackathon_stat_data_raster/)')
+    parser.add_argument('--dry-run', action='store_true', help='Affiche les copies prévues sans rien modifier')
+    parser.add_argument('--delete-source', action='store_true', help='Supprime les objets à plat une fois leur copie vérifiée')
+
+    args = parser.parse_args()
+    migrate(bucket_name, args.prefix, dry_run=args.dry_run, delete_source=args.delete_source)
+
+if __name__ == "__main__":
+    main()
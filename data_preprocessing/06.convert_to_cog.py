@@ -0,0 +1,145 @@
+import os
+import sys
+import glob
+import tempfile
+import argparse
+import rasterio
+
+# Réutiliser le convertisseur COG, les constantes et le client S3 du dashboard
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "dashboard")))
+import utils.constantes as constantes
+from utils.cog import convert_to_cog, is_cog, benchmark_codecs, BENCHMARK_CODECS
+from utils.scaled_raster import convert_to_scaled, is_scaled, SCALED_PROFILE
+from utils.validity import read_valid_mask
+from utils.s3_client import get_s3_client
+
+# Configuration AWS
+    # Identifiants d'accès à l'API
+    #client_id =
+    # client_secret = remplir
+region_name = 'us-east-1'
+bucket_name = 'hackaton-stat'
+
+# Dossier des rasters consommés par le dashboard
+input_folder = 'Data_hackathon_stat_data_raster/'
+
+def already_converted(src, profile, blocksize=None):
+    """Vrai si le raster ouvert est déjà un COG au profil de stockage demandé"""
+    if not is_cog(src, blocksize):
+        return False
+    return profile != SCALED_PROFILE or is_scaled(src)
+
+def convert_file(path, output_path=None, profile="float32", **cog_options):
+    """Convertit un TIF en COG, en int16 mis à l'échelle si profile vaut scaled_int16"""
+    if profile == SCALED_PROFILE:
+        # Les pixels hors polygone des anciens TIFs (remplis de 0) deviennent un masque interne
+        with rasterio.open(path) as src:
+            valid_mask = read_valid_mask(src)
+        return convert_to_scaled(path, output_path, valid_mask=valid_mask, **cog_options)
+    return convert_to_cog(path, output_path, **cog_options)
+
+def convert_local_folder(folder, output_dir=None, dry_run=False, profile="float32", **cog_options):
+    """Convertit en COG les TIFs d'un dossier local (en place, ou dans output_dir)"""
+    converted = 0
+    for path in sorted(glob.glob(os.path.join(folder, "*.tif"))):
+        output_path = os.path.join(output_dir, os.path.basename(path)) if output_dir else path
+        with rasterio.open(path) as src:
+            if output_path == path and already_converted(src, profile, cog_options.get("blocksize")):
+                print(f"Déjà au format COG: {path}")
+                continue
+        if dry_run:
+            print(f"[simulation] {path} -> {output_path}")
+            continue
+        if convert_file(path, output_path, profile, **cog_options):
+            print(f"Converti: {path} -> {output_path}")
+            converted += 1
+    print(f"{converted} fichiers convertis")
+    return converted
+
+def list_tif_objects(s3_client, bucket, prefix):
+    """Liste les objets .tif sous un préfixe (arborescence à plat et partitions forest=/year=)"""
+    objects = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            if obj['Key'].lower().endswith('.tif'):
+                objects.append(obj)
+    return objects
+
+def convert_s3_prefix(s3_client, bucket, prefix, dry_run=False, profile="float32", **cog_options):
+    """
+    Télécharge chaque TIF du préfixe, le convertit en COG et le republie sous la même clé.
+    Le nouvel ETag invalide les caches du dashboard ; le manifeste doit être reconstruit ensuite.
+    """
+    converted = 0
+    objects = list_tif_objects(s3_client, bucket, prefix)
+    print(f"{len(objects)} TIFs trouvés sous {prefix}")
+    with tempfile.TemporaryDirectory(prefix="cog-s3-") as workdir:
+        for obj in objects:
+            key = obj['Key']
+            local_path = os.path.join(workdir, os.path.basename(key))
+            try:
+                s3_client.download_file(bucket, key, local_path)
+                with rasterio.open(local_path) as src:
+                    if already_converted(src, profile, cog_options.get("blocksize")):
+                        print(f"Déjà au format COG: {key}")
+                        continue
+                if dry_run:
+                    print(f"[simulation] conversion de {key}")
+                    continue
+                if not convert_file(local_path, profile=profile, **cog_options):
+                    continue
+                s3_client.upload_file(local_path, bucket, key, ExtraArgs={'ContentType': 'image/tiff'})
+                print(f"Converti et republié: {key} ({obj['Size']} -> {os.path.getsize(local_path)} octets)")
+                converted += 1
+            except Exception as e:
+                print(f"Erreur lors de la conversion de {key}: {e}")
+            finally:
+                if os.path.exists(local_path):
+                    os.remove(local_path)
+    print(f"{converted} objets convertis")
+    if converted and not dry_run:
+        print("Pensez à reconstruire le manifeste : python 04.build_manifest.py")
+    return converted
+
+def print_benchmark(path, codecs, blocksize=None, level=None):
+    """Affiche taille et vitesse de décodage du raster pour chaque codec"""
+    results = benchmark_codecs(path, codecs=codecs, blocksize=blocksize, level=level)
+    print(f"Benchmark sur {path} (temps : meilleur de 3 essais, octets : lectures par plages comme depuis S3)")
+    print(f"{'codec':<12}{'taille (Mo)':>12}{'écriture':>10}{'lecture':>10}{'affichage':>11}{'fenêtre':>10}"
+          f"{'octets aff. (Mo)':>18}{'octets fen. (Mo)':>18}")
+    for r in results:
+        print(f"{r['codec']:<12}{r['size_bytes'] / 1e6:>12.2f}{r['write_s']:>9.2f}s{r['read_full_s']:>9.3f}s"
+              f"{r['read_display_s']:>10.3f}s{r['read_window_s']:>9.3f}s"
+              f"{r['display_bytes_fetched'] / 1e6:>18.2f}{r['window_bytes_fetched'] / 1e6:>18.2f}")
+    return results
+
+def main():
+    """Fonction principale"""
+    parser = argparse.ArgumentParser(description='Convertit les rasters en Cloud-Optimized GeoTIFF (tuiles, bandes séparées, aperçus internes), en float32 ou en int16 mis à l\'échelle')
+    parser.add_argument('--input-dir', help='Dossier local de TIFs à convertir (par défaut: le préfixe S3)')
+    parser.add_argument('--output-dir', help='Dossier de sortie (par défaut: conversion en place)')
+    parser.add_argument('--prefix', default=input_folder, help='Préfixe S3 des rasters (par défaut: Data_hackathon_stat_data_raster/)')
+    parser.add_argument('--compress', default=constantes.COG_COMPRESS, choices=['DEFLATE', 'ZSTD'], type=str.upper, help='Codec (par défaut: COG_COMPRESS)')
+    parser.add_argument('--blocksize', type=int, default=constantes.COG_BLOCK_SIZE, choices=[256, 512], help='Taille des tuiles internes')
+    parser.add_argument('--profile', default=constantes.RASTER_STORAGE_PROFILE, choices=['float32', SCALED_PROFILE], help='Profil de stockage : float32 (tel quel) ou scaled_int16 (entiers 16 bits mis à l\'échelle)')
+    parser.add_argument('--level', type=int, help='Niveau de compression (zlevel pour DEFLATE, zstd_level pour ZSTD)')
+    parser.add_argument('--dry-run', action='store_true', help='Affiche les conversions prévues sans rien modifier')
+    parser.add_argument('--benchmark', metavar='TIF', help='Compare taille et vitesse de décodage des codecs sur un TIF, sans rien convertir')
+
+    args = parser.parse_args()
+    if args.benchmark:
+        print_benchmark(args.benchmark, BENCHMARK_CODECS, blocksize=args.blocksize, level=args.level)
+        return
+
+    cog_options = {"compress": args.compress, "blocksize": args.blocksize, "level": args.level}
+    if args.input_dir:
+        if args.output_dir:
+            os.makedirs(args.output_dir, exist_ok=True)
+        convert_local_folder(args.input_dir, args.output_dir, dry_run=args.dry_run, profile=args.profile, **cog_options)
+    else:
+        s3_client = get_s3_client(region_name=region_name)
+        convert_s3_prefix(s3_client, bucket_name, args.prefix, dry_run=args.dry_run, profile=args.profile, **cog_options)
+
+if __name__ == "__main__":
+    main()
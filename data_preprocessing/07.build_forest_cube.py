@@ -0,0 +1,160 @@
+import os
+import sys
+import tempfile
+import argparse
+import numpy as np
+from botocore.exceptions import ClientError
+
+# Réutiliser le stockage, le moteur (NDVI, classes) et le format de cube du dashboard
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "dashboard")))
+import utils.constantes as constantes
+from utils.storage import LocalStorage, S3Storage
+from utils.raster_engine import RasterEngine
+from utils.forest_cube import (read_cube_meta, write_cube_year, write_cube_series, series_filename, cube_key,
+                               cube_filename, CUBE_DIRNAME, CUBE_META_FILENAME, CUBE_SERIES_PREFIX, CUBE_VARIABLES)
+from utils.grid_alignment import align
+from utils.s3_client import get_s3_client
+
+# Configuration AWS
+    # Identifiants d'accès à l'API
+    #client_id =
+    # client_secret = remplir
+region_name = 'us-east-1'
+bucket_name = 'hackaton-stat'
+
+# Dossier des rasters consommés par le dashboard
+input_folder = 'Data_hackathon_stat_data_raster/'
+
+# Fichiers d'un cube, cube.json en dernier (publié une fois les données en place)
+CUBE_FILES = [cube_filename(name) for name in CUBE_VARIABLES] + [CUBE_META_FILENAME]
+
+def update_forest_cube(engine, forest_name, cube_dir):
+    """
+    Ajoute au cube local de la forêt les années absentes ou dont le TIF a changé (ETag), projetées
+    sur la grille du cube (grille canonique de la forêt à sa création). Retourne le nombre d'années écrites.
+    """
+    meta = read_cube_meta(cube_dir) or {}
+    sources = meta.get("sources", {})
+    if meta:
+        grid = {"crs": meta["crs"], "transform": meta["transform"], "width": meta["width"], "height": meta["height"]}
+    else:
+        grid = engine.get_forest_grid(forest_name)
+        if grid is None:
+            print("  Aucune année lisible")
+            return 0
+    written = 0
+    # Années dans l'ordre chronologique : les tranches du cube suivent l'ordre d'arrivée
+    for year in sorted(engine.get_available_years(forest_name)):
+        entry = engine.catalog.entry(forest_name, year)
+        if sources.get(str(year)) == entry["etag"]:
+            continue
+        ndvi_matrix, _ = engine.calcul_ndvi(entry["key"])
+        class_map = engine.calcul_class_map(entry["key"])
+        year_grid = engine.get_raster_metadata(forest_name, year)
+        if ndvi_matrix is None or class_map is None or year_grid is None:
+            print(f"  {year}: lecture impossible, année ignorée")
+            continue
+        # Dimensions variables d'une année à l'autre : simple lecture par index vers la grille du cube
+        ndvi_matrix = align(ndvi_matrix, year_grid, grid, fill=np.nan)
+        class_map = align(class_map, year_grid, grid, fill=0)
+        try:
+            write_cube_year(cube_dir, forest_name, year, entry["etag"], ndvi_matrix, class_map, grid)
+        except ValueError as e:
+            print(f"  {year}: {e}")
+            continue
+        print(f"  {year}: ajoutée au cube")
+        written += 1
+    return written
+
+def update_cube_series(cube_dir):
+    """Régénère la copie par pixel du NDVI si elle manque ou ne couvre pas les années du cube. Vrai si réécrite"""
+    meta = read_cube_meta(cube_dir)
+    if meta is None:
+        return False
+    filename = series_filename(meta)
+    if filename and os.path.exists(os.path.join(cube_dir, filename)):
+        return False
+    write_cube_series(cube_dir)
+    print("  Séries par pixel régénérées")
+    return True
+
+def download_cube(s3_client, bucket, prefix, forest_name, cube_dir):
+    """Récupère le cube déjà publié d'une forêt (construction incrémentale), s'il existe"""
+    os.makedirs(cube_dir, exist_ok=True)
+    for filename in CUBE_FILES:
+        try:
+            s3_client.download_file(bucket, cube_key(prefix, forest_name, filename), os.path.join(cube_dir, filename))
+        except ClientError:
+            # Cube absent (ou incomplet) : reconstruction complète
+            for name in CUBE_FILES:
+                path = os.path.join(cube_dir, name)
+                if os.path.exists(path):
+                    os.remove(path)
+            return False
+    # Copie par pixel facultative (cubes publiés avant elle, ou périmée) : régénérée si elle manque
+    filename = series_filename(read_cube_meta(cube_dir))
+    if filename:
+        try:
+            s3_client.download_file(bucket, cube_key(prefix, forest_name, filename), os.path.join(cube_dir, filename))
+        except ClientError:
+            pass
+    return True
+
+def upload_cube(s3_client, bucket, prefix, forest_name, cube_dir, previous_series=None):
+    """
+    Publie le cube d'une forêt sous <préfixe>cubes/<forêt>/, cube.json en dernier. Les copies par pixel
+    remplacées sont supprimées, sauf previous_series : le dashboard peut encore lire l'ancien cube.json (cache).
+    """
+    current_series = series_filename(read_cube_meta(cube_dir))
+    for filename in CUBE_FILES[:-1] + [current_series, CUBE_META_FILENAME]:
+        if filename:
+            s3_client.upload_file(os.path.join(cube_dir, filename), bucket, cube_key(prefix, forest_name, filename))
+    kept = {cube_key(prefix, forest_name, filename) for filename in (current_series, previous_series) if filename}
+    series_prefix = cube_key(prefix, forest_name, CUBE_SERIES_PREFIX)
+    for page in s3_client.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=series_prefix):
+        for obj in page.get('Contents', []):
+            if obj['Key'] not in kept:
+                s3_client.delete_object(Bucket=bucket, Key=obj['Key'])
+    print(f"  Cube publié sous {cube_key(prefix, forest_name, '')}")
+
+def build_local(data_dir, forests=None):
+    """Met à jour les cubes des forêts d'un dossier local de TIFs (dans <data_dir>/cubes/)"""
+    engine = RasterEngine(LocalStorage(data_dir))
+    for forest_name in forests or engine.get_forest_names():
+        print(f"Forêt {forest_name}:")
+        cube_dir = os.path.join(data_dir, CUBE_DIRNAME, forest_name)
+        written = update_forest_cube(engine, forest_name, cube_dir)
+        print(f"  {written} années écrites")
+        update_cube_series(cube_dir)
+
+def build_s3(s3_client, bucket, prefix, forests=None):
+    """Met à jour les cubes publiés sur S3 : téléchargement du cube existant, ajout des années, publication"""
+    storage = S3Storage(s3_client, bucket, prefix, range_reads=constantes.S3_RANGE_READS,
+                        use_manifest=constantes.S3_USE_MANIFEST)
+    engine = RasterEngine(storage)
+    with tempfile.TemporaryDirectory(prefix="cube-") as workdir:
+        for forest_name in forests or engine.get_forest_names():
+            print(f"Forêt {forest_name}:")
+            cube_dir = os.path.join(workdir, forest_name)
+            download_cube(s3_client, bucket, prefix, forest_name, cube_dir)
+            previous_series = series_filename(read_cube_meta(cube_dir))
+            written = update_forest_cube(engine, forest_name, cube_dir)
+            print(f"  {written} années écrites")
+            if update_cube_series(cube_dir) or written:
+                upload_cube(s3_client, bucket, prefix, forest_name, cube_dir, previous_series)
+
+def main():
+    """Fonction principale"""
+    parser = argparse.ArgumentParser(description='Construit (ou complète) le cube multi-années NDVI / classes de chaque forêt')
+    parser.add_argument('--data-dir', help='Dossier local de TIFs (cubes écrits dans <data-dir>/cubes/) ; par défaut: le préfixe S3')
+    parser.add_argument('--prefix', default=input_folder, help='Préfixe S3 des rasters (par défaut: Data_hackathon_stat_data_raster/)')
+    parser.add_argument('--forest', action='append', help='Forêt à traiter (répétable ; par défaut: toutes)')
+
+    args = parser.parse_args()
+    if args.data_dir:
+        build_local(args.data_dir, args.forest)
+    else:
+        build_s3(get_s3_client(region_name=region_name), bucket_name, args.prefix, args.forest)
+
+if __name__ == "__main__":
+    main()
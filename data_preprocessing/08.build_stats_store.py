@@ -0,0 +1,94 @@
+import os
+import sys
+import tempfile
+import argparse
+from botocore.exceptions import ClientError
+
+# Réutiliser le stockage, le moteur (classes, stats) et le format de la base du dashboard
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "dashboard")))
+import utils.constantes as constantes
+from utils.storage import LocalStorage, S3Storage
+from utils.raster_engine import RasterEngine, class_stats_from_counts
+from utils.stats_store import StatsStore, STATS_STORE_FILENAME
+from utils.s3_client import get_s3_client
+
+# Configuration AWS
+    # Identifiants d'accès à l'API
+    #client_id =
+    # client_secret = remplir
+region_name = 'us-east-1'
+bucket_name = 'hackaton-stat'
+
+# Dossier des rasters consommés par le dashboard
+input_folder = 'Data_hackathon_stat_data_raster/'
+
+def update_stats_store(engine, store, forests=None):
+    """
+    Calcule les stats des forêts / années absentes de la base ou dont le TIF a changé (ETag),
+    et retire les années disparues du catalogue. Retourne le nombre d'années écrites ou retirées.
+    """
+    written = 0
+    for forest_name in forests or engine.get_forest_names():
+        print(f"Forêt {forest_name}:")
+        stored = store.sources(forest_name)
+        years = engine.get_available_years(forest_name)
+        for year in sorted(years):
+            entry = engine.catalog.entry(forest_name, year)
+            if stored.get(year) == entry["etag"]:
+                continue
+            counts = engine.calcul_class_counts(entry["key"])
+            stats_df = class_stats_from_counts(counts) if counts is not None else None
+            if stats_df is None or stats_df.empty:
+                print(f"  {year}: stats indisponibles, année ignorée")
+                continue
+            store.put_year(forest_name, year, entry["etag"], stats_df)
+            print(f"  {year}: stats enregistrées")
+            written += 1
+        removed = store.prune(forest_name, years)
+        if removed:
+            print(f"  {removed} années retirées (TIFs supprimés)")
+        written += removed
+    return written
+
+def build_local(data_dir, forests=None):
+    """Met à jour la base <data_dir>/stats.sqlite à partir des TIFs du dossier"""
+    engine = RasterEngine(LocalStorage(data_dir))
+    store = StatsStore(os.path.join(data_dir, STATS_STORE_FILENAME), readonly=False)
+    written = update_stats_store(engine, store, forests)
+    print(f"{written} années mises à jour dans {store.path}")
+
+def build_s3(s3_client, bucket, prefix, forests=None):
+    """Met à jour la base publiée sous <préfixe>stats.sqlite : téléchargement, ajout des années, publication"""
+    storage = S3Storage(s3_client, bucket, prefix, range_reads=constantes.S3_RANGE_READS,
+                        use_manifest=constantes.S3_USE_MANIFEST)
+    engine = RasterEngine(storage)
+    key = prefix + STATS_STORE_FILENAME
+    with tempfile.TemporaryDirectory(prefix="stats-") as workdir:
+        path = os.path.join(workdir, STATS_STORE_FILENAME)
+        try:
+            s3_client.download_file(bucket, key, path)
+        except ClientError:
+            print(f"Base absente ({key}), construction complète")
+        store = StatsStore(path, readonly=False)
+        written = update_stats_store(engine, store, forests)
+        if written:
+            s3_client.upload_file(path, bucket, key)
+            print(f"{written} années mises à jour, base publiée sous {key}")
+        else:
+            print("Base déjà à jour")
+
+def main():
+    """Fonction principale"""
+    parser = argparse.ArgumentParser(description='Construit (ou complète) la base SQLite des stats par forêt / année / classe')
+    parser.add_argument('--data-dir', help='Dossier local de TIFs (base écrite dans <data-dir>/stats.sqlite) ; par défaut: le préfixe S3')
+    parser.add_argument('--prefix', default=input_folder, help='Préfixe S3 des rasters (par défaut: Data_hackathon_stat_data_raster/)')
+    parser.add_argument('--forest', action='append', help='Forêt à traiter (répétable ; par défaut: toutes)')
+
+    args = parser.parse_args()
+    if args.data_dir:
+        build_local(args.data_dir, args.forest)
+    else:
+        build_s3(get_s3_client(region_name=region_name), bucket_name, args.prefix, args.forest)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import os
+import sys
+import tempfile
+import argparse
+
+# Réutiliser le stockage et le pipeline fenêtré (NDVI, classes, stats) du dashboard
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "dashboard")))
+import utils.constantes as constantes
+from utils.storage import LocalStorage, S3Storage
+from utils.raster_engine import RasterEngine
+from utils.windowed import benchmark_workers
+from utils.s3_client import get_s3_client
+
+# Configuration AWS
+    # Identifiants d'accès à l'API
+    #client_id =
+    # client_secret = remplir
+region_name = 'us-east-1'
+bucket_name = 'hackaton-stat'
+
+# Dossier des rasters consommés par le dashboard
+input_folder = 'Data_hackathon_stat_data_raster/'
+
+def largest_entries(engine, count):
+    """Entrées du catalogue des `count` plus gros TIFs (toutes forêts et années confondues)"""
+    entries = [engine.catalog.entry(forest_name, year)
+               for forest_name in engine.get_forest_names() for year in engine.get_available_years(forest_name)]
+    return sorted(entries, key=lambda entry: entry.get("size") or 0, reverse=True)[:count]
+
+def print_benchmark(path, worker_counts, repeat, budget_bytes):
+    """Affiche le temps des stats par classe d'un TIF selon le nombre de threads"""
+    results = benchmark_workers(path, worker_counts, repeat=repeat, budget_bytes=budget_bytes)
+    print(f"{os.path.basename(path)} (temps : meilleur de {repeat} essais)")
+    print(f"{'threads':>8}{'temps':>10}{'accélération':>14}")
+    for r in results:
+        print(f"{r['workers']:>8}{r['seconds']:>9.3f}s{r['speedup']:>13.2f}x")
+    return results
+
+def benchmark_local(data_dir, count, worker_counts, repeat, budget_bytes):
+    engine = RasterEngine(LocalStorage(data_dir))
+    for entry in largest_entries(engine, count):
+        print_benchmark(entry["key"], worker_counts, repeat, budget_bytes)
+
+def benchmark_s3(s3_client, bucket, prefix, count, worker_counts, repeat, budget_bytes):
+    """Télécharge les plus gros TIFs du préfixe dans un dossier temporaire, puis les mesure"""
+    storage = S3Storage(s3_client, bucket, prefix, range_reads=constantes.S3_RANGE_READS,
+                        use_manifest=constantes.S3_USE_MANIFEST)
+    engine = RasterEngine(storage)
+    with tempfile.TemporaryDirectory(prefix="bench-") as workdir:
+        for entry in largest_entries(engine, count):
+            path = os.path.join(workdir, os.path.basename(entry["key"]))
+            print(f"Téléchargement de {entry['key']}...")
+            s3_client.download_file(bucket, entry["key"], path)
+            print_benchmark(path, worker_counts, repeat, budget_bytes)
+            os.remove(path)
+
+def main():
+    """Fonction principale"""
+    parser = argparse.ArgumentParser(description='Mesure le calcul NDVI / classes / stats d\'un raster réparti sur 1 à N threads')
+    parser.add_argument('--data-dir', help='Dossier local de TIFs (par défaut: le préfixe S3)')
+    parser.add_argument('--prefix', default=input_folder, help='Préfixe S3 des rasters (par défaut: Data_hackathon_stat_data_raster/)')
+    parser.add_argument('--largest', type=int, default=3, help='Nombre de TIFs mesurés, les plus gros d\'abord (par défaut: 3)')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count() or 1], help='Nombres de threads comparés')
+    parser.add_argument('--repeat', type=int, default=3, help='Essais par nombre de threads (le meilleur est gardé)')
+    parser.add_argument('--budget-mb', type=float, default=constantes.RASTER_MEMORY_BUDGET_MB, help='Budget mémoire du mode fenêtré (0: sans limite)')
+
+    args = parser.parse_args()
+    worker_counts = sorted(set(args.workers))
+    budget_bytes = int(args.budget_mb * 2**20)
+    if args.data_dir:
+        benchmark_local(args.data_dir, args.largest, worker_counts, args.repeat, budget_bytes)
+    else:
+        benchmark_s3(get_s3_client(region_name=region_name), bucket_name, args.prefix, args.largest,
+                     worker_counts, args.repeat, budget_bytes)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# ====================================================================================
+#
+# ============ Test unitaires du repérage des bandes et de la lecture du NDVI ========
+#
+# les TIFs sont générés en mémoire avec rasterio (MemoryFile)
+# execution : pytest test_bands.py
+# ====================================================================================
+
+import os
+import numpy as np
+from rasterio.io import MemoryFile
+from rasterio.transform import from_origin
+import sys
+# si python ne parviens pas a acceder au dossier dashboard:l'ajouter au path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "dashboard")))
+
+from utils.bands import band_layout, read_ndvi, LEGACY_BAND_INDEXES
+# ====================================================================================
+
+DESCRIPTIONS = ("Rouge (B4) - normalisé", "Vert (B3) - normalisé", "Bleu (B2) - normalisé", "Proche Infrarouge (B8)", "NDVI")
+
+
+def open_memory_tif(data, descriptions=None):
+    memfile = MemoryFile()
+    with memfile.open(driver="GTiff", width=data.shape[2], height=data.shape[1], count=data.shape[0], dtype="float32",
+                      crs="EPSG:32628", transform=from_origin(300000, 1600000, 10, 10)) as dst:
+        dst.write(data)
+        for band_idx, description in enumerate(descriptions or [], start=1):
+            dst.set_band_description(band_idx, description)
+    return memfile.open()
+
+
+def test_layout_follows_band_descriptions():
+    data = np.random.default_rng(0).random((5, 20, 30)).astype(np.float32)
+    data[4] = 0.42  # NDVI stocké (différent du rapport calculé, pour vérifier qu'il est lu tel quel)
+    with open_memory_tif(data, DESCRIPTIONS) as src:
+        layout = band_layout(src)
+        # "Proche Infrarouge" ne doit pas être pris pour la bande rouge
+        assert layout == {"ndvi": 5, "red": 1, "nir": 4, "rgb": (1, 2, 3)}
+        ndvi = read_ndvi(src)
+    assert ndvi.dtype == np.float32 and np.allclose(ndvi, 0.42)
+
+    # sans bande NDVI : calcul à partir du rouge (bande 1) et du NIR (bande 4)
+    with open_memory_tif(data[:4], DESCRIPTIONS[:4]) as src:
+        ndvi = read_ndvi(src)
+    expected = (data[3] - data[0]) / (data[3] + data[0])
+    np.testing.assert_allclose(ndvi, np.clip(expected, -1, 1), rtol=1e-6)
+# ====================================================================================
+
+
+def test_undescribed_bands_keep_legacy_indexes():
+    data = np.random.default_rng(1).random((4, 20, 30)).astype(np.float32)
+    data[:, 0, 0] = 0  # somme nulle -> NDVI 0
+    with open_memory_tif(data) as src:
+        layout = band_layout(src)
+        assert layout["ndvi"] is None
+        assert (layout["red"], layout["nir"], layout["rgb"]) == (LEGACY_BAND_INDEXES["red"], LEGACY_BAND_INDEXES["nir"], LEGACY_BAND_INDEXES["rgb"])
+        ndvi = read_ndvi(src)
+    red, nir = data[2, 1:], data[3, 1:]
+    np.testing.assert_allclose(ndvi[1:], (nir - red) / (nir + red), rtol=1e-6)
+    assert ndvi[0, 0] == 0
@@ -0,0 +1,94 @@
+# ====================================================================================
+#
+# ===================== Test unitaires des caches du data loader =====================
+#
+# les répertoires de cache sont simulés par le package tempfile
+# execution : pytest test_caches.py
+# ====================================================================================
+
+import io
+import os
+import time
+import tempfile
+import numpy as np
+import sys
+# si python ne parviens pas a acceder au dossier dashboard:l'ajouter au path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "dashboard")))
+
+from utils.disk_cache import DiskCache
+from utils.array_cache import ArrayCache
+from utils.memmap_store import MemmapStore
+# ====================================================================================
+
+def test_disk_cache_hit_miss_and_new_version():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = DiskCache(tmpdir, max_bytes=1000)
+        assert cache.get("b", "k.tif", "e1") is None
+        path = cache.put_stream("b", "k.tif", "e1", io.BytesIO(b"x" * 100))
+        assert cache.get("b", "k.tif", "e1") == path
+        assert cache.find("b", "k.tif") == ("e1", path)
+
+        # une nouvelle version remplace l'ancienne
+        cache.put_stream("b", "k.tif", "e2", io.BytesIO(b"y" * 100))
+        assert cache.get("b", "k.tif", "e1") is None
+        assert cache.find("b", "k.tif")[0] == "e2"
+
+        stats = cache.stats()
+        assert stats["hits"] == 1 and stats["misses"] == 2
+        assert stats["bytes_used"] == 100
+# ====================================================================================
+def test_disk_cache_evicts_least_recently_used():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = DiskCache(tmpdir, max_bytes=250)
+        cache.put_stream("b", "a.tif", "e", io.BytesIO(b"a" * 100))
+        time.sleep(0.01)
+        cache.put_stream("b", "b.tif", "e", io.BytesIO(b"b" * 100))
+        time.sleep(0.01)
+        cache.get("b", "a.tif", "e")  # a devient le plus récemment utilisé
+        time.sleep(0.01)
+        cache.put_stream("b", "c.tif", "e", io.BytesIO(b"c" * 100))
+
+        assert cache.get("b", "b.tif", "e") is None
+        assert cache.get("b", "a.tif", "e") is not None
+        assert cache.get("b", "c.tif", "e") is not None
+        assert cache.stats()["evictions"] == 1
+        # un objet plus gros que le budget n'est pas mis en cache
+        assert cache.put_stream("b", "d.tif", "e", io.BytesIO(b"d" * 300)) is None
+# ====================================================================================
+def test_array_cache_computes_once_and_respects_budget():
+    cache = ArrayCache(max_bytes=2 * 800)  # deux tableaux de 100 float64
+    calls = []
+
+    def compute(value):
+        def _compute():
+            calls.append(value)
+            return np.full(100, value, dtype=np.float64), {"profil": value}
+        return _compute
+
+    ndvi, _ = cache.get_or_compute(("k1", "e", "ndvi", 0), compute(1))
+    again, _ = cache.get_or_compute(("k1", "e", "ndvi", 0), compute(1))
+    assert again is ndvi and calls == [1]
+    assert not ndvi.flags.writeable  # valeur partagée en lecture seule
+
+    cache.get_or_compute(("k2", "e", "ndvi", 0), compute(2))
+    cache.get_or_compute(("k3", "e", "ndvi", 0), compute(3))
+    assert cache.get(("k1", "e", "ndvi", 0)) is None  # le plus ancien est évincé
+    assert cache.stats()["bytes_used"] == 1600
+    # un calcul en échec n'est pas mis en cache
+    assert cache.get_or_compute(("k4", "e", "ndvi", 0), lambda: (None, None)) == (None, None)
+    assert cache.get(("k4", "e", "ndvi", 0)) is None
+# ====================================================================================
+def test_memmap_store_publish_load_and_new_version():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        store = MemmapStore(tmpdir)
+        assert store.load("k.tif", "e1", "class-0") == (None, None)
+
+        classes = np.arange(12, dtype=np.uint8).reshape(3, 4)
+        shared, metadata = store.publish("k.tif", "e1", "class-0", classes, {"crs": "EPSG:4326"})
+        assert isinstance(shared, np.memmap) and not shared.flags.writeable
+        assert np.array_equal(shared, classes) and metadata == {"crs": "EPSG:4326"}
+
+        # un nouvel ETag remplace la version précédente
+        store.publish("k.tif", "e2", "class-0", classes + 1)
+        assert store.load("k.tif", "e1", "class-0") == (None, None)
+        assert np.array_equal(store.load("k.tif", "e2", "class-0")[0], classes + 1)
@@ -0,0 +1,64 @@
+# ====================================================================================
+#
+# ============ Test unitaires du format compact des cartes de classes ================
+#
+# les cartes de classes sont simulées avec numpy, le TIF avec rasterio (package tempfile)
+# execution : pytest test_class_codec.py
+# ====================================================================================
+
+import os
+import tempfile
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+import sys
+# si python ne parviens pas a acceder au dossier dashboard:l'ajouter au path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "dashboard")))
+
+from utils.class_codec import encode_class_map, decode_class_map, decode_rows, class_counts
+from utils.storage import LocalStorage
+from utils.raster_engine import RasterEngine, calcul_class_stats, class_stats_from_counts
+# ====================================================================================
+
+
+def test_codecs_round_trip_and_count_from_runs():
+    rng = np.random.default_rng(0)
+    # zones homogènes (forêt), pixels isolés et bordure hors forêt (classe 0)
+    class_map = np.repeat(rng.integers(1, 6, (120, 15)), 10, axis=1).astype(np.uint8)
+    class_map[rng.random(class_map.shape) < 0.05] = 3
+    class_map[:, :20] = 0
+    expected_counts = np.bincount(class_map.ravel(), minlength=6)
+
+    for codec in ("rle", "bitpack3"):
+        encoded, metadata = encode_class_map(class_map, codec)
+        assert metadata["codec"] == codec and encoded.dtype == np.uint8
+        assert np.array_equal(decode_class_map(encoded, metadata), class_map)
+        assert np.array_equal(decode_rows(encoded, metadata, 40, 45), class_map[40:45])
+        assert np.array_equal(class_counts(encoded, metadata, minlength=6)[:6], expected_counts)
+        assert encoded.nbytes < class_map.nbytes / 2
+
+    rle, rle_meta = encode_class_map(class_map, "rle")
+    packed, _ = encode_class_map(class_map, "bitpack3")
+    assert packed.nbytes == class_map.size * 3 // 8
+    assert encode_class_map(class_map, "auto")[0].nbytes == min(rle.nbytes, packed.nbytes)
+    assert rle_meta["runs"] < class_map.size / 5
+# ====================================================================================
+
+
+def test_engine_stats_from_runs_match_decoded_map():
+    data = np.random.default_rng(1).random((4, 40, 50)).astype(np.float32) + 0.01
+    data[:, :, :8] = 0  # bordure hors forêt
+    with tempfile.TemporaryDirectory() as tmp:
+        with rasterio.open(os.path.join(tmp, "Foret_Classee_de_Mbao_01-01-01-02-2020.tif"), "w", driver="GTiff",
+                           count=4, height=40, width=50, dtype="float32", crs="EPSG:32628",
+                           transform=from_origin(300000, 1600000, 10, 10)) as dst:
+            dst.write(data)
+        engine = RasterEngine(LocalStorage(tmp))
+        key = engine.get_file_path("Mbao", 2020)
+
+        class_map = engine.calcul_class_map(key)
+        counts = engine.calcul_class_counts(key)
+        assert 0 in counts and counts[0] == 40 * 8
+        assert class_stats_from_counts(counts).equals(calcul_class_stats(class_map))
+        cached = engine.array_cache.get(engine._array_cache_key(key, "class"))
+        assert cached[0].nbytes < class_map.nbytes  # la carte reste en cache sous forme compacte
@@ -0,0 +1,68 @@
+# ====================================================================================
+#
+# ============ Test unitaires des statistiques par classe (bincount) =================
+#
+# les cartes de classes et NDVI sont simulés avec numpy
+# execution : pytest test_class_stats.py
+# ====================================================================================
+
+import os
+import numpy as np
+import pandas as pd
+import sys
+# si python ne parviens pas a acceder au dossier dashboard:l'ajouter au path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "dashboard")))
+
+import utils.constantes as constantes
+import utils.class_stats as class_stats
+from utils.class_stats import accumulate_class_stats, merge_class_stats, class_summary, stats_frame
+from utils.ndvi_kernel import classify
+from utils.raster_engine import calcul_class_stats, class_stats_from_counts
+# ====================================================================================
+
+
+def simulated_forest(seed, shape=(120, 90)):
+    rng = np.random.default_rng(seed)
+    ndvi = rng.uniform(-0.5, 1, shape).astype(np.float32)
+    ndvi[:, :10] = np.nan  # hors forêt
+    return ndvi, classify(ndvi)
+
+
+def test_bincount_stats_match_the_sorted_unique_version(monkeypatch):
+    monkeypatch.setattr(class_stats, "STATS_CHUNK_PIXELS", 1000)  # plusieurs morceaux
+    ndvi, classes = simulated_forest(0)
+
+    # Ancienne version : np.unique (tri de toute la carte) puis un dictionnaire par classe
+    unique_classes, pixel_counts = np.unique(classes, return_counts=True)
+    counts = dict(zip(unique_classes, pixel_counts))
+    valid_pixels = sum(counts.get(index, 0) for index in constantes.NDVI_CLASSES)
+    expected = pd.DataFrame([{
+        "Classe Index": index, "Classe Label": details["label"], "Pixel Count": counts.get(index, 0),
+        "Surface (ha)": np.round(counts.get(index, 0) * constantes.PIXEL_SURFACE_M2 / 10000, 2),
+        "% Couverture": np.round(counts.get(index, 0) / valid_pixels * 100, 2),
+    } for index, details in constantes.NDVI_CLASSES.items()])
+    assert calcul_class_stats(classes).equals(expected)
+    assert class_stats_from_counts(counts).equals(expected)
+
+    with_ndvi = calcul_class_stats(classes, ndvi)
+    assert with_ndvi[expected.columns].equals(expected)
+    for index in constantes.NDVI_CLASSES:
+        values = ndvi[classes == index].astype(np.float64)
+        row = with_ndvi[with_ndvi["Classe Index"] == index].iloc[0]
+        assert np.isclose(row["NDVI Moyen"], np.round(values.mean(), 4))
+        assert np.isclose(row["NDVI Écart-type"], np.round(values.std(), 4))
+        assert (row["NDVI Min"], row["NDVI Max"]) == (np.round(values.min(), 4), np.round(values.max(), 4))
+# ====================================================================================
+
+
+def test_partial_stats_merge_into_the_whole_image():
+    ndvi, classes = simulated_forest(1)
+    whole = accumulate_class_stats(classes, ndvi)
+    merged = merge_class_stats(accumulate_class_stats(classes[:50], ndvi[:50]),
+                               accumulate_class_stats(classes[50:], ndvi[50:]))
+    np.testing.assert_allclose(merged, whole)
+
+    summary = class_summary(whole)
+    assert summary["pixel_count"][0] == 120 * 10  # pixels NaN : classe 0, sans NDVI
+    assert np.isnan(summary["ndvi_mean"][0]) and np.isnan(summary["ndvi_min"][0])
+    assert stats_frame(accumulate_class_stats(np.zeros((4, 4), dtype=np.uint8))).empty
@@ -0,0 +1,59 @@
+# ====================================================================================
+#
+# ================== Test unitaires de la conversion Cloud-Optimized GeoTIFF =========
+#
+# les TIFs sont générés avec rasterio dans des dossiers du package tempfile
+# execution : pytest test_cog.py
+# ====================================================================================
+
+import os
+import tempfile
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+import sys
+# si python ne parviens pas a acceder au dossier dashboard:l'ajouter au path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "dashboard")))
+
+from utils.cog import write_cog, convert_to_cog, is_cog, overview_factors
+# ====================================================================================
+
+PROFILE = {"driver": "GTiff", "crs": "EPSG:32628", "transform": from_origin(300000, 1600000, 10, 10)}
+
+
+def test_write_cog_is_tiled_band_separate_with_overviews():
+    data = np.random.default_rng(0).random((5, 600, 700)).astype(np.float32)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "foret.tif")
+        profile = dict(PROFILE, count=5, height=600, width=700, dtype="float32", compress="lzw")
+        assert write_cog(data, profile, path, band_descriptions=["R", "G", "B", "NIR", "NDVI"], blocksize=256)
+
+        with rasterio.open(path) as src:
+            assert is_cog(src)
+            assert src.block_shapes[0] == (256, 256)
+            assert src.interleaving.name == "band"
+            assert src.overviews(1) == overview_factors(600, 700, 256) == [2, 4]
+            assert src.tags(ns="IMAGE_STRUCTURE")["PREDICTOR"] == "3"
+            assert src.descriptions == ("R", "G", "B", "NIR", "NDVI")
+            np.testing.assert_array_equal(src.read(), data)  # compression sans perte
+        assert os.listdir(tmp) == ["foret.tif"]  # aucun fichier intermédiaire laissé
+# ====================================================================================
+
+
+def test_convert_strip_tif_in_place():
+    data = np.random.default_rng(1).integers(0, 5000, (3, 520, 300)).astype(np.int16)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "ancien.tif")
+        profile = dict(PROFILE, count=3, height=520, width=300, dtype="int16", nodata=-1, compress="lzw")
+        with rasterio.open(path, "w", **profile) as dst:
+            dst.write(data)
+        with rasterio.open(path) as src:
+            assert not is_cog(src)
+
+        assert convert_to_cog(path, compress="ZSTD", blocksize=512)
+        with rasterio.open(path) as src:
+            assert is_cog(src)
+            assert src.overviews(1) == [2]
+            assert src.nodata == -1
+            assert src.tags(ns="IMAGE_STRUCTURE")["COMPRESSION"] == "ZSTD"
+            np.testing.assert_array_equal(src.read(), data)
@@ -0,0 +1,98 @@
+# ====================================================================================
+#
+# ============ Test unitaires des backends de calcul (numpy / numexpr / numba) =======
+#
+# les bandes et NDVI sont simulés avec numpy ; numexpr et numba sont testés s'ils sont installés
+# execution : pytest test_compute_backend.py
+# ====================================================================================
+
+import os
+import numpy as np
+import pytest
+import sys
+# si python ne parviens pas a acceder au dossier dashboard:l'ajouter au path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "dashboard")))
+
+import utils.compute_backend as compute_backend
+from utils.compute_backend import available_backends, matches_reference, select_backend, set_backend, NUMPY, BACKENDS
+from utils.ndvi_kernel import ndvi_classes_into, _classify_reference
+from utils.class_stats import accumulate_class_stats
+# ====================================================================================
+
+
+def fused_results(seed=0, shape=(300, 257)):
+    rng = np.random.default_rng(seed)
+    red, nir = rng.random((2,) + shape, dtype=np.float32)
+    red[:5] = nir[:5] = 0  # somme nulle : NDVI 0
+    valid = np.ones(shape, dtype=bool)
+    valid[:, :20] = False  # hors forêt
+    ndvi, classes = ndvi_classes_into(red, nir, np.empty(shape, np.float32), np.empty(shape, np.uint8), valid)
+    return ndvi, classes, accumulate_class_stats(classes, ndvi)
+
+
+def test_every_installed_backend_matches_numpy():
+    assert available_backends()[0] == "numpy"
+    reference = fused_results()
+    try:
+        for name in available_backends():
+            assert matches_reference(BACKENDS[name])
+            assert set_backend(name).name == name
+            ndvi, classes, stats = fused_results()
+            assert np.allclose(ndvi, reference[0], atol=1e-6, equal_nan=True)
+            assert np.array_equal(classes, reference[1])
+            assert np.array_equal(classes, _classify_reference(ndvi, np.empty(classes.shape, np.uint8)))
+            np.testing.assert_allclose(stats, reference[2], rtol=1e-6)
+    finally:
+        set_backend(None)
+# ====================================================================================
+
+
+def test_missing_package_falls_back_to_numpy(monkeypatch):
+    monkeypatch.setattr(compute_backend, "numba", None)
+    monkeypatch.setattr(compute_backend, "numexpr", None)
+    assert available_backends() == ["numpy"]
+    assert select_backend("numba") is NUMPY and select_backend("auto") is NUMPY
+    assert select_backend("inconnu") is NUMPY
+# ====================================================================================
+
+
+def check_backend_against_numpy(name):
+    """ Noyaux du backend name comparés à numpy : NDVI, classes, stats par classe et différence. """
+    reference = fused_results(seed=3)
+    bands = np.random.default_rng(4).integers(-10000, 10000, (2, 120, 90), dtype=np.int16)
+    try:
+        backend = set_backend(name)
+        assert backend.name == name
+        ndvi, classes, stats = fused_results(seed=3)
+        assert np.allclose(ndvi, reference[0], atol=1e-6, equal_nan=True)
+        assert np.array_equal(classes, reference[1])
+        np.testing.assert_allclose(stats, reference[2], rtol=1e-6)
+        np.testing.assert_allclose(backend.difference(bands[0], bands[1]), NUMPY.difference(bands[0], bands[1]))
+    finally:
+        set_backend(None)
+
+
+def test_numexpr_backend_matches_numpy():
+    pytest.importorskip("numexpr")
+    check_backend_against_numpy("numexpr")
+
+
+def test_numba_backend_matches_numpy():
+    pytest.importorskip("numba")
+    check_backend_against_numpy("numba")
+# ====================================================================================
+
+
+def test_auto_choice_is_benchmarked_once_and_remembered(monkeypatch, tmp_path):
+    # Deux backends "installés" : sans choix mémorisé, chaque processus referait le micro-benchmark
+    monkeypatch.setattr(compute_backend, "available_backends", lambda: ["numpy", "numexpr"])
+    benchmarks = []
+    monkeypatch.setattr(compute_backend, "benchmark_backends",
+                        lambda: benchmarks.append(1) or [{"backend": "numpy", "seconds": 0.1}])
+    monkeypatch.setattr(compute_backend.constantes, "COMPUTE_BACKEND_CHOICE_FILE", str(tmp_path / "backend.json"))
+    assert select_backend("auto") is NUMPY and select_backend("auto") is NUMPY
+    assert len(benchmarks) == 1
+
+    # Autres versions installées : le choix mémorisé n'est plus valable
+    monkeypatch.setattr(compute_backend, "_installed_versions", lambda: {"numpy": "0"})
+    assert select_backend("auto") is NUMPY and len(benchmarks) == 2
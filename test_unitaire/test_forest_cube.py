@@ -0,0 +1,131 @@
+# ====================================================================================
+#
+# ============ Test unitaires du cube multi-années NDVI / classes par forêt ==========
+#
+# les TIFs et le cube sont générés dans des dossiers du package tempfile
+# execution : pytest test_forest_cube.py
+# ====================================================================================
+
+import os
+import tempfile
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin, xy
+from rasterio.warp import transform as warp_transform
+import sys
+# si python ne parviens pas a acceder au dossier dashboard:l'ajouter au path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "dashboard")))
+
+from utils.storage import LocalStorage
+from utils.raster_engine import RasterEngine
+from utils.forest_cube import (write_cube_year, write_cube_series, open_local_cube, read_cube_meta, series_filename,
+                               ForestCube, CUBE_DIRNAME)
+# ====================================================================================
+
+PROFILE = {"driver": "GTiff", "crs": "EPSG:32628", "transform": from_origin(300000, 1600000, 10, 10)}
+
+
+def write_year(folder, year, seed):
+    """ TIF 4 bandes d'une année : réflectances aléatoires dans un disque, 0 autour (hors forêt). """
+    rows, cols = np.mgrid[:30, :40]
+    inside = (rows - 15) ** 2 + (cols - 20) ** 2 < 12 ** 2
+    data = np.random.default_rng(seed).random((4, 30, 40)).astype(np.float32) + 0.01
+    data[:, ~inside] = 0
+    path = os.path.join(folder, f"Foret_Classee_de_Mbao_01-01-01-02-{year}.tif")
+    with rasterio.open(path, "w", count=4, height=30, width=40, dtype="float32", **PROFILE) as dst:
+        dst.write(data)
+
+
+def add_years(engine, cube_dir, years):
+    for year in years:
+        key = engine.get_file_path("Mbao", year)
+        ndvi, _ = engine.calcul_ndvi(key)
+        write_cube_year(cube_dir, "Mbao", year, engine.catalog.entry("Mbao", year)["etag"],
+                        ndvi, engine.calcul_class_map(key), engine.get_raster_metadata("Mbao", year))
+
+
+def latlon(row, col):
+    x, y = xy(PROFILE["transform"], row, col)
+    lons, lats = warp_transform(PROFILE["crs"], "EPSG:4326", [x], [y])
+    return lats[0], lons[0]
+
+
+def test_cube_serves_year_stats_and_pixel_evolution_like_the_tifs():
+    with tempfile.TemporaryDirectory() as tmp:
+        for seed, year in enumerate((2019, 2020, 2021)):
+            write_year(tmp, year, seed)
+        engine = RasterEngine(LocalStorage(tmp))
+        stats_from_tifs = engine.load_all_year_stats("Mbao")
+        lat, lon = latlon(15, 20)
+        evolution_from_tifs = engine.get_pixel_evolution("Mbao", lat, lon)
+        outside_from_tifs = engine.get_pixel_evolution("Mbao", *latlon(0, 0))
+
+        cube_dir = os.path.join(tmp, CUBE_DIRNAME, "Mbao")
+        add_years(engine, cube_dir, [2021, 2019])
+        assert engine.open_cube("Mbao") is None  # 2020 manquante : cube périmé, les TIFs font foi
+        add_years(engine, cube_dir, [2020])  # année arrivée en retard, ajoutée en fin de fichier
+        cube = engine.open_cube("Mbao")
+        assert cube is not None and cube.years == [2021, 2019, 2020] and cube.shape == (3, 30, 40)
+
+        stats_from_cube = engine.load_all_year_stats("Mbao")
+        assert stats_from_cube.reset_index(drop=True).equals(stats_from_tifs.reset_index(drop=True))
+        evolution_from_cube = engine.get_pixel_evolution("Mbao", lat, lon)
+        assert [year for year, _ in evolution_from_cube] == [2019, 2020, 2021]
+        assert np.allclose([v for _, v in evolution_from_cube], [v for _, v in evolution_from_tifs], atol=5.1e-5)
+        assert np.isnan([v for _, v in engine.get_pixel_evolution("Mbao", *latlon(0, 0))]).all()
+        assert np.isnan([v for _, v in outside_from_tifs]).all()
+# ====================================================================================
+
+
+def test_rewritten_tif_makes_cube_stale_until_its_year_is_replaced():
+    with tempfile.TemporaryDirectory() as tmp:
+        for seed, year in enumerate((2019, 2020)):
+            write_year(tmp, year, seed)
+        engine = RasterEngine(LocalStorage(tmp))
+        cube_dir = os.path.join(tmp, CUBE_DIRNAME, "Mbao")
+        add_years(engine, cube_dir, [2019, 2020])
+        size = os.path.getsize(os.path.join(cube_dir, "ndvi.bin"))
+
+        write_year(tmp, 2019, 7)
+        os.utime(os.path.join(tmp, "Foret_Classee_de_Mbao_01-01-01-02-2019.tif"), ns=(1, 1))
+        engine.refresh_catalog()
+        assert engine.open_cube("Mbao") is None
+        add_years(engine, cube_dir, [2019])  # tranche remplacée en place
+        cube = open_local_cube(cube_dir)
+        assert os.path.getsize(os.path.join(cube_dir, "ndvi.bin")) == size and cube.years == [2019, 2020]
+        assert engine.open_cube("Mbao") is not None
+        key = engine.get_file_path("Mbao", 2019)
+        assert np.array_equal(cube.read("class", [0])[0], engine.calcul_class_map(key))
+# ====================================================================================
+
+
+def test_pixel_series_from_ranges_is_one_read_with_the_per_pixel_copy():
+    with tempfile.TemporaryDirectory() as tmp:
+        for seed, year in enumerate((2019, 2020, 2021)):
+            write_year(tmp, year, seed)
+        engine = RasterEngine(LocalStorage(tmp))
+        cube_dir = os.path.join(tmp, CUBE_DIRNAME, "Mbao")
+        add_years(engine, cube_dir, [2021, 2019, 2020])
+        calls = []
+
+        def read_range(filename, start, end):
+            """ Lecteur par plages (comme sur S3) sur les fichiers du dossier, appels comptés. """
+            calls.append(filename)
+            with open(os.path.join(cube_dir, filename), "rb") as f:
+                f.seek(start)
+                return f.read(end - start)
+
+        local = open_local_cube(cube_dir)
+        stale = ForestCube(read_cube_meta(cube_dir), read_range=read_range)
+        assert stale.pixel_series(15, 20) == local.pixel_series(15, 20)
+        assert len(calls) == 3  # sans copie par pixel : une plage par année
+
+        write_cube_series(cube_dir, band_bytes=1000)  # plusieurs bandes de lignes
+        cube = ForestCube(read_cube_meta(cube_dir), read_range=read_range)
+        calls.clear()
+        for row, col in ((15, 20), (0, 0), (29, 39)):
+            assert np.array_equal(cube.pixel_series(row, col), local.pixel_series(row, col), equal_nan=True)
+        assert calls == [series_filename(cube.meta)] * 3  # une seule plage par pixel
+
+        add_years(engine, cube_dir, [2020])  # tranche réécrite : copie par pixel périmée
+        assert series_filename(read_cube_meta(cube_dir)) is None
@@ -0,0 +1,64 @@
+# ====================================================================================
+#
+# ============ Test unitaires de l'alignement des grilles entre années ===============
+#
+# les grilles et rasters sont simulés avec numpy et rasterio (aucun fichier lu)
+# execution : pytest test_grid_alignment.py
+# ====================================================================================
+
+import os
+import numpy as np
+from rasterio.transform import from_bounds
+from rasterio.warp import reproject, Resampling
+import sys
+# si python ne parviens pas a acceder au dossier dashboard:l'ajouter au path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "dashboard")))
+
+from utils.grid_alignment import canonical_grid, grid_index, align, same_grid
+# ====================================================================================
+
+# Même emprise (polygone de la forêt), dimensions plafonnées différemment selon l'année
+BOUNDS = (-17.30, 14.70, -17.20, 14.76)
+
+
+def grid(width, height, crs="EPSG:4326", bounds=BOUNDS):
+    return {"crs": crs, "transform": from_bounds(*bounds, width, height), "width": width, "height": height}
+
+
+def test_years_with_different_shapes_share_the_finest_canonical_grid():
+    coarse, fine = grid(50, 30), grid(200, 120)
+    canonical = canonical_grid([coarse, fine])
+    assert same_grid(canonical, fine)
+
+    classes = np.random.default_rng(0).integers(1, 6, (30, 50)).astype(np.uint8)
+    aligned = align(classes, coarse, canonical, fill=0)
+    assert aligned.shape == (120, 200)
+    # Chaque pixel coarse couvre exactement 4 x 4 pixels de la grille canonique
+    assert np.array_equal(aligned, np.repeat(np.repeat(classes, 4, axis=0), 4, axis=1))
+    assert align(classes, coarse, coarse) is classes
+
+    # Index calculé une fois par couple de grilles, puis réutilisé ; séparable (2 vecteurs) en même CRS
+    index = grid_index(coarse, canonical)
+    assert grid_index(dict(coarse), dict(canonical)) is index
+    assert index.flat is None and index.nbytes == (120 + 200) * 4
+
+    ndvi = np.random.default_rng(1).random((2, 30, 50)).astype(np.float32)  # bandes conservées
+    shifted = grid(200, 120, bounds=(-17.31, 14.70, -17.21, 14.76))
+    aligned = align(ndvi, coarse, canonical_grid([coarse, shifted]), fill=np.nan)
+    assert aligned.shape[0] == 2 and np.isnan(aligned[:, :, 0]).all() and not np.isnan(aligned[:, :, -1]).any()
+# ====================================================================================
+
+
+def test_alignment_across_crs_matches_nearest_reprojection():
+    source = grid(60, 40, crs="EPSG:32628", bounds=(325000, 1626000, 326200, 1626800))
+    target = grid(80, 50, bounds=(-16.6245, 14.7030, -16.6150, 14.7090))
+    data = np.random.default_rng(2).random((40, 60)).astype(np.float32)
+
+    aligned = align(data, source, target, fill=np.nan)
+    expected = np.full((50, 80), np.nan, dtype=np.float32)
+    reproject(data, expected, src_transform=source["transform"], src_crs=source["crs"],
+              dst_transform=target["transform"], dst_crs=target["crs"], resampling=Resampling.nearest,
+              dst_nodata=np.nan)
+    both = ~np.isnan(aligned) & ~np.isnan(expected)
+    assert both.sum() > 0.5 * aligned.size
+    assert np.mean(aligned[both] == expected[both]) > 0.99
@@ -0,0 +1,125 @@
+# ====================================================================================
+#
+# ============ Test unitaires du noyau fusionné NDVI + classification ================
+#
+# les NDVI sont simulés avec numpy, les TIFs générés en mémoire avec rasterio (MemoryFile)
+# execution : pytest test_ndvi_kernel.py
+# ====================================================================================
+
+import os
+import numpy as np
+from rasterio.io import MemoryFile
+from rasterio.transform import from_origin
+import sys
+# si python ne parviens pas a acceder au dossier dashboard:l'ajouter au path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "dashboard")))
+
+import utils.ndvi_kernel as ndvi_kernel
+from utils.ndvi_kernel import classify, _classify_reference, scaled_ndvi_tables, lookup_into
+from utils.bands import read_ndvi, read_ndvi_classes
+from utils.validity import read_ndvi_with_mask
+from utils.scaled_raster import encode_scaled, read_bands
+# ====================================================================================
+
+# Seuils exacts, bornes, hors plage et NaN
+EDGES = [-1.5, -1, -0.999, 0, 0.2, 0.2000001, 0.3, 0.5, 0.7, 0.70000005, 1, 1.0001, np.nan, np.inf, -np.inf]
+
+
+def test_class_map_is_bit_identical_to_the_per_class_loop(monkeypatch):
+    monkeypatch.setattr(ndvi_kernel, "KERNEL_CHUNK_PIXELS", 1000)  # plusieurs morceaux
+    rng = np.random.default_rng(0)
+    for dtype in (np.float32, np.float64):
+        ndvi = np.concatenate([rng.uniform(-1.2, 1.2, 4985), EDGES]).astype(dtype).reshape(50, 100)
+        expected = _classify_reference(ndvi, np.empty(ndvi.shape, dtype=np.uint8))
+        assert np.array_equal(classify(ndvi), expected)
+
+        valid = rng.random(ndvi.shape) > 0.3
+        assert np.array_equal(classify(ndvi, valid), np.where(valid, expected, 0))
+
+    # Seuils non contigus (trou entre 0.3 et 0.5) : chaque seuil bas est testé
+    classes = {1: {"range": [-1, 0.2]}, 2: {"range": [0.2, 0.3]}, 3: {"range": [0.5, 1]}}
+    monkeypatch.setattr(ndvi_kernel.constantes, "NDVI_CLASSES", classes)
+    ndvi = np.concatenate([rng.uniform(-1.2, 1.2, 985), EDGES]).astype(np.float32)
+    assert np.array_equal(classify(ndvi), _classify_reference(ndvi, np.empty(ndvi.shape, dtype=np.uint8)))
+# ====================================================================================
+
+
+def open_memory_tif(data, dtype, **profile):
+    memfile = MemoryFile()
+    with memfile.open(driver="GTiff", width=data.shape[2], height=data.shape[1], count=data.shape[0], dtype=dtype,
+                      crs="EPSG:32628", transform=from_origin(300000, 1600000, 10, 10), **profile) as dst:
+        dst.write(data)
+    return memfile.open()
+
+
+def test_fused_read_matches_the_historical_ndvi_and_classes(monkeypatch):
+    monkeypatch.setattr(ndvi_kernel, "KERNEL_CHUNK_PIXELS", 700)
+    data = np.random.default_rng(1).random((4, 40, 60)).astype(np.float32)
+    data[2:4, 0, :5] = 0  # somme nulle -> NDVI 0
+    valid = np.random.default_rng(2).random((40, 60)) > 0.2
+
+    # float32 (lu directement dans le tampon) et int16 (converti dans le tampon, rapport sur les valeurs brutes)
+    encoded = encode_scaled(data)[0]
+    for tif in (open_memory_tif(data, "float32"), open_memory_tif(encoded, "int16", nodata=-32768)):
+        with tif as src:
+            red, nir = src.read([3, 4]).astype(np.float32)
+            # Formule historique (plusieurs temporaires pleine taille)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                denominator = nir + red
+                expected = np.where(denominator == 0, 0, (nir - red) / denominator).astype(np.float32)
+            expected = np.clip(expected, -1, 1)
+
+            assert np.array_equal(read_ndvi(src), expected)
+            ndvi, classes = read_ndvi_classes(src, valid_mask=valid)
+        expected[~valid] = np.nan
+        assert np.array_equal(ndvi, expected, equal_nan=True)
+        assert np.array_equal(classes, _classify_reference(expected, np.empty(expected.shape, dtype=np.uint8)))
+# ====================================================================================
+
+
+class ReadRecorder:
+    """ Dataset rasterio dont les tableaux renvoyés par read sont enregistrés. """
+
+    def __init__(self, src, reads):
+        self._src, self._reads = src, reads
+
+    def __getattr__(self, name):
+        return getattr(self._src, name)
+
+    def read(self, *args, **kwargs):
+        self._reads.append(self._src.read(*args, **kwargs))
+        return self._reads[-1]
+
+
+def test_scaled_ndvi_band_is_classified_on_the_stored_integers(monkeypatch):
+    monkeypatch.setattr(ndvi_kernel, "KERNEL_CHUNK_PIXELS", 5000)
+    # Toutes les valeurs int16 (seuils, bornes, hors plage et nodata) : tables identiques au décodage flottant
+    raw = np.arange(1 << 16, dtype=np.uint16).view(np.int16).reshape(256, 256)
+    for scale, offset in ((1e-4, 0.0), (2.5e-5, 0.1)):
+        decoded = raw.astype(np.float32)
+        decoded[raw == -32768] = np.nan
+        decoded = np.clip(decoded * np.float32(scale) + np.float32(offset), -1, 1)
+        ndvi_table, class_table = scaled_ndvi_tables(scale, offset, -32768)
+        assert np.array_equal(lookup_into(raw, ndvi_table, np.empty(raw.shape, dtype=np.float32)), decoded,
+                              equal_nan=True)
+        assert np.array_equal(lookup_into(raw, class_table, np.empty(raw.shape, dtype=np.uint8)),
+                              _classify_reference(decoded, np.empty(raw.shape, dtype=np.uint8)))
+
+    # Raster au profil compact : bande NDVI lue en int16, NDVI et classes identiques au chemin flottant
+    data = np.random.default_rng(3).uniform(-1, 1, (5, 40, 60)).astype(np.float32)
+    data[4, 0, :4] = [0.2, 0.3, np.nan, 0.7]
+    encoded, scales, _, _ = encode_scaled(data, ("B4", "B3", "B2", "B8", "NDVI"))
+    reads = []
+    with MemoryFile() as memfile:
+        with memfile.open(driver="GTiff", width=60, height=40, count=5, dtype="int16", nodata=-32768,
+                          crs="EPSG:32628", transform=from_origin(300000, 1600000, 10, 10)) as dst:
+            dst.write(encoded)
+            dst.scales = scales
+            dst.update_tags(5, QUANTITY="ndvi")
+        with memfile.open() as src:
+            expected = np.clip(read_bands(src, [5])[0], -1, 1)
+            expected_classes = _classify_reference(expected, np.empty(expected.shape, dtype=np.uint8))
+            ndvi, classes, valid = read_ndvi_with_mask(ReadRecorder(src, reads), with_classes=True)
+    assert [band.dtype for band in reads] == [np.int16]  # une lecture, sans conversion flottante de la bande
+    assert np.array_equal(ndvi, expected, equal_nan=True) and np.array_equal(classes, expected_classes)
+    assert not valid[0, 2] and classes[0, 2] == 0
@@ -0,0 +1,48 @@
+# ====================================================================================
+#
+# ==================== Test unitaires du préchargement en arrière-plan ===============
+#
+# les chargements de rasters sont simulés par des fonctions qui enregistrent leur appel
+# execution : pytest test_prefetcher.py
+# ====================================================================================
+
+import os
+import time
+import threading
+import sys
+# si python ne parviens pas a acceder au dossier dashboard:l'ajouter au path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "dashboard")))
+
+from utils.prefetcher import Prefetcher
+# ====================================================================================
+
+def test_prefetch_waits_for_foreground_requests():
+    prefetcher = Prefetcher(max_concurrent=1, max_bytes=1000)
+    done = threading.Event()
+
+    with prefetcher.foreground():
+        assert prefetcher.submit(("k.tif", "ndvi"), 100, done.set)
+        time.sleep(0.1)
+        assert not done.is_set()  # la requête utilisateur est prioritaire
+    assert done.wait(1)
+# ====================================================================================
+def test_prefetch_deduplicates_and_caps_bytes():
+    prefetcher = Prefetcher(max_concurrent=1, max_bytes=250)
+    release = threading.Event()
+
+    with prefetcher.foreground():
+        assert prefetcher.submit("a", 100, release.wait)
+        assert not prefetcher.submit("a", 100, release.wait)   # déjà planifié
+        assert prefetcher.submit("b", 100, release.wait)
+        assert not prefetcher.submit("c", 100, release.wait)   # dépasse le budget
+    release.set()
+    time.sleep(0.1)
+    stats = prefetcher.stats()
+    assert stats["completed"] == 2 and stats["skipped"] == 2 and stats["pending_bytes"] == 0
+# ====================================================================================
+def test_most_accessed_forest():
+    prefetcher = Prefetcher()
+    for forest in ["Mbao", "Bandia", "Bandia"]:
+        prefetcher.record_access(forest)
+    assert prefetcher.most_accessed() == "Bandia"
+    assert prefetcher.most_accessed(exclude="Bandia") == "Mbao"
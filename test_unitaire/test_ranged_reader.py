@@ -0,0 +1,55 @@
+# ====================================================================================
+#
+# ===================== Test unitaires de la lecture par plages ======================
+#
+# l'opener local (local_range_opener) remplace S3 : mêmes lectures par plages, sur disque
+# execution : pytest test_ranged_reader.py
+# ====================================================================================
+
+import os
+import io
+import tempfile
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+import sys
+# si python ne parviens pas a acceder au dossier dashboard:l'ajouter au path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "dashboard")))
+
+from utils.ranged_reader import RangedFile, local_range_opener
+# ====================================================================================
+
+def test_ranged_file_reads_and_coalesces_blocks():
+    payload = bytes(range(256)) * 40  # 10240 octets
+    requests = []
+
+    def fetch_range(start, end):
+        requests.append((start, end))
+        return payload[start:end]
+
+    f = RangedFile(fetch_range, len(payload), block_size=1024)
+    f.seek(1000)
+    assert f.read(3000) == payload[1000:4000]
+    assert requests == [(0, 4096)]  # 4 blocs manquants contigus -> une seule requête
+    f.seek(-10, io.SEEK_END)
+    assert f.read() == payload[-10:]
+    f.seek(2000)
+    f.read(100)
+    assert len(requests) == 2  # bloc déjà en cache
+# ====================================================================================
+def test_range_opener_reads_only_requested_band():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "Foret_Classee_de_Test_01-01-01-02-2022.tif")
+        data = np.random.default_rng(0).random((5, 512, 512)).astype(np.float32)
+        profile = dict(driver="GTiff", width=512, height=512, count=5, dtype="float32",
+                       crs="EPSG:4326", transform=from_origin(0, 0, 1e-4, 1e-4),
+                       tiled=True, blockxsize=256, blockysize=256, interleave="band")
+        with rasterio.open(path, "w", **profile) as dst:
+            dst.write(data)
+
+        opener = local_range_opener(tmpdir, block_size=64 * 1024)
+        with rasterio.open(os.path.basename(path), opener=opener) as src:
+            band = src.read(5)
+
+        assert np.array_equal(band, data[4])
+        assert opener.bytes_fetched < os.path.getsize(path) / 2
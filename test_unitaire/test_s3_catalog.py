@@ -0,0 +1,110 @@
+# ====================================================================================
+#
+# ===================== Test unitaires du catalogue S3 ==============================
+#
+# le listage S3 est simulé par une fonction qui retourne des dicts au format boto3
+# execution : pytest test_s3_catalog.py
+# ====================================================================================
+
+import os
+import sys
+# si python ne parviens pas a acceder au dossier dashboard:l'ajouter au path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "dashboard")))
+
+from utils.s3_catalog import S3Catalog, extract_forest_name, extract_year, manifest_to_objects
+
+PREFIX = "Data_hackathon_stat_data_raster/"
+# ====================================================================================
+
+def fake_listing(calls):
+    def list_objects():
+        calls.append(1)
+        return [
+            {"Key": PREFIX + "Foret_Classee_de_Mbao_01-01-01-02-2020.tif", "ETag": '"a1"', "Size": 10},
+            {"Key": PREFIX + "Foret_Classee_de_Mbao_01-01-01-02-2021.tif", "ETag": '"a2"', "Size": 11},
+            {"Key": PREFIX + "Foret_Classee_de_Richard-Toll_01-01-01-02-2019.tif", "ETag": '"b1"', "Size": 12},
+            {"Key": PREFIX + "readme.md", "ETag": '"c"', "Size": 1},
+        ]
+    return list_objects
+# ====================================================================================
+def test_extract_forest_name_and_year():
+    basename = "Foret_Classee_de_Richard-Toll_01-01-01-02-2020.tif"
+    assert extract_forest_name(basename) == "Richard-Toll"
+    assert extract_year(basename) == 2020
+    assert extract_forest_name("autre.tif") is None
+# ====================================================================================
+def test_catalog_lookups_use_a_single_listing():
+    calls = []
+    catalog = S3Catalog(fake_listing(calls), ttl=None)
+
+    assert catalog.forests() == ["Mbao", "Richard-Toll"]
+    assert catalog.years("Mbao") == [2021, 2020]
+    assert catalog.years() == [2021, 2020, 2019]
+    entry = catalog.entry("Mbao", "2020")
+    assert entry["key"].endswith("Mbao_01-01-01-02-2020.tif")
+    assert entry["etag"] == "a1"
+    assert catalog.entry("Mbao", 2018) is None
+    assert len(calls) == 1
+# ====================================================================================
+def test_catalog_ttl_and_refresh():
+    calls = []
+    catalog = S3Catalog(fake_listing(calls), ttl=0)
+    catalog.forests()
+    catalog.forests()
+    assert len(calls) == 2  # TTL nul: chaque accès relance le listage
+
+    calls.clear()
+    catalog.ttl = None
+    catalog.refresh()
+    catalog.years("Mbao")
+    assert len(calls) == 1
+# ====================================================================================
+def test_catalog_keeps_previous_index_on_listing_error():
+    responses = [fake_listing([])(), None]
+    catalog = S3Catalog(lambda: responses.pop(0), ttl=None)
+    assert catalog.forests() == ["Mbao", "Richard-Toll"]
+    assert catalog.refresh() is False
+    assert catalog.forests() == ["Mbao", "Richard-Toll"]
+# ====================================================================================
+def test_catalog_from_manifest_keeps_raster_metadata():
+    manifest = {
+        "version": 1,
+        "objects": [{
+            "key": PREFIX + "Foret_Classee_de_Mbao_01-01-01-02-2020.tif",
+            "forest": "Mbao", "year": 2020, "etag": "a1", "size": 10,
+            "count": 5, "crs": "EPSG:4326", "transform": [1e-4, 0, 17.0, 0, -1e-4, 14.7],
+            "width": 200, "height": 100,
+        }],
+    }
+    catalog = S3Catalog(lambda: manifest_to_objects(manifest), ttl=None)
+    entry = catalog.entry("Mbao", 2020)
+    assert entry["etag"] == "a1"
+    assert entry["count"] == 5
+    assert entry["width"] == 200 and entry["height"] == 100
+# ====================================================================================
+def test_partitioned_catalog_lists_one_forest_at_a_time():
+    calls = []
+    partitions = {
+        "Mbao": [{"Key": PREFIX + "forest=Mbao/year=2020/Foret_Classee_de_Mbao_01-01-01-02-2020.tif", "ETag": '"a1"', "Size": 10}],
+        "Richard-Toll": [{"Key": PREFIX + "forest=Richard-Toll/year=2019/Foret_Classee_de_Richard-Toll_01-01-01-02-2019.tif", "ETag": '"b1"', "Size": 12}],
+    }
+
+    def list_forest_objects(forest_name):
+        calls.append(forest_name)
+        return partitions[forest_name]
+
+    catalog = S3Catalog(fake_listing(calls), ttl=None, list_forests=lambda: list(partitions),
+                        list_forest_objects=list_forest_objects)
+    assert catalog.forests() == ["Mbao", "Richard-Toll"]
+    assert calls == []  # aucun objet listé pour connaître les forêts
+    assert catalog.years("Mbao") == [2020]
+    assert catalog.entry("Mbao", 2020)["etag"] == "a1"
+    assert calls == ["Mbao"]
+    key = partitions["Richard-Toll"][0]["Key"]
+    assert catalog.entry_for_key(key)["year"] == 2019
+    assert calls == ["Mbao", "Richard-Toll"]
+    assert catalog.entry("Inconnue", 2020) is None
+
+    # arborescence encore à plat : repli sur le listage complet
+    flat = S3Catalog(fake_listing(calls), ttl=None, list_forests=lambda: [])
+    assert flat.forests() == ["Mbao", "Richard-Toll"]
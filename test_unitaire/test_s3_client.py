@@ -0,0 +1,25 @@
+# ====================================================================================
+#
+# ======================= Test unitaires du client S3 partagé ========================
+#
+# aucun appel réseau : seule la configuration du client est vérifiée
+# execution : pytest test_s3_client.py
+# ====================================================================================
+
+import os
+import sys
+# si python ne parviens pas a acceder au dossier dashboard:l'ajouter au path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "dashboard")))
+
+from utils.s3_client import get_s3_client
+# ====================================================================================
+
+def test_client_is_shared_and_tuned():
+    client = get_s3_client(region_name="us-east-1", aws_access_key_id="x", aws_secret_access_key="y")
+    assert get_s3_client(region_name="us-east-1", aws_access_key_id="x", aws_secret_access_key="y") is client
+
+    config = client.meta.config
+    assert config.retries["mode"] == "adaptive"
+    assert config.tcp_keepalive
+    assert config.max_pool_connections >= 10
+    assert config.connect_timeout and config.read_timeout
@@ -0,0 +1,140 @@
+# ====================================================================================
+#
+# ================ Test unitaires du stockage S3 (lectures partielles) ===============
+#
+# un faux client S3 (objets en mémoire, GET avec Range) remplace boto3, le cache disque est dans un tempfile
+# execution : pytest test_s3_storage.py
+# ====================================================================================
+
+import io
+import os
+import json
+import tempfile
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.warp import transform as warp_transform
+import sys
+# si python ne parviens pas a acceder au dossier dashboard:l'ajouter au path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "dashboard")))
+
+from utils.storage import S3Storage
+from utils.disk_cache import DiskCache
+from utils.raster_engine import RasterEngine
+from utils.forest_cube import cube_key, CUBE_META_FILENAME, CUBE_VERSION
+from utils.s3_catalog import partitioned_key, MANIFEST_VERSION
+import utils.constantes as constantes
+# ====================================================================================
+
+BUCKET, PREFIX = "bucket", "rasters/"
+SIZE = 1024
+
+
+class FakeS3Client:
+    """ Objets S3 en mémoire : listage paginé, GET complet ou par plage (Range), clés demandées et octets servis. """
+
+    class exceptions:
+        class NoSuchKey(Exception):
+            pass
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.gets = []
+        self.requested = []
+        self.listings = []
+
+    def get_paginator(self, name):
+        client = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix, Delimiter=None):
+                client.listings.append(Prefix)
+                if Delimiter:
+                    return [{}]
+                return [{"Contents": [{"Key": key, "ETag": f'"etag-{key}"', "Size": len(data)}
+                                      for key, data in sorted(client.objects.items()) if key.startswith(Prefix)]}]
+        return Paginator()
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None, IfNoneMatch=None):
+        self.requested.append(Key)
+        if Key not in self.objects:
+            raise self.exceptions.NoSuchKey(Key)
+        data = self.objects[Key]
+        if Range:
+            start, end = (int(value) for value in Range[len("bytes="):].split("-"))
+            data = data[start:end + 1]
+        self.gets.append((Key, len(data)))
+        return {"Body": io.BytesIO(data), "ETag": f'"etag-{Key}"', "ContentLength": len(data)}
+
+
+def make_cog_like_tif(year):
+    """ TIF tuilé 4 bandes (ordre historique : Rouge en 3, NIR en 4) de SIZE x SIZE pixels. """
+    data = np.random.default_rng(year).random((4, SIZE, SIZE)).astype(np.float32)
+    buffer = io.BytesIO()
+    with rasterio.open(buffer, "w", driver="GTiff", width=SIZE, height=SIZE, count=4, dtype="float32", tiled=True,
+                       blockxsize=256, blockysize=256, crs="EPSG:32628", transform=from_origin(300000, 1600000, 10, 10)) as dst:
+        dst.write(data)
+    return buffer.getvalue(), data
+# ====================================================================================
+
+
+def test_pixel_read_on_a_cold_cache_fetches_only_a_few_ranges():
+    tifs = {year: make_cog_like_tif(year) for year in (2019, 2020)}
+    client = FakeS3Client({f"{PREFIX}Foret_Classee_de_Mbao_01-01-01-02-{year}.tif": data for year, (data, _) in tifs.items()})
+    with tempfile.TemporaryDirectory() as tmp:
+        disk_cache = DiskCache(tmp, 2**30)
+        engine = RasterEngine(S3Storage(client, BUCKET, PREFIX, disk_cache=disk_cache, block_size=64 * 1024, use_manifest=False))
+        row, col = 300, 700
+        (lon,), (lat,) = warp_transform("EPSG:32628", "EPSG:4326", [300000 + col * 10 + 5], [1600000 - row * 10 - 5])
+        series = engine.get_pixel_evolution("Mbao", lat, lon)
+
+        for year, value in series:
+            red, nir = tifs[year][1][[2, 3], row, col]  # bandes Rouge (3) et NIR (4)
+            assert np.isclose(value, (nir - red) / (nir + red))
+        fetched = sum(size for _, size in client.gets)
+        object_size = sum(len(data) for data, _ in tifs.values())
+        assert fetched < object_size / 10  # plages de l'en-tête et des tuiles du pixel, pas les objets entiers
+        assert disk_cache.stats()["bytes_used"] == 0  # rien de téléchargé dans le cache disque
+
+        # Lecture complète (NDVI de l'année) : l'objet est copié dans le cache disque
+        engine.calcul_ndvi(engine.get_file_path("Mbao", 2020))
+        assert 0 < disk_cache.stats()["bytes_used"] == len(tifs[2020][0])
+# ====================================================================================
+
+
+def test_cube_metadata_is_read_once_per_ttl_even_when_the_cube_is_absent():
+    client = FakeS3Client({})
+    storage = S3Storage(client, BUCKET, PREFIX, catalog_ttl=600)
+    meta_key = cube_key(PREFIX, "Mbao", CUBE_META_FILENAME)
+    assert storage.open_cube("Mbao") is None and storage.open_cube("Mbao") is None
+    assert client.requested.count(meta_key) == 1  # absence gardée : pas de GET à chaque rendu
+
+    client.objects[meta_key] = json.dumps({"version": CUBE_VERSION, "years": [2020], "height": 2, "width": 3}).encode()
+    assert storage.open_cube("Mbao") is None  # jusqu'à l'expiration, comme le catalogue
+    storage.catalog_ttl = 0
+    assert storage.open_cube("Mbao").shape == (1, 2, 3)
+    storage.catalog_ttl = 600
+    assert storage.open_cube("Mbao") is not None and storage.open_cube("Mbao") is not None
+    assert client.requested.count(meta_key) == 2
+# ====================================================================================
+
+
+def test_published_manifest_serves_a_partitioned_catalog_without_any_listing():
+    basename = "Foret_Classee_de_Mbao_01-01-01-02-2020.tif"
+    key = partitioned_key(PREFIX, "Mbao", 2020, basename)
+    manifest = {"version": MANIFEST_VERSION, "objects": [
+        {"key": key, "etag": "a1", "size": 10, "crs": "EPSG:32628", "width": 200, "height": 100}]}
+    client = FakeS3Client({key: b"tif", PREFIX + constantes.MANIFEST_FILENAME: json.dumps(manifest).encode()})
+    engine = RasterEngine(S3Storage(client, BUCKET, PREFIX, catalog_ttl=0))
+
+    for _ in range(2):  # chargement puis rafraîchissement à l'expiration du TTL
+        assert engine.get_forest_names() == ["Mbao"]
+        entry = engine.catalog.entry("Mbao", 2020)
+        assert entry["key"] == key and entry["width"] == 200 and entry["crs"] == "EPSG:32628"
+    assert client.listings == []  # ni listage des forêts ni listage d'une partition
+
+    # Sans manifeste seulement : listage des forêts (délimiteur), puis listage complet faute de partitions
+    del client.objects[PREFIX + constantes.MANIFEST_FILENAME]
+    engine.refresh_catalog()
+    assert client.listings == [PREFIX + "forest=", PREFIX]
+    assert engine.catalog.entry("Mbao", 2020)["key"] == key
@@ -0,0 +1,84 @@
+# ====================================================================================
+#
+# ============ Test unitaires du profil de stockage compact (int16 mis à l'échelle) ==
+#
+# les TIFs sont générés avec rasterio dans des dossiers du package tempfile
+# execution : pytest test_scaled_raster.py
+# ====================================================================================
+
+import os
+import tempfile
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+import sys
+# si python ne parviens pas a acceder au dossier dashboard:l'ajouter au path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "dashboard")))
+
+from utils.scaled_raster import convert_to_scaled, is_scaled, read_bands, SCALED_NODATA
+from utils.storage import LocalStorage
+from utils.raster_engine import RasterEngine, classify_ndvi
+# ====================================================================================
+
+DESCRIPTIONS = ("Rouge (B4) - normalisé", "Vert (B3) - normalisé", "Bleu (B2) - normalisé", "Proche Infrarouge (B8)", "NDVI")
+
+
+def write_float_tif(path, seed, height=60, width=80):
+    """ TIF flottant 5 bandes (R, G, B, NIR, NDVI) au format historique de l'ingestion. """
+    data = np.random.default_rng(seed).random((5, height, width)).astype(np.float32) * 0.6
+    data[4] = data[4] * 2 - 0.6
+    data[:, :5, :5] = 0  # pixels hors polygone (mis à 0 par le découpage)
+    with rasterio.open(path, "w", driver="GTiff", width=width, height=height, count=5, dtype="float32",
+                       compress="lzw", crs="EPSG:32628", transform=from_origin(300000, 1600000, 10, 10)) as dst:
+        dst.write(data)
+        for band_idx, description in enumerate(DESCRIPTIONS, start=1):
+            dst.set_band_description(band_idx, description)
+    return data
+
+
+def test_scaled_profile_round_trip_and_halves_size():
+    with tempfile.TemporaryDirectory() as tmp:
+        float_path = os.path.join(tmp, "float.tif")
+        scaled_path = os.path.join(tmp, "scaled.tif")
+        data = write_float_tif(float_path, 0, height=300, width=300)
+        data[1, 10, 10] = np.nan
+        with rasterio.open(float_path, "r+") as dst:
+            dst.write(data)
+        assert convert_to_scaled(float_path, scaled_path)
+
+        with rasterio.open(scaled_path) as src:
+            assert is_scaled(src) and src.dtypes[0] == "int16" and src.nodata == SCALED_NODATA
+            assert src.scales == (1e-4,) * 5 and src.descriptions == DESCRIPTIONS
+            assert src.tags(5)["QUANTITY"] == "ndvi"
+            raw = src.read(1)
+            unscaled = read_bands(src, [1, 2, 3, 4, 5])
+        assert raw.dtype == np.int16
+        assert np.isnan(unscaled[1, 10, 10])  # NaN -> nodata -> NaN
+        valid = ~np.isnan(data)
+        assert np.abs(unscaled[valid] - data[valid]).max() <= 5.1e-5  # arrondi au 1e-4 (+ float32)
+        assert os.path.getsize(scaled_path) < 0.6 * os.path.getsize(float_path)
+# ====================================================================================
+
+
+def test_engine_reads_scaled_rasters_in_integer_domain():
+    with tempfile.TemporaryDirectory() as tmp:
+        float_dir, scaled_dir = os.path.join(tmp, "float"), os.path.join(tmp, "scaled")
+        os.makedirs(float_dir), os.makedirs(scaled_dir)
+        name = "Foret_Classee_de_Mbao_01-01-01-02-2020.tif"
+        write_float_tif(os.path.join(float_dir, name), 1)
+        assert convert_to_scaled(os.path.join(float_dir, name), os.path.join(scaled_dir, name))
+
+        float_engine, scaled_engine = RasterEngine(LocalStorage(float_dir)), RasterEngine(LocalStorage(scaled_dir))
+        ndvi_float, _ = float_engine.calcul_ndvi(float_engine.get_file_path("Mbao", 2020))
+        ndvi_scaled, profile = scaled_engine.calcul_ndvi(scaled_engine.get_file_path("Mbao", 2020))
+        assert profile["dtype"] == "int16"
+        with rasterio.open(os.path.join(float_dir, name)) as src:
+            bright = src.read([3, 4]).sum(axis=0) > 0.1  # la quantification au 1e-4 ne pèse que sur les pixels sombres
+        assert np.abs(ndvi_scaled - ndvi_float)[bright].max() < 1e-3
+        assert ndvi_scaled[0, 0] == 0  # pixels à 0 : pas de division par zéro
+        agreement = np.mean(classify_ndvi(ndvi_scaled) == classify_ndvi(ndvi_float))
+        assert agreement > 0.99  # seuls les pixels à ~1e-4 d'un seuil peuvent changer de classe
+
+        rgb_float, _ = float_engine.read_rgb_bands(float_engine.get_file_path("Mbao", 2020))
+        rgb_scaled, _ = scaled_engine.read_rgb_bands(scaled_engine.get_file_path("Mbao", 2020))
+        assert rgb_scaled.dtype == np.float32 and np.abs(rgb_scaled - rgb_float).max() <= 5.1e-5
@@ -0,0 +1,71 @@
+# ====================================================================================
+#
+# ============= Test unitaires du regroupement des chargements concurrents ============
+#
+# les workers gunicorn sont simulés par deux instances partageant un dossier de verrous
+# execution : pytest test_single_flight.py
+# ====================================================================================
+
+import os
+import time
+import tempfile
+import threading
+import pytest
+import sys
+# si python ne parviens pas a acceder au dossier dashboard:l'ajouter au path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "dashboard")))
+
+from concurrent.futures import ThreadPoolExecutor
+from utils.single_flight import SingleFlight, fcntl
+# ====================================================================================
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+
+    def load():
+        calls.append(1)
+        time.sleep(0.2)
+        return "ndvi"
+
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        results = list(pool.map(lambda _: flight.do(("k.tif", "e1", "ndvi", 0), load), range(6)))
+    assert results == ["ndvi"] * 6
+    assert len(calls) == 1
+    assert flight.stats()["followers"] == 5
+
+    # une erreur est transmise à tous les appels en attente, puis la clé est libérée
+    def fail():
+        time.sleep(0.1)
+        raise ValueError("objet illisible")
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        futures = [pool.submit(flight.do, "k2", fail) for _ in range(3)]
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result()
+    assert flight.do("k2", lambda: "ok") == "ok"
+# ====================================================================================
+@pytest.mark.skipif(fcntl is None, reason="verrous fichiers indisponibles (Windows)")
+def test_file_lock_serializes_workers():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        worker_a, worker_b = SingleFlight(tmpdir), SingleFlight(tmpdir)
+        published = []
+        computed = []
+
+        def load():
+            # comme le magasin memmap : un résultat déjà publié n'est pas recalculé
+            if published:
+                return published[0]
+            computed.append(1)
+            time.sleep(0.2)
+            published.append("classes")
+            return "classes"
+
+        thread = threading.Thread(target=worker_a.do, args=("k.tif", load))
+        thread.start()
+        time.sleep(0.05)
+        assert worker_b.do("k.tif", load) == "classes"
+        thread.join()
+        assert len(computed) == 1
+        assert worker_b.stats()["lock_waits"] > 0
@@ -0,0 +1,80 @@
+# ====================================================================================
+#
+# ============ Test unitaires de la base de stats précalculées (SQLite) ==============
+#
+# les TIFs et la base sont générés dans des dossiers du package tempfile
+# execution : pytest test_stats_store.py
+# ====================================================================================
+
+import os
+import tempfile
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+import sys
+# si python ne parviens pas a acceder au dossier dashboard:l'ajouter au path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "dashboard")))
+
+from utils.storage import LocalStorage
+from utils.raster_engine import RasterEngine
+from utils.stats_store import StatsStore, STATS_STORE_FILENAME
+# ====================================================================================
+
+PROFILE = {"driver": "GTiff", "crs": "EPSG:32628", "transform": from_origin(300000, 1600000, 10, 10)}
+
+
+def tif_path(folder, year):
+    return os.path.join(folder, f"Foret_Classee_de_Mbao_01-01-01-02-{year}.tif")
+
+
+def write_year(folder, year, seed):
+    data = np.random.default_rng(seed).random((4, 30, 40)).astype(np.float32) + 0.01
+    with rasterio.open(tif_path(folder, year), "w", count=4, height=30, width=40, dtype="float32", **PROFILE) as dst:
+        dst.write(data)
+
+
+def build_store(folder):
+    """ Comme data_preprocessing/08.build_stats_store.py : une entrée par forêt / année, clé ETag du TIF. """
+    engine = RasterEngine(LocalStorage(folder))
+    store = StatsStore(os.path.join(folder, STATS_STORE_FILENAME), readonly=False)
+    for year in engine.get_available_years("Mbao"):
+        entry = engine.catalog.entry("Mbao", year)
+        store.put_year("Mbao", year, entry["etag"], engine.get_year_stats("Mbao", year).drop(columns="Year"))
+    return engine.load_all_year_stats("Mbao")
+
+
+def test_stats_are_served_from_the_store_without_reading_rasters():
+    with tempfile.TemporaryDirectory() as tmp:
+        for seed, year in enumerate((2019, 2020, 2021)):
+            write_year(tmp, year, seed)
+        stats_from_tifs = build_store(tmp)
+
+        # TIFs rendus illisibles mais ETag (date de modification, taille) inchangé : la base seule répond
+        for year in (2019, 2020, 2021):
+            path = tif_path(tmp, year)
+            stat = os.stat(path)
+            with open(path, "wb") as f:
+                f.write(b"\0" * stat.st_size)
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+        engine = RasterEngine(LocalStorage(tmp))
+        assert engine.load_all_year_stats("Mbao").equals(stats_from_tifs)
+        stats_2020 = engine.get_year_stats("Mbao", 2020)
+        expected = stats_from_tifs[stats_from_tifs["Year"] == 2020].reset_index(drop=True)
+        assert stats_2020.equals(expected)
+# ====================================================================================
+
+
+def test_rewritten_tif_is_recomputed_and_other_years_come_from_the_store():
+    with tempfile.TemporaryDirectory() as tmp:
+        for seed, year in enumerate((2019, 2020)):
+            write_year(tmp, year, seed)
+        build_store(tmp)
+        write_year(tmp, 2019, 9)
+        os.utime(tif_path(tmp, 2019), ns=(1, 1))
+
+        engine = RasterEngine(LocalStorage(tmp))
+        stats = engine.load_all_year_stats("Mbao")
+        assert list(stats["Year"].unique()) == [2020, 2019]
+        os.remove(os.path.join(tmp, STATS_STORE_FILENAME))
+        assert stats.equals(RasterEngine(LocalStorage(tmp)).load_all_year_stats("Mbao"))
@@ -0,0 +1,69 @@
+# ====================================================================================
+#
+# ============== Test unitaires des stockages et du moteur raster commun =============
+#
+# les TIFs sont générés en mémoire avec rasterio, les dossiers par le package tempfile
+# execution : pytest test_storage.py
+# ====================================================================================
+
+import io
+import os
+import tempfile
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+import sys
+# si python ne parviens pas a acceder au dossier dashboard:l'ajouter au path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "dashboard")))
+
+from utils.storage import LocalStorage, MemoryStorage
+from utils.raster_engine import RasterEngine
+# ====================================================================================
+
+def make_tif(seed, height=40, width=50):
+    """ TIF 4 bandes (R, G, B, NIR) aléatoire, retourné en octets. """
+    data = np.random.default_rng(seed).random((4, height, width)).astype(np.float32)
+    buffer = io.BytesIO()
+    with rasterio.open(buffer, "w", driver="GTiff", width=width, height=height, count=4, dtype="float32",
+                       crs="EPSG:32628", transform=from_origin(300000, 1600000, 10, 10)) as dst:
+        dst.write(data)
+    return buffer.getvalue()
+
+FILES = {f"Foret_Classee_de_Mbao_01-01-01-02-{year}.tif": make_tif(year) for year in (2019, 2020)}
+# ====================================================================================
+
+def test_local_and_memory_storage_give_same_results():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, data in FILES.items():
+            with open(os.path.join(tmpdir, name), "wb") as f:
+                f.write(data)
+        local = RasterEngine(LocalStorage(tmpdir))
+        memory = RasterEngine(MemoryStorage(FILES))
+
+        assert local.get_forest_names() == memory.get_forest_names() == ["Mbao"]
+        assert local.get_available_years("Mbao") == memory.get_available_years("Mbao") == [2020, 2019]
+        assert local.get_file_path("Mbao", 2020) == os.path.join(tmpdir, "Foret_Classee_de_Mbao_01-01-01-02-2020.tif")
+
+        ndvi_local, profile = local.calcul_ndvi(local.get_file_path("Mbao", 2020))
+        ndvi_memory, _ = memory.calcul_ndvi(memory.get_file_path("Mbao", 2020))
+        assert np.array_equal(ndvi_local, ndvi_memory) and profile["count"] == 4
+
+        stats_local = local.load_all_year_stats("Mbao")
+        stats_memory = memory.load_all_year_stats("Mbao")
+        assert stats_local.equals(stats_memory)
+        assert sorted(stats_local["Year"].unique()) == [2019, 2020]
+# ====================================================================================
+def test_local_etag_changes_when_file_is_rewritten():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "Foret_Classee_de_Mbao_01-01-01-02-2020.tif")
+        with open(path, "wb") as f:
+            f.write(FILES["Foret_Classee_de_Mbao_01-01-01-02-2020.tif"])
+        storage = LocalStorage(tmpdir)
+        etag = storage.list_objects()[0]["ETag"]
+
+        with open(path, "wb") as f:
+            f.write(make_tif(7))
+        os.utime(path, ns=(0, 0))
+        assert storage.list_objects()[0]["ETag"] != etag
+        # un dossier absent est signalé comme un listage en échec
+        assert LocalStorage(os.path.join(tmpdir, "absent")).list_objects() is None
@@ -0,0 +1,125 @@
+# ====================================================================================
+#
+# ============ Test unitaires du masque de validité (pixels hors polygone) ===========
+#
+# les TIFs sont générés avec rasterio dans des dossiers du package tempfile
+# execution : pytest test_validity.py
+# ====================================================================================
+
+import os
+import tempfile
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+import sys
+# si python ne parviens pas a acceder au dossier dashboard:l'ajouter au path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "dashboard")))
+
+from utils.cog import write_cog
+from utils.storage import LocalStorage
+from utils.raster_engine import RasterEngine
+from utils.validity import read_valid_mask, pack_mask, unpack_mask
+# ====================================================================================
+
+NAME = "Foret_Classee_de_Mbao_01-01-01-02-2020.tif"
+PROFILE = {"driver": "GTiff", "crs": "EPSG:32628", "transform": from_origin(300000, 1600000, 10, 10)}
+
+
+def forest_data(height=40, width=50):
+    """ 4 bandes aléatoires dans un disque (la forêt), 0 autour (remplissage du découpage sans nodata). """
+    rows, cols = np.mgrid[:height, :width]
+    inside = (rows - height / 2) ** 2 + (cols - width / 2) ** 2 < (height / 2.5) ** 2
+    data = np.random.default_rng(0).random((4, height, width)).astype(np.float32) + 0.01
+    data[:, ~inside] = 0
+    return data, inside
+
+
+def test_zero_filled_pixels_are_never_classified_or_counted():
+    data, inside = forest_data()
+    with tempfile.TemporaryDirectory() as tmp:
+        with rasterio.open(os.path.join(tmp, NAME), "w", count=4, height=40, width=50, dtype="float32", **PROFILE) as dst:
+            dst.write(data)
+        engine = RasterEngine(LocalStorage(tmp))
+        key = engine.get_file_path("Mbao", 2020)
+
+        assert np.array_equal(engine.calcul_valid_mask(key), inside)
+        ndvi, _ = engine.calcul_ndvi(key)
+        assert np.isnan(ndvi[~inside]).all() and not np.isnan(ndvi[inside]).any()
+        class_map = engine.calcul_class_map(key)
+        assert (class_map[~inside] == 0).all() and (class_map[inside] > 0).all()
+        stats = engine.load_all_year_stats("Mbao")
+        assert stats["Pixel Count"].sum() == inside.sum()  # avant : tout le rectangle, dont "Eau" autour
+        assert abs(stats["% Couverture"].sum() - 100) < 0.1
+# ====================================================================================
+
+
+def test_internal_mask_written_at_ingestion_is_used():
+    data, inside = forest_data()
+    data[:, 20, 25] = 0  # pixel nul mais dans le polygone : le masque stocké fait foi
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, NAME)
+        assert write_cog(data, dict(PROFILE, count=4, height=40, width=50), path, blocksize=256, valid_mask=inside)
+        with rasterio.open(path) as src:
+            assert np.array_equal(read_valid_mask(src), inside)
+
+        engine = RasterEngine(LocalStorage(tmp))
+        key = engine.get_file_path("Mbao", 2020)
+        assert engine.calcul_class_map(key)[20, 25] == 1  # NDVI 0 -> "Eau", pixel bien compté
+        rgb, _ = engine.read_rgb_bands(key)
+        assert (rgb[~inside] == 0).all()
+
+    assert np.array_equal(unpack_mask(pack_mask(inside), inside.shape[1]), inside)
+    assert pack_mask(inside).nbytes == 40 * 7  # 8 pixels par octet
+# ====================================================================================
+
+
+class CountingDataset:
+    """ Dataset rasterio dont les lectures (bandes, masques) et les ouvertures sont comptées. """
+
+    def __init__(self, src, reads):
+        self._src, self._reads = src, reads
+        reads.append("open")
+
+    def read(self, indexes=None, *args, **kwargs):
+        self._reads.append(("read", indexes))
+        return self._src.read(indexes, *args, **kwargs)
+
+    def read_masks(self, indexes=None, *args, **kwargs):
+        self._reads.append(("read_masks", indexes))
+        return self._src.read_masks(indexes, *args, **kwargs)
+
+    def dataset_mask(self, *args, **kwargs):
+        self._reads.append(("dataset_mask", None))
+        return self._src.dataset_mask(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._src, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._src.close()
+
+
+def test_ndvi_band_alone_gives_ndvi_and_validity_in_one_read():
+    data, inside = forest_data()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ndvi_band = np.where(inside, (data[3] - data[2]) / (data[3] + data[2]), 0).astype(np.float32)
+    with tempfile.TemporaryDirectory() as tmp:
+        with rasterio.open(os.path.join(tmp, NAME), "w", count=5, height=40, width=50, dtype="float32", **PROFILE) as dst:
+            dst.write(np.concatenate([data, ndvi_band[None]]))
+            dst.descriptions = ("B4", "B3", "B2", "B8", "NDVI")
+        storage = LocalStorage(tmp)
+        reads = []
+        open_raster = storage.open_raster
+        storage.open_raster = lambda key, partial=False: CountingDataset(open_raster(key, partial), reads)
+        engine = RasterEngine(storage)
+        key = engine.get_file_path("Mbao", 2020)
+
+        ndvi, _ = engine.calcul_ndvi(key)
+        assert reads == ["open", ("read", [5])]  # ni Rouge ni NIR, ni seconde ouverture pour le masque
+        assert np.isnan(ndvi[~inside]).all() and np.allclose(ndvi[inside], ndvi_band[inside])
+        assert np.array_equal(engine.calcul_valid_mask(key), inside)
+        assert (engine.calcul_class_map(key)[~inside] == 0).all()
+        assert reads == ["open", ("read", [5])]  # masque et classes servis par les caches
@@ -0,0 +1,204 @@
+# ====================================================================================
+#
+# ============ Test unitaires du mode fenêtré à mémoire bornée =======================
+#
+# les TIFs (tuilés, avec une bande hors forêt remplie de 0) sont générés dans un dossier tempfile
+# execution : pytest test_windowed.py
+# ====================================================================================
+
+import os
+import tempfile
+import tracemalloc
+import threading
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.env import get_gdal_config
+import sys
+# si python ne parviens pas a acceder au dossier dashboard:l'ajouter au path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "dashboard")))
+
+import utils.constantes as constantes
+import utils.windowed as windowed
+from utils.windowed import (budget_windows, read_ndvi_windowed, stream_class_stats, WINDOW_BYTES_PER_PIXEL, memory_budget,
+                            split_budget, write_windowed, difference_windows, class_mask_windows, gdal_cache_bytes)
+from utils.ranged_reader import local_range_opener
+from utils.bands import read_ndvi_classes
+from utils.validity import read_valid_mask
+from utils.class_stats import accumulate_class_stats
+from utils.storage import LocalStorage
+from utils.raster_engine import RasterEngine
+# ====================================================================================
+
+HEIGHT, WIDTH = 1000, 600
+BUDGET = 8 * 2**20
+
+
+def write_forest(folder, year=2020):
+    data = np.random.default_rng(year).random((4, HEIGHT, WIDTH)).astype(np.float32)
+    data[:, :, :50] = 0  # hors polygone
+    path = os.path.join(folder, f"Foret_Classee_de_Mbao_01-01-01-02-{year}.tif")
+    with rasterio.open(path, "w", driver="GTiff", count=4, height=HEIGHT, width=WIDTH, dtype="float32", tiled=True,
+                       blockxsize=128, blockysize=128, crs="EPSG:32628", transform=from_origin(300000, 1600000, 10, 10)) as dst:
+        dst.write(data)
+    return path
+
+
+def peak_bytes(func):
+    tracemalloc.start()
+    try:
+        result = func()
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_windows_stay_within_budget_and_match_the_whole_array_path():
+    with tempfile.TemporaryDirectory() as tmp, rasterio.open(write_forest(tmp)) as src:
+        windows = list(budget_windows(src, 2**20))
+        assert sum(window.height for window in windows) == HEIGHT and len(windows) > 1
+        assert all(window.width == WIDTH and window.height * WIDTH * WINDOW_BYTES_PER_PIXEL <= 2**20 for window in windows)
+
+        valid = read_valid_mask(src)
+        ndvi, classes = read_ndvi_classes(src, valid_mask=valid)
+        (ndvi_windowed, classes_windowed), peak = peak_bytes(lambda: read_ndvi_windowed(src, budget_bytes=BUDGET, with_classes=True))
+        assert np.array_equal(ndvi_windowed, ndvi, equal_nan=True) and np.array_equal(classes_windowed, classes)
+        # Mémoire de travail + cache de blocs GDAL (hors tracemalloc, borné par GDAL_CACHEMAX) + sorties
+        assert peak + gdal_cache_bytes(BUDGET) <= BUDGET + ndvi.nbytes + classes.nbytes
+
+        stats, peak = peak_bytes(lambda: stream_class_stats(src, budget_bytes=BUDGET))
+        assert np.array_equal(stats, accumulate_class_stats(classes, ndvi), equal_nan=True)
+        assert peak + gdal_cache_bytes(BUDGET) <= BUDGET < ndvi.nbytes * 4  # l'image entière ne tiendrait pas dans le budget
+# ====================================================================================
+
+
+def test_engine_windowed_mode_gives_the_same_results(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmp:
+        write_forest(tmp)
+        results = []
+        for budget_mb in (0, BUDGET / 2**20):
+            monkeypatch.setattr(constantes, "RASTER_MEMORY_BUDGET_MB", budget_mb)
+            engine = RasterEngine(LocalStorage(tmp))
+            key = engine.get_file_path("Mbao", 2020)
+            # Stats d'abord (flux sans image entière en mode fenêtré), puis NDVI, classes et RGB
+            results.append((engine.get_year_stats("Mbao", 2020), engine.calcul_class_ndvi_stats(key),
+                            engine.calcul_ndvi(key)[0], engine.calcul_class_map(key),
+                            engine.read_rgb_bands(key, max_size=1000)[0]))
+        (stats_df, stats, ndvi, classes, rgb), windowed = results
+        assert stats_df.equals(windowed[0])
+        assert np.array_equal(stats, windowed[1], equal_nan=True)
+        assert np.array_equal(ndvi, windowed[2], equal_nan=True) and np.array_equal(classes, windowed[3])
+        assert np.array_equal(rgb, windowed[4])
+# ====================================================================================
+
+
+def test_tiles_processed_by_a_thread_pool_give_the_same_results():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_forest(tmp)
+        opened = []
+
+        def open_src():
+            # Un dataset par thread : rasterio ne doit pas partager un dataset entre threads
+            opened.append(threading.get_ident())
+            return rasterio.open(path)
+
+        with rasterio.open(path) as src:
+            ndvi, classes = read_ndvi_windowed(src, budget_bytes=BUDGET, with_classes=True)
+            stats = stream_class_stats(src, budget_bytes=BUDGET)
+            parallel = read_ndvi_windowed(src, budget_bytes=0, with_classes=True, open_src=open_src, workers=3)
+            # Au plus un dataset ouvert par thread du pool
+            assert 1 < len(opened) <= 3 and len(set(opened)) == len(opened)
+            parallel_stats = stream_class_stats(src, budget_bytes=0, open_src=open_src, workers=3)
+        assert np.array_equal(parallel[0], ndvi, equal_nan=True) and np.array_equal(parallel[1], classes)
+        # Stats partielles par fenêtre fusionnées dans l'ordre : mêmes sommes qu'en un seul thread
+        assert np.array_equal(parallel_stats, stats, equal_nan=True)
+# ====================================================================================
+
+
+def test_evolution_rasters_are_streamed_from_ranges_to_a_file_within_the_budget(monkeypatch):
+    monkeypatch.setattr(constantes, "RASTER_MEMORY_BUDGET_MB", 2)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = [write_forest(tmp, year) for year in (2019, 2020)]
+        window_budget, max_blocks = split_budget(memory_budget(), block_size=64 * 1024)
+        # Sources lues par plages (comme sur S3 dans 02.evolution.py et 03.evolution_class.py), cache de blocs borné
+        opener = local_range_opener(tmp, block_size=64 * 1024, max_blocks=max_blocks)
+        with rasterio.open(os.path.basename(paths[0]), opener=opener) as raster1, \
+                rasterio.open(os.path.basename(paths[1]), opener=opener) as raster2:
+            profile = dict(raster1.profile, count=1, compress="lzw")
+            output, peak = peak_bytes(lambda: write_windowed(raster1, os.path.join(tmp, "diff.tif"), profile,
+                                                             difference_windows(raster1, raster2), window_budget))
+            # Cache de blocs GDAL compris (GDAL_CACHEMAX fixé par write_windowed dans sa part du budget)
+            assert peak + gdal_cache_bytes(window_budget) <= memory_budget() < HEIGHT * WIDTH * 8  # la différence float64 entière ne tiendrait pas
+            with rasterio.open(output) as dst, rasterio.open(paths[0]) as full1, rasterio.open(paths[1]) as full2:
+                assert np.array_equal(dst.read(1), (full2.read(1).astype(float) - full1.read(1).astype(float)).astype(np.float32))
+
+            classes = (raster1.read(1) * 4).astype(np.float32)  # bande 1 utilisée comme carte de classes (0 à 3)
+            with rasterio.open(os.path.join(tmp, "classes.tif"), "w", **dict(profile, dtype="float32")) as dst:
+                dst.write(classes, 1)
+            with rasterio.open("classes.tif", opener=opener) as class_raster:
+                output, peak = peak_bytes(lambda: write_windowed(class_raster, os.path.join(tmp, "mask.tif"), profile,
+                                                                 class_mask_windows(class_raster, raster2, 2, -9999), window_budget))
+            assert peak + gdal_cache_bytes(window_budget) <= memory_budget()
+            with rasterio.open(output) as dst:
+                assert np.array_equal(dst.read(1), np.where(classes == 2, raster2.read(1), -9999))
+# ====================================================================================
+
+
+def test_gdal_block_cache_and_threads_are_kept_inside_the_budget(monkeypatch, capsys):
+    caches = []
+    read_ndvi_with_mask = windowed.read_ndvi_with_mask
+
+    def recording_read(*args, **kwargs):
+        caches.append(get_gdal_config("GDAL_CACHEMAX"))
+        return read_ndvi_with_mask(*args, **kwargs)
+
+    monkeypatch.setattr(windowed, "read_ndvi_with_mask", recording_read)
+    default_cache = get_gdal_config("GDAL_CACHEMAX")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_forest(tmp)
+        with rasterio.open(path) as src:
+            stats = stream_class_stats(src, budget_bytes=BUDGET)
+            assert caches and set(caches) == {gdal_cache_bytes(BUDGET)} and gdal_cache_bytes(BUDGET) < default_cache
+            assert get_gdal_config("GDAL_CACHEMAX") == default_cache  # rétabli après la lecture
+
+            # Threads réduits à ce que le budget permet ; sous une fenêtre minimale, avertissement
+            assert windowed._tile_windows(src, BUDGET, 8)[1] == 1
+            assert windowed._tile_windows(src, 0, 8)[1] == 8
+            assert capsys.readouterr().out == ""
+            parallel = stream_class_stats(src, budget_bytes=2**20, open_src=lambda: rasterio.open(path), workers=4)
+            assert "Avertissement" in capsys.readouterr().out
+        assert np.array_equal(parallel, stats, equal_nan=True)
+# ====================================================================================
+
+
+def test_concurrent_years_share_the_budget_and_the_cores(monkeypatch):
+    monkeypatch.setattr(constantes, "RASTER_MEMORY_BUDGET_MB", 2 * BUDGET / 2**20)
+    monkeypatch.setattr(constantes, "YEAR_PIPELINE_CPU_WORKERS", 2)
+    monkeypatch.setattr(constantes, "RASTER_WORKERS", 8)
+    monkeypatch.setattr(windowed.os, "cpu_count", lambda: 4)
+    # 2 années x 2 threads : pas plus de threads que de cœurs, chaque raster a la moitié du budget
+    assert windowed.raster_budget() == BUDGET and windowed.raster_workers() == 2
+    monkeypatch.setattr(windowed.os, "cpu_count", lambda: 1)
+    assert windowed.raster_workers() == 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = [write_forest(tmp, year) for year in (2019, 2020)]
+        results = {}
+
+        def compute(path):
+            with rasterio.open(path) as src:
+                results[path] = stream_class_stats(src)  # budget par défaut : raster_budget()
+
+        def both_years():
+            threads = [threading.Thread(target=compute, args=(path,)) for path in paths]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        _, peak = peak_bytes(both_years)
+        # Les deux années en même temps, caches de blocs GDAL compris, tiennent dans le budget du processus
+        assert peak + gdal_cache_bytes(windowed.raster_budget()) <= memory_budget()
+        for path in paths:
+            with rasterio.open(path) as src:
+                assert np.array_equal(results[path], stream_class_stats(src, budget_bytes=0), equal_nan=True)
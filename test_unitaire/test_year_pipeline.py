@@ -0,0 +1,52 @@
+# ====================================================================================
+#
+# ============ Test unitaires du chargement concurrent des stats annuelles ============
+#
+# les téléchargements et calculs sont simulés par des fonctions qui attendent
+# execution : pytest test_year_pipeline.py
+# ====================================================================================
+
+import os
+import time
+import sys
+# si python ne parviens pas a acceder au dossier dashboard:l'ajouter au path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "dashboard")))
+
+from utils.year_pipeline import run_year_pipeline
+# ====================================================================================
+
+def test_pipeline_keeps_order_and_reports_errors():
+    def fetch(year):
+        if year == 2018:
+            raise ValueError("Erreur: Fichier TIF non trouvé.")
+        time.sleep(0.01 * (2024 - year))  # les années récentes arrivent en premier
+        return year * 10
+
+    def compute(year, fetched):
+        if year == 2020:
+            raise ValueError("Stats vides après classification.")
+        return fetched + 1
+
+    results = run_year_pipeline([2023, 2020, 2019, 2018], fetch, compute)
+    assert results == [
+        (2023, 20231, None),
+        (2020, None, "Stats vides après classification."),
+        (2019, 20191, None),
+        (2018, None, "Erreur: Fichier TIF non trouvé."),
+    ]
+# ====================================================================================
+def test_pipeline_overlaps_years():
+    def fetch(year):
+        time.sleep(0.2)
+        return year
+
+    def compute(year, fetched):
+        time.sleep(0.1)
+        return fetched
+
+    start = time.perf_counter()
+    results = run_year_pipeline(list(range(2016, 2024)), fetch, compute, io_workers=8, cpu_workers=8)
+    elapsed = time.perf_counter() - start
+    assert [year for year, _, _ in results] == list(range(2016, 2024))
+    # en séquentiel : 8 * 0.3 s ; en pipeline : environ la durée de l'année la plus lente
+    assert elapsed < 1.0